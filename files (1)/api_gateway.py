@@ -1,22 +1,43 @@
+import os
 from fastapi import FastAPI, WebSocket, Request
-import joblib
 import pandas as pd
+import redis.asyncio as aioredis
+from model_registry import get_registry, warm_symbols_from_env
+from feature_store import get_feature_store
+from tick_hub import TickHub, parse_symbols
 
 app = FastAPI()
+registry = get_registry()
+features = get_feature_store()
+async_redis = aioredis.Redis(host=os.environ.get("REDIS_HOST", "localhost"))
+tick_hub = TickHub()
+
+@app.on_event("startup")
+def warm_models():
+    registry.warmup(warm_symbols_from_env())
+
+@app.on_event("startup")
+async def start_tick_hub():
+    tick_hub.start_redis(async_redis, "ticks")
 
 @app.get("/signal/{symbol}")
 def get_signal(symbol: str):
-    df = pd.read_csv(f"data/{symbol}_latest.csv")
-    model = joblib.load(f"models/{symbol}_best.pkl")
-    signal = model.predict(df.tail(1))[0]
+    df = features.latest_frame(symbol)
+    model = registry.get_model(symbol)
+    signal = model.predict(df)[0]
     return {"signal": signal}
 
 @app.websocket("/ws/ticks")
-async def ticks_ws(websocket: WebSocket):
-    await websocket.accept()
-    # Forward ticks from Redis or other broker
-    while True:
-        tick = await fetch_tick_somewhere()
-        await websocket.send_json(tick)
+async def ticks_ws(websocket: WebSocket, symbols: str = "*", format: str = "json"):
+    # Ticks published on the Redis "ticks" channel, fanned out by the shared hub
+    await tick_hub.serve(websocket, parse_symbols(symbols), format)
+
+@app.get("/ws/ticks/stats")
+def ticks_ws_stats():
+    return tick_hub.get_stats()
+
+@app.get("/models/stats")
+def model_stats():
+    return registry.get_stats()
 
 # Add endpoints for dashboard analytics, event publishing, strategy submission!
\ No newline at end of file
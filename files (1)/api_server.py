@@ -1,12 +1,63 @@
-from fastapi import FastAPI
-import joblib
+import os
+from fastapi import FastAPI, HTTPException
 import pandas as pd
+from model_registry import get_registry, warm_symbols_from_env
+from micro_batcher import MicroBatcher
+
+DEFAULT_SYMBOL = "btcusd"
 
 app = FastAPI()
+registry = get_registry()
+
+class ModelNotFound(Exception):
+    pass
+
+def predict_rows(symbol, rows):
+    # One vectorized predict call for all rows of a symbol
+    model = registry.get_model(symbol)
+    if model is None:
+        raise ModelNotFound(f"No model for {symbol}")
+    return pd.Series(model.predict(pd.DataFrame(rows))).tolist()
+
+# Concurrent /predict calls within the window share one predict call per model
+batcher = MicroBatcher(predict_rows,
+                       window_ms=float(os.environ.get("PREDICT_BATCH_WINDOW_MS", 5)),
+                       max_batch=int(os.environ.get("PREDICT_MAX_BATCH", 256)))
+
+@app.on_event("startup")
+def warm_models():
+    registry.warmup(warm_symbols_from_env() or [DEFAULT_SYMBOL])
 
 @app.post("/predict")
-def predict(payload: dict):
-    df = pd.DataFrame([payload["features"]])
-    model = joblib.load("./models/btcusd_best.pkl")
-    signal = model.predict(df)[0]
-    return {"signal": signal}
\ No newline at end of file
+async def predict(payload: dict):
+    features = payload["features"]
+    try:
+        signal = await batcher.submit(payload.get("symbol", DEFAULT_SYMBOL), features)
+    except ModelNotFound as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    return {"signal": signal}
+
+@app.post("/predict/batch")
+def predict_batch(payload: dict):
+    # {"items": [{"symbol": ..., "features": {...}}, ...]} or {"symbol": ..., "rows": [{...}, ...]};
+    # signals come back in request order, with one predict call per symbol
+    items = payload.get("items")
+    if items is None:
+        symbol = payload.get("symbol", DEFAULT_SYMBOL)
+        items = [{"symbol": symbol, "features": row} for row in payload["rows"]]
+    by_symbol = {}
+    for i, item in enumerate(items):
+        by_symbol.setdefault(item.get("symbol", DEFAULT_SYMBOL), []).append(i)
+    signals = [None] * len(items)
+    for symbol, idx in by_symbol.items():
+        try:
+            out = predict_rows(symbol, [items[i]["features"] for i in idx])
+        except ModelNotFound as e:
+            raise HTTPException(status_code=404, detail=e.args[0])
+        for i, s in zip(idx, out):
+            signals[i] = s
+    return {"signals": signals}
+
+@app.get("/predict/stats")
+def predict_stats():
+    return batcher.get_stats()
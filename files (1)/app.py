@@ -1,10 +1,11 @@
 import streamlit as st
 import pandas as pd
+import os
 import datetime
 
 # === Modular imports ===
 from portfolio import PortfolioManager
-from signals import compute_rsi, compute_sma, compute_macd
+from indicators import IndicatorEngine
 from sentiment import news_with_sentiment
 from backtest import backtest_strategy
 from strategy import rule_builder_ui, evaluate_rules
@@ -13,7 +14,7 @@ from historical_learning import HistoricalLearner
 from strategy_adaptive import SymbolStrategies
 from meta_learner import MetaLearner
 from ml_strategy_optimizer import MLStrategyOptimizer
-from ensemble import StrategyEnsemble
+from ensemble import StrategyEnsemble, vectorized
 from data_streamer import MarketDataStreamer
 from regime_detect import regime_detection, is_risk_on
 from explainable_ai import explain_signal
@@ -21,9 +22,10 @@ from user_profiles import UserProfileManager
 from broker_api import get_broker
 from viz_dashboard import show_heatmap, show_equity_curve, show_scatter
 from event_sentiment import news_with_sentiment, event_driven_signal
-from scheduler import Scheduler
+from scheduler import get_scheduler
 from notifications import notify_trade, notify_alert
 from data_sources import get_source
+from metrics_exporter import start_exporter
 
 st.set_page_config(layout="wide", page_title="Pro AI Trading Assistant Suite")
 
@@ -44,7 +46,13 @@ api_credentials = st.secrets.get("api_credentials", {
     "binance_key": "YOUR_BINANCE_KEY",
     "binance_secret": "YOUR_BINANCE_SECRET"
 })
-broker_api = get_broker(broker_type, api_credentials)
+# One client per broker/credentials per server, not per rerun: each holds a
+# session pool and an order thread pool
+@st.cache_resource
+def cached_broker(broker_type, credentials):
+    return get_broker(broker_type, dict(credentials))
+
+broker_api = cached_broker(broker_type, tuple(sorted(dict(api_credentials).items())))
 data_source = get_source(provider)
 
 portfolio_mgr = PortfolioManager()
@@ -52,7 +60,7 @@ strategy_mgr = SymbolStrategies()
 meta_learner = MetaLearner()
 learner = HistoricalLearner()
 optimizer = MLStrategyOptimizer()
-scheduler = Scheduler()
+scheduler = get_scheduler()  # one per process, survives Streamlit reruns
 
 # === Main Navigation ===
 tabs = st.tabs([
@@ -83,6 +91,14 @@ end_date = st.sidebar.date_input("End date", datetime.datetime.now())
 watchlist = st.sidebar.multiselect("Watchlist", all_tickers, default=[symbol], key="watchlist")
 interval = st.sidebar.selectbox("Interval", ["1d", "1h", "5m"], index=0)
 
+# Exposes explanation cache metrics; started once per Streamlit server, not per rerun
+@st.cache_resource
+def metrics_endpoint():
+    start_exporter(int(os.environ.get("METRICS_PORT", 9101)))
+    return True
+
+metrics_endpoint()
+
 # Helper for fetching historical data with caching
 @st.cache_data
 def fetch_history_cached(symbol, start_date, end_date, provider, interval):
@@ -94,14 +110,20 @@ def fetch_history_cached(symbol, start_date, end_date, provider, interval):
         df = pd.DataFrame()
     return df
 
+# Indicators are computed once per fetched frame instead of on every rerun
+@st.cache_data
+def compute_indicators_cached(close):
+    return IndicatorEngine(sma_period=20).frame(close)
+
 # === Trade Tab ===
 with tabs[0]:
     st.header("Trade")
     df = fetch_history_cached(symbol, start_date, end_date, provider, interval)
     if not df.empty:
-        df["RSI"] = compute_rsi(df["Close"])
-        df["SMA_20"] = compute_sma(df["Close"])
-        df["MACD"] = compute_macd(df["Close"])
+        ind = compute_indicators_cached(df["Close"])
+        df["RSI"] = ind["RSI"]
+        df["SMA_20"] = ind["SMA_20"]
+        df["MACD"] = ind["MACD"]
         st.line_chart(df["Close"])
         st.dataframe(df.tail(15))
         qty = st.number_input("Order qty", min_value=1.0, value=1.0)
@@ -140,7 +162,7 @@ with tabs[1]:
         signal = evaluate_rules(df, rules)
         indicators = df.iloc[-1][["RSI", "SMA_20", "MACD"]].to_dict()
         st.write(f"Signal: {signal}")
-        explanation = explain_signal(signal, indicators)
+        explanation = explain_signal(signal, indicators, wait=False)
         st.write(f"Why? {explanation}")
 
 # === Meta-Learning ===
@@ -165,7 +187,9 @@ with tabs[3]:
 with tabs[4]:
     st.header("Strategy Ensemble")
     if not df.empty and optimizer.top_strategies:
-        strat_funcs = [lambda d: optimizer.strategy_func(d, optimizer.top_strategies[-1]["params"])]
+        params = optimizer.top_strategies[-1]["params"]
+        strat_funcs = [vectorized(lambda d: optimizer.strategy_signals(d, params),
+                                  lambda d: optimizer.strategy_func(d, params))]
         ensemble = StrategyEnsemble(strat_funcs)
         vote = ensemble.predict(df)
         st.write(f"Ensemble vote: {vote}")
@@ -174,7 +198,7 @@ with tabs[4]:
 with tabs[5]:
     st.header("Market Regime Detection")
     if not df.empty:
-        df_reg = regime_detection(df)
+        df_reg = regime_detection(df, symbol=symbol)
         st.line_chart(df_reg["vol"])
         st.dataframe(df_reg[["regime"]].tail(20))
         st.success(f"Current regime: {is_risk_on(df_reg)}")
@@ -225,11 +249,19 @@ with tabs[10]:
         st.success(f"Connected to broker: {broker_type}" if ok else "Failed to connect.")
     st.write("Trade via Broker (demo):")
     broker_qty = st.number_input("Broker Qty", min_value=1.0, value=1.0)
-    broker_price = st.number_input("Broker Price", min_value=0.0, value=1.0)
+    order_type = st.selectbox("Order Type", ["Market", "Limit"])
+    # Only a limit order carries a price; any price turns buy()/sell() into a limit
+    broker_price = st.number_input("Limit Price", min_value=0.0, value=1.0) if order_type == "Limit" else None
     if st.button("Broker Buy"):
-        broker_api.buy(symbol, broker_qty, price=broker_price)
+        if broker_price is None:
+            broker_api.buy(symbol, broker_qty)
+        else:
+            broker_api.limit(symbol, broker_qty, "buy", broker_price)
     if st.button("Broker Sell"):
-        broker_api.sell(symbol, broker_qty, price=broker_price)
+        if broker_price is None:
+            broker_api.sell(symbol, broker_qty)
+        else:
+            broker_api.limit(symbol, broker_qty, "sell", broker_price)
 
 # === Alerts Tab ===
 with tabs[11]:
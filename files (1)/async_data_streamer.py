@@ -1,14 +1,258 @@
 import asyncio
+import inspect
+import logging
+from collections import deque
 import websockets
 import json
+from async_utils import Backoff, BackgroundLoop
 
-async def stream_binance(symbol):
-    uri = f"wss://stream.binance.com:9443/ws/{symbol.lower()}@trade"
-    async with websockets.connect(uri) as ws:
+# Ticks flow through the pipeline in one shape: {'s': symbol, 'p': price, 'v': volume, 't': ms}
+
+def parse_finnhub(raw):
+    msg = json.loads(raw)
+    if msg.get('type') != 'trade':
+        return []
+    return [{'s': d['s'], 'p': float(d['p']), 'v': float(d.get('v', 0)), 't': d['t']} for d in msg.get('data', [])]
+
+def parse_binance(raw):
+    msg = json.loads(raw)
+    d = msg.get('data', msg)  # combined stream wraps the event
+    if d.get('e') != 'trade':
+        return []
+    return [{'s': d['s'], 'p': float(d['p']), 'v': float(d['q']), 't': d['T']}]
+
+PROVIDERS = {
+    'finnhub': {
+        'url': lambda symbols, api_key: f"wss://ws.finnhub.io?token={api_key}",
+        'subscribe': lambda symbols: [{'type': 'subscribe', 'symbol': s} for s in symbols],
+        'parse': parse_finnhub,
+    },
+    'binance': {
+        'url': lambda symbols, api_key: "wss://stream.binance.com:9443/stream?streams="
+                                        + "/".join(f"{s.lower()}@trade" for s in symbols),
+        'subscribe': lambda symbols: [],
+        'parse': parse_binance,
+    },
+}
+
+class BoundedTickQueue:
+    # Single-loop bounded queue. When full: 'coalesce' overwrites the pending tick
+    # of the same symbol (else drops the oldest), 'drop_oldest' / 'drop_newest' drop.
+    # 'latest' always overwrites a pending tick of the same symbol, full or not, so
+    # a consumer that falls behind only ever sees the newest tick per symbol.
+    def __init__(self, maxsize=10_000, policy='coalesce'):
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = deque()
+        self._pending = {}
+        self._ready = asyncio.Event()
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, tick):
+        sym = tick.get('s')
+        if self.policy == 'latest' and sym in self._pending:
+            self._pending[sym][0] = tick
+            self.coalesced += 1
+            return
+        if len(self._items) >= self.maxsize:
+            if self.policy == 'coalesce' and sym in self._pending:
+                self._pending[sym][0] = tick
+                self.coalesced += 1
+                return
+            self.dropped += 1
+            if self.policy == 'drop_newest':
+                return
+            old = self._items.popleft()
+            if self._pending.get(old[1]) is old:
+                del self._pending[old[1]]
+        entry = [tick, sym]
+        self._items.append(entry)
+        self._pending[sym] = entry
+        self._ready.set()
+
+    async def get(self):
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        entry = self._items.popleft()
+        if self._pending.get(entry[1]) is entry:
+            del self._pending[entry[1]]
+        return entry[0]
+
+class Subscription:
+    def __init__(self, name, consumer, maxsize, policy, threaded):
+        self.name = name
+        self.consumer = consumer
+        self.maxsize = maxsize
+        self.policy = policy
+        self.threaded = threaded
+        self.queue = None
+        self.delivered = 0
+        self.errors = 0
+
+class TickPipeline(BackgroundLoop):
+    # One event loop for all providers/symbols. Sources reconnect with jittered
+    # exponential backoff and feed a bounded queue; a dispatcher fans each tick out
+    # to every subscriber's own bounded queue so a slow consumer only loses (or
+    # coalesces) its own ticks.
+    def __init__(self, maxsize=10_000, policy='coalesce', backoff=(0.5, 30.0)):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.backoff = backoff
+        self._sources = []
+        self._subs = []
+        self._queue = None
+        self._tasks = []
+        self.stats = {"received": 0, "reconnects": 0, "connected": 0}
+
+    def add_source(self, provider, symbols, api_key=None, url=None):
+        spec = PROVIDERS[provider]
+        self._sources.append({
+            'provider': provider,
+            'url': url or spec['url'](symbols, api_key),
+            'subscribe': spec['subscribe'](symbols),
+            'parse': spec['parse'],
+        })
+
+    def subscribe(self, consumer, name=None, maxsize=1000, policy='coalesce', threaded=False):
+        # threaded=True runs a blocking consumer (Redis, DB) in a worker thread
+        sub = Subscription(name or getattr(consumer, '__name__', repr(consumer)), consumer, maxsize, policy, threaded)
+        self._subs.append(sub)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._start_consumer, sub)
+        return sub
+
+    def publish(self, tick):
+        # Loop thread only; other threads use publish_threadsafe
+        self.stats['received'] += 1
+        self._queue.put(tick)
+
+    def publish_threadsafe(self, tick):
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            raise RuntimeError("TickPipeline is not running; start() it before publishing")
+        loop.call_soon_threadsafe(self.publish, tick)
+
+    def _start_consumer(self, sub):
+        sub.queue = BoundedTickQueue(sub.maxsize, sub.policy)
+        self._tasks.append(asyncio.ensure_future(self._consume(sub)))
+
+    async def _source(self, src):
+        backoff = Backoff(*self.backoff)
+        while True:
+            try:
+                async with websockets.connect(src['url']) as ws:
+                    for msg in src['subscribe']:
+                        await ws.send(json.dumps(msg))
+                    self.stats['connected'] += 1
+                    backoff.reset()
+                    async for raw in ws:
+                        for tick in src['parse'](raw):
+                            self.publish(tick)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"{src['provider']} stream error: {e}")
+            self.stats['reconnects'] += 1
+            await backoff.sleep()
+
+    async def _dispatch(self):
         while True:
-            msg = await ws.recv()
-            tick = json.loads(msg)
-            # Process tick data, publish to queue/db/handler...
-            print(tick)
+            tick = await self._queue.get()
+            for sub in self._subs:
+                if sub.queue is not None:
+                    sub.queue.put(tick)
+
+    async def _consume(self, sub):
+        while True:
+            tick = await sub.queue.get()
+            try:
+                if sub.threaded:
+                    await asyncio.to_thread(sub.consumer, tick)
+                else:
+                    result = sub.consumer(tick)
+                    if inspect.isawaitable(result):
+                        await result
+                sub.delivered += 1
+            except Exception as e:
+                sub.errors += 1
+                logging.error(f"Tick consumer {sub.name} failed: {e}")
+
+    def _start_tasks(self):
+        # Consumers subscribed later append to the same list, so run() cancels them too
+        self._queue = BoundedTickQueue(self.maxsize, self.policy)
+        self._tasks = [asyncio.ensure_future(self._source(src)) for src in self._sources]
+        self._tasks.append(asyncio.ensure_future(self._dispatch()))
+        for sub in self._subs:
+            self._start_consumer(sub)
+        return self._tasks
+
+    def get_stats(self):
+        out = dict(self.stats)
+        if self._queue is not None:
+            out.update(queued=len(self._queue), dropped=self._queue.dropped, coalesced=self._queue.coalesced)
+        out['subscribers'] = {s.name: {"delivered": s.delivered, "errors": s.errors,
+                                       "queued": len(s.queue) if s.queue else 0,
+                                       "dropped": s.queue.dropped if s.queue else 0,
+                                       "coalesced": s.queue.coalesced if s.queue else 0} for s in self._subs}
+        return out
+
+# --- consumer adapters ---
+def db_writer_consumer(writer):
+    # writer: db_timescale.TickWriter (write() only appends to its buffer)
+    def consume(tick):
+        writer.write(tick['s'], tick['t'], tick['p'], tick['v'])
+    return consume
+
+def redis_consumer(redis_client, channel='ticks'):
+    # Publishes on the channel the /ws/ticks hub subscribes to; subscribe with threaded=True
+    def consume(tick):
+        redis_client.publish(channel, json.dumps(tick))
+    return consume
+
+def indicator_consumer(engines, factory):
+    # engines: symbol -> indicators.IndicatorEngine, created with factory() on first tick
+    def consume(tick):
+        engine = engines.get(tick['s'])
+        if engine is None:
+            engine = engines[tick['s']] = factory()
+        engine.update(tick['p'])
+    return consume
+
+# --- local replay server standing in for Finnhub/Binance ---
+async def serve_replay(messages, host='127.0.0.1', port=0, interval=0.0, close_after=True, first_frame_timeout=1.0):
+    # messages are raw provider payloads (str or dict); returns the websockets server.
+    # Like the real feeds, nothing is sent before the client's first frame (its
+    # subscribe); clients that never send one (Binance streams are chosen in the
+    # URL) get the replay after first_frame_timeout.
+    async def handler(ws, *args):
+        try:
+            await asyncio.wait_for(ws.recv(), first_frame_timeout)
+        except asyncio.TimeoutError:
+            pass
+        for m in messages:
+            await ws.send(m if isinstance(m, str) else json.dumps(m))
+            if interval:
+                await asyncio.sleep(interval)
+        if close_after:
+            await ws.close()
+        else:
+            await ws.wait_closed()
+    return await websockets.serve(handler, host, port)
+
+def replay_url(server):
+    host, port = list(server.sockets)[0].getsockname()[:2]
+    return f"ws://{host}:{port}"
+
+async def stream_binance(symbol, on_tick=None):
+    pipeline = TickPipeline()
+    pipeline.add_source('binance', [symbol])
+    pipeline.subscribe(on_tick or print)
+    await pipeline.run()
 
-asyncio.run(stream_binance("btcusdt"))
\ No newline at end of file
+if __name__ == "__main__":
+    asyncio.run(stream_binance("btcusdt"))
@@ -0,0 +1,62 @@
+import random
+import asyncio
+import threading
+
+class Backoff:
+    # Jittered exponential reconnect delay: base, 2 * base, ... up to cap, each
+    # stretched by up to 20% so clients dropped together do not reconnect together
+    def __init__(self, base=0.5, cap=30.0):
+        self.base = base
+        self.cap = cap
+        self.delay = base
+
+    def reset(self):
+        self.delay = self.base
+
+    async def sleep(self):
+        await asyncio.sleep(self.delay * (1 + random.random() * 0.2))
+        self.delay = min(self.delay * 2, self.cap)
+
+class BackgroundLoop:
+    # Mixin for an async service: run() starts the tasks from _start_tasks() and
+    # keeps them until stop(); start() runs it on its own event loop in a daemon
+    # thread, so sync code (Streamlit, workers) can host it.
+    _loop = None
+    _stop = None
+    _thread = None
+
+    def _start_tasks(self):
+        raise NotImplementedError
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        tasks = self._start_tasks()
+        try:
+            await self._stop.wait()
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._loop = None
+
+    def start(self):
+        ready = threading.Event()
+        def runner():
+            async def main():
+                task = asyncio.ensure_future(self.run())
+                await asyncio.sleep(0)
+                ready.set()
+                await task
+            asyncio.run(main())
+        self._thread = threading.Thread(target=runner, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,14 +1,157 @@
-from concurrent.futures import ProcessPoolExecutor
+import os
+import time
+import math
+import pickle
+import shutil
+import tempfile
+import importlib
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
 from backtest import backtest_strategy
 
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+class SharedPriceData:
+    # Each symbol's OHLCV is written once to a .npy file; workers memory-map it
+    # read-only, so the page cache is shared and nothing is pickled per task.
+    def __init__(self, dfs, columns=None, root=None):
+        self.root = tempfile.mkdtemp(prefix='bt_prices_', dir=root)
+        self.meta = {}
+        for symbol, df in dfs.items():
+            self.add(symbol, df, columns)
+
+    def add(self, symbol, df, columns=None):
+        cols = [c for c in (columns or PRICE_COLUMNS) if c in df.columns]
+        if not cols:
+            cols = list(df.select_dtypes('number').columns)
+        values = df[cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        base = os.path.join(self.root, str(len(self.meta)))
+        np.save(base + '.npy', np.ascontiguousarray(values))
+        meta = {'path': base + '.npy', 'columns': cols, 'index_path': base + '_index.npy', 'tz': None}
+        if isinstance(df.index, pd.DatetimeIndex):
+            meta['index_kind'] = 'datetime'
+            # asi8 is in the index's own unit (pandas 3 defaults to 'us'): store ns
+            # UTC epochs plus the original unit and tz, and rebuild exactly that
+            meta['tz'] = str(df.index.tz) if df.index.tz is not None else None
+            meta['unit'] = df.index.unit
+            np.save(meta['index_path'], df.index.as_unit('ns').asi8)
+        else:
+            meta['index_kind'] = 'values'
+            np.save(meta['index_path'], np.asarray(df.index), allow_pickle=True)
+        self.meta[symbol] = meta
+        return meta
+
+    def close(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --- worker side ---
+_views = {}
+
+def _attach(meta):
+    df = _views.get(meta['path'])
+    if df is None:
+        values = np.load(meta['path'], mmap_mode='r')
+        if meta['index_kind'] == 'datetime':
+            index = pd.DatetimeIndex(np.load(meta['index_path'], mmap_mode='r').view('M8[ns]')).as_unit(meta['unit'])
+            if meta['tz']:
+                index = index.tz_localize('UTC').tz_convert(meta['tz'])
+        else:
+            index = pd.Index(np.load(meta['index_path'], allow_pickle=True))
+        df = _views[meta['path']] = pd.DataFrame(values, index=index, columns=meta['columns'], copy=False)
+    # Shallow copy: columns a strategy adds stay local to the task
+    return df.copy(deep=False)
+
+def resolve_strategy(strategy):
+    if isinstance(strategy, str):
+        module, _, attr = strategy.partition(':')
+        return getattr(importlib.import_module(module), attr)
+    return strategy
+
+def _with_params(strategy, params, data):
+    return strategy(data, params)
+
+def _run_chunk(chunk, submitted_at):
+    out = []
+    for task in chunk:
+        t0 = time.time()
+        df = _attach(task['meta'])
+        t1 = time.time()
+        strategy = resolve_strategy(task['strategy'])
+        func = strategy if task['params'] is None else partial(_with_params, strategy, task['params'])
+        log = stats = error = None
+        try:
+            if task['direct']:
+                log, stats = func(df)
+            else:
+                log, stats = backtest_strategy(df, strategy_func=func)
+        except Exception as e:
+            error = repr(e)
+        t2 = time.time()
+        out.append({
+            "symbol": task['symbol'], "params": task['params'], "log": log, "stats": stats, "error": error,
+            "timing": {"queued_s": t0 - submitted_at, "attach_s": t1 - t0, "run_s": t2 - t1, "pid": os.getpid()},
+        })
+    return out
+
+# --- driver side ---
+def _strategy_ref(strategy):
+    if isinstance(strategy, str):
+        return strategy
+    try:
+        pickle.dumps(strategy)
+    except Exception as e:
+        raise ValueError(f"strategy_func must be picklable (module-level function or 'module:attr'), got {strategy!r}") from e
+    return strategy
+
+def iter_backtests(symbols, dfs, strategy_func, param_sets=None, max_workers=None, chunksize=None, direct=False):
+    # Runs symbols x param_sets across processes and yields each result as soon
+    # as its chunk finishes. direct=True calls strategy_func(df) -> (log, stats)
+    # instead of wrapping it in backtest_strategy.
+    strategy = _strategy_ref(strategy_func)
+    param_sets = param_sets or [None]
+    max_workers = max_workers or os.cpu_count() or 1
+    with SharedPriceData({sym: dfs[sym] for sym in symbols}) as prices:
+        tasks = [{"symbol": sym, "meta": prices.meta[sym], "strategy": strategy, "params": params, "direct": direct}
+                 for sym in symbols for params in param_sets]
+        if not tasks:
+            return
+        chunksize = chunksize or max(1, math.ceil(len(tasks) / (max_workers * 4)))
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(_run_chunk, tasks[i:i + chunksize], time.time())
+                       for i in range(0, len(tasks), chunksize)]
+            for fut in as_completed(futures):
+                for result in fut.result():
+                    yield result
+
+def summarize_timings(results):
+    runs = [r['timing']['run_s'] for r in results]
+    if not runs:
+        return {}
+    return {
+        "tasks": len(runs),
+        "workers": len({r['timing']['pid'] for r in results}),
+        "run_s_total": float(np.sum(runs)),
+        "run_s_p50": float(np.percentile(runs, 50)),
+        "run_s_max": float(np.max(runs)),
+        "attach_s_total": float(np.sum([r['timing']['attach_s'] for r in results])),
+        "queued_s_max": float(np.max([r['timing']['queued_s'] for r in results])),
+        "errors": sum(1 for r in results if r['error']),
+    }
+
 def run_backtest(symbol, df, strategy_func):
     log, stats = backtest_strategy(df, strategy_func)
     return symbol, log, stats
 
-def batch_backtest(symbols, dfs, strategy_func):
-    with ProcessPoolExecutor() as pool:
-        results = pool.map(
-            lambda args: run_backtest(*args),
-            [(symbol, dfs[symbol], strategy_func) for symbol in symbols]
-        )
-    return dict(results)
\ No newline at end of file
+def batch_backtest(symbols, dfs, strategy_func, max_workers=None):
+    results = {}
+    for r in iter_backtests(symbols, dfs, strategy_func, max_workers=max_workers):
+        results[r['symbol']] = (r['log'], r['stats'])
+    return results
@@ -1,22 +1,19 @@
-from concurrent.futures import ProcessPoolExecutor
-from apscheduler.schedulers.background import BackgroundScheduler
 from backtest import backtest_strategy
+from backtest_mp import iter_backtests
+from scheduler import get_scheduler
 
 def run_backtest(symbol, df, strategy_func):
     log, stats = backtest_strategy(df, strategy_func)
     # persist results, send event, etc
     return {"symbol": symbol, "log": log, "stats": stats}
 
-def batch_backtest(symbols, dfs, strategy_func):
-    with ProcessPoolExecutor() as executor:
-        results = list(executor.map(
-            lambda args: run_backtest(*args),
-            [(sym, dfs[sym], strategy_func) for sym in symbols]
-        ))
-    return results
+def batch_backtest(symbols, dfs, strategy_func, max_workers=None):
+    # strategy_func must be picklable (module-level function or 'module:attr')
+    done = {r['symbol']: r for r in iter_backtests(symbols, dfs, strategy_func, max_workers=max_workers)}
+    return [{"symbol": sym, "log": done[sym]['log'], "stats": done[sym]['stats'],
+             "error": done[sym]['error'], "timing": done[sym]['timing']} for sym in symbols]
 
-def schedule_periodic(func, interval_s):
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(func, 'interval', seconds=interval_s)
-    scheduler.start()
-    return scheduler
\ No newline at end of file
+def schedule_periodic(func, interval_s, name=None, **kwargs):
+    # First run one interval from now; job.cancel() stops it
+    return get_scheduler().schedule(name or getattr(func, "__name__", repr(func)), func, interval_s,
+                                    start_in=interval_s, **kwargs)
\ No newline at end of file
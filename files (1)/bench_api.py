@@ -0,0 +1,93 @@
+import time
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from data_sources import make_session
+
+# Load test for the FastAPI server: N concurrent clients hammer the measured
+# endpoints while optional background clients keep slow endpoints (orders,
+# training) busy, then p50/p99 latency per endpoint is printed.
+#   python bench_api.py --url http://127.0.0.1:8000 --clients 64 --requests 5000 \
+#       --background '/alpaca_order={"symbol":"AAPL","qty":1,"side":"buy"}'
+
+DEFAULT_TARGETS = [
+    ("POST", "/store_tick", {"symbol": "AAPL", "ts": 0, "price": 100.0, "volume": 1.0}),
+    ("GET", "/models/stats", None),
+]
+
+def parse_target(spec):
+    # "/path" -> GET, "/path={json}" -> POST with that body
+    path, _, body = spec.partition("=")
+    return ("POST", path, json.loads(body)) if body else ("GET", path, None)
+
+def _call(session, url, method, path, body):
+    t0 = time.perf_counter()
+    try:
+        r = session.request(method, url + path, json=body, timeout=60)
+        ok = r.status_code < 500
+    except Exception:
+        ok = False
+    return time.perf_counter() - t0, ok
+
+def run(url, targets, clients=32, requests_total=2000, background=(), background_clients=4):
+    latencies = {path: [] for _, path, _ in targets}
+    errors = {path: 0 for _, path, _ in targets}
+    lock = threading.Lock()
+    stop = threading.Event()
+    counter = iter(range(requests_total))
+    counter_lock = threading.Lock()
+
+    def client():
+        session = make_session(pool_size=2)
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            method, path, body = targets[i % len(targets)]
+            elapsed, ok = _call(session, url, method, path, body)
+            with lock:
+                latencies[path].append(elapsed)
+                errors[path] += not ok
+
+    def background_client(target):
+        session = make_session(pool_size=2)
+        while not stop.is_set():
+            _call(session, url, *target)
+
+    bg = [threading.Thread(target=background_client, args=(t,), daemon=True)
+          for t in background for _ in range(background_clients)]
+    for t in bg:
+        t.start()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for _ in range(clients):
+            pool.submit(client)
+    wall = time.perf_counter() - t0
+    stop.set()
+    report = {}
+    for path, lat in latencies.items():
+        a = np.array(lat) * 1e3
+        report[path] = {"requests": len(a), "errors": errors[path],
+                        "p50_ms": float(np.percentile(a, 50)) if len(a) else None,
+                        "p99_ms": float(np.percentile(a, 99)) if len(a) else None,
+                        "max_ms": float(a.max()) if len(a) else None}
+    report["_total"] = {"requests": requests_total, "seconds": wall, "rps": requests_total / wall}
+    return report
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--clients", type=int, default=32)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--target", action="append", default=[], help="endpoint to measure: /path or /path={json}")
+    ap.add_argument("--background", action="append", default=[], help="slow endpoint kept busy meanwhile")
+    ap.add_argument("--background-clients", type=int, default=4)
+    args = ap.parse_args()
+    targets = [parse_target(t) for t in args.target] or DEFAULT_TARGETS
+    report = run(args.url, targets, args.clients, args.requests,
+                 [parse_target(t) for t in args.background], args.background_clients)
+    for path, row in report.items():
+        print(f"{path:24s} {row}")
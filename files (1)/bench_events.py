@@ -0,0 +1,71 @@
+import time
+import argparse
+import multiprocessing as mp
+from event_broker import EventBroker
+
+# Messages/sec through each EventBroker transport: one publisher, one
+# subscriber, small tick-sized events. shm publishes from a child process so
+# the number includes the cross-process hop; redis needs a server (--redis
+# host) or fakeredis (--redis fake).
+#   python bench_events.py --messages 200000 --transport inproc --transport shm
+
+EVENT = {"s": "AAPL", "p": 187.25, "v": 100.0, "t": 1700000000000}
+
+def _wait(received, n, timeout):
+    deadline = time.perf_counter() + timeout
+    while received[0] < n and time.perf_counter() < deadline:
+        time.sleep(0.001)
+
+def _shm_publisher(namespace, n, nslots, ready):
+    broker = EventBroker(transport="shm", namespace=namespace, nslots=nslots, slot_size=256)
+    ready.wait()
+    for _ in range(n):
+        broker.publish("bench", EVENT)
+    broker.close()
+
+def bench(transport, n, redis_host=None, nslots=65536, timeout=60):
+    received = [0]
+    def handler(_):
+        received[0] += 1
+    proc = None
+    if transport == "inproc":
+        pub = sub = EventBroker(transport="inproc", maxsize=n)
+    elif transport == "shm":
+        namespace = f"bench{time.time_ns()}"
+        sub = EventBroker(transport="shm", namespace=namespace, nslots=nslots, slot_size=256)
+        ready = mp.Event()
+        proc = mp.Process(target=_shm_publisher, args=(namespace, n, nslots, ready))
+        proc.start()
+    else:
+        kwargs = {}
+        if redis_host == "fake":
+            import fakeredis
+            kwargs["client"] = fakeredis.FakeRedis()
+        pub = sub = EventBroker(redis_host or "localhost", transport="redis", **kwargs)
+    sub.subscribe("bench", handler)
+    time.sleep(0.2)
+    t0 = time.perf_counter()
+    if proc is not None:
+        ready.set()
+        proc.join()
+    else:
+        pub.publish_many("bench", (EVENT for _ in range(n)))
+        pub.flush()
+    _wait(received, n, timeout)
+    wall = time.perf_counter() - t0
+    stats = sub.get_stats()
+    sub.close()
+    if transport == "shm":
+        sub.transport.unlink("bench")
+    return {"messages": n, "received": received[0], "dropped": stats.get("dropped", 0),
+            "seconds": wall, "msgs_per_sec": received[0] / wall}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=100_000)
+    ap.add_argument("--transport", action="append", default=[], choices=["inproc", "shm", "redis"])
+    ap.add_argument("--redis", default=None, help="Redis host, or 'fake' for fakeredis")
+    args = ap.parse_args()
+    transports = args.transport or ["inproc", "shm"] + (["redis"] if args.redis else [])
+    for t in transports:
+        print(f"{t:8s} {bench(t, args.messages, args.redis)}")
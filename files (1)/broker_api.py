@@ -1,43 +1,473 @@
+import hmac
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+import numpy as np
 import requests
+import websockets
+from prometheus_client import Histogram
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+from data_sources import make_session
+from retry_utils import log_retry
+from async_utils import Backoff, BackgroundLoop
 
-class AlpacaAPI:
-    def __init__(self, credentials):
+order_latency = Histogram("broker_order_seconds", "Broker request round-trip time", ["broker", "op"])
+
+class BrokerError(Exception):
+    def __init__(self, status, body):
+        super().__init__(f"{status}: {body}")
+        self.status = status
+        self.body = body
+
+class OrderRejected(BrokerError):
+    # The broker refused the order itself; sending it again cannot succeed
+    pass
+
+class Throttled(BrokerError):
+    # Rate limited even after the client's own waits (BinanceAPI._request already
+    # honoured Retry-After); retrying on top of that only escalates to an IP ban
+    pass
+
+def is_retryable(e):
+    # Only failures where resending may succeed: the request never got an answer,
+    # or the broker throttled us (429) or failed itself (5xx). Any other 4xx is
+    # about the order and would fail the same way again.
+    if isinstance(e, requests.RequestException):
+        return True
+    if isinstance(e, (OrderRejected, Throttled)):
+        return False
+    return isinstance(e, BrokerError) and (e.status == 429 or e.status >= 500)
+
+@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=10),
+       retry=retry_if_exception(is_retryable), before_sleep=log_retry, reraise=True)
+def submit_with_retry(client, order):
+    return client._timed("submit", client._submit, order)
+
+def new_client_order_id(prefix="ats"):
+    # Generated once per order, before any retry, so a resent order is recognised as a duplicate
+    return f"{prefix}-{uuid.uuid4().hex[:24]}"
+
+def order_spec(symbol, qty, side, price=None, client_order_id=None, time_in_force="gtc"):
+    # price=None -> market order, otherwise limit at price
+    return {"symbol": symbol, "qty": qty, "side": side,
+            "type": "market" if price is None else "limit", "price": price,
+            "time_in_force": time_in_force,
+            "client_order_id": client_order_id or new_client_order_id()}
+
+class BrokerClient:
+    # Shared execution layer: one keep-alive session per broker, a worker pool for
+    # concurrent submission and per-operation latency tracking. Subclasses
+    # implement _submit(order) and _cancel(order_id, symbol).
+    name = "broker"
+
+    def __init__(self, session=None, max_workers=8):
+        self.session = session or make_session(pool_size=max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{self.name}-orders")
+        self._latency = {}
+        self._lock = threading.Lock()
+
+    def _timed(self, op, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - t0
+            order_latency.labels(self.name, op).observe(elapsed)
+            with self._lock:
+                self._latency.setdefault(op, deque(maxlen=10_000)).append(elapsed)
+
+    def connect(self):
+        return True
+
+    def submit(self, order, retry=True):
+        # retry reuses order['client_order_id'], so a resent order is never doubled
+        if retry:
+            return submit_with_retry(self, order)
+        return self._timed("submit", self._submit, order)
+
+    def submit_many(self, orders, retry=True):
+        # Orders go out concurrently; results keep input order, failures come back as
+        # {'error', 'client_order_id'} instead of aborting the rest
+        futures = [self._pool.submit(self.submit, o, retry) for o in orders]
+        results = []
+        for o, fut in zip(orders, futures):
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                logging.error(f"{self.name} order {o['client_order_id']} failed: {e}")
+                results.append({"error": str(e), "client_order_id": o["client_order_id"]})
+        return results
+
+    def buy(self, symbol, qty, price=None, client_order_id=None):
+        return self.submit(order_spec(symbol, qty, "buy", price, client_order_id))
+
+    def sell(self, symbol, qty, price=None, client_order_id=None):
+        return self.submit(order_spec(symbol, qty, "sell", price, client_order_id))
+
+    def limit(self, symbol, qty, side, price, client_order_id=None):
+        return self.submit(order_spec(symbol, qty, side, price, client_order_id))
+
+    def cancel(self, order_id, symbol=None):
+        return self._timed("cancel", self._cancel, order_id, symbol)
+
+    def get_stats(self):
+        with self._lock:
+            out = {}
+            for op, samples in self._latency.items():
+                a = np.fromiter(samples, dtype=float)
+                out[op] = {"count": len(a), "mean_ms": float(a.mean() * 1e3),
+                           "p50_ms": float(np.percentile(a, 50) * 1e3),
+                           "p99_ms": float(np.percentile(a, 99) * 1e3)}
+            return out
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self.session.close()
+
+class AlpacaAPI(BrokerClient):
+    name = "alpaca"
+    # 422 body for a reused client_order_id; 40010001 alone covers other validation errors too
+    DUPLICATE_ERROR = (40010001, "client_order_id must be unique")
+
+    def __init__(self, credentials, base_url="https://paper-api.alpaca.markets", session=None, max_workers=8):
+        super().__init__(session, max_workers)
         self.key_id = credentials.get("alpaca_key")
         self.secret_key = credentials.get("alpaca_secret")
-        self.base_url = "https://paper-api.alpaca.markets"
+        self.base_url = base_url
+        self.session.headers.update({
+            "APCA-API-KEY-ID": self.key_id or "",
+            "APCA-API-SECRET-KEY": self.secret_key or "",
+        })
 
-    def buy(self, symbol, qty):
-        url = f"{self.base_url}/v2/orders"
-        headers = {
-            "APCA-API-KEY-ID": self.key_id,
-            "APCA-API-SECRET-KEY": self.secret_key,
-        }
+    def _check(self, r):
+        if r.status_code >= 400:
+            raise BrokerError(r.status_code, r.text)
+        return r.json() if r.content else {}
+
+    def connect(self):
+        try:
+            self._check(self.session.get(f"{self.base_url}/v2/account", timeout=10))
+            return True
+        except (requests.RequestException, BrokerError) as e:
+            logging.error(f"Alpaca connect failed: {e}")
+            return False
+
+    def _submit(self, order):
         payload = {
-            "symbol": symbol,
-            "qty": qty,
-            "side": "buy",
-            "type": "market",
-            "time_in_force": "gtc",
+            "symbol": order["symbol"],
+            "qty": order["qty"],
+            "side": order["side"],
+            "type": order["type"],
+            "time_in_force": order["time_in_force"],
+            "client_order_id": order["client_order_id"],
         }
-        r = requests.post(url, json=payload, headers=headers)
-        return r.json()
+        if order["type"] == "limit":
+            payload["limit_price"] = order["price"]
+        r = self.session.post(f"{self.base_url}/v2/orders", json=payload, timeout=10)
+        if r.status_code == 422 and self._is_duplicate(r):
+            # An earlier attempt already reached the broker: return that order
+            return self.get_order_by_client_id(order["client_order_id"])
+        return self._check(r)
+
+    def _is_duplicate(self, r):
+        try:
+            err = r.json()
+        except ValueError:
+            return False
+        return isinstance(err, dict) and (err.get("code"), err.get("message")) == self.DUPLICATE_ERROR
+
+    def get_order_by_client_id(self, client_order_id):
+        r = self.session.get(f"{self.base_url}/v2/orders:by_client_order_id",
+                             params={"client_order_id": client_order_id}, timeout=10)
+        return self._check(r)
+
+    def _cancel(self, order_id, symbol=None):
+        return self._check(self.session.delete(f"{self.base_url}/v2/orders/{order_id}", timeout=10))
+
+class WindowLimiter:
+    # Counter over clock-aligned fixed windows, the way Binance meters weight and
+    # order counts (a token bucket would let a burst straddle two windows)
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.window = None
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def _roll(self, now):
+        w = int(now // self.period)
+        if w != self.window:
+            self.window, self.used = w, 0
+        return w
 
-    def sell(self, symbol, qty):
-        # Same as buy, but side="sell"
-        # ... (similar implementation)
-        pass
+    def acquire(self, cost=1):
+        while True:
+            with self._lock:
+                now = time.time()
+                w = self._roll(now)
+                if self.used + cost <= self.capacity:
+                    self.used += cost
+                    return
+                wait = (w + 1) * self.period - now
+            time.sleep(wait)
 
-class BinanceAPI:
-    def __init__(self, credentials):
+    def sync_used(self, used):
+        with self._lock:
+            self._roll(time.time())
+            self.used = max(self.used, used)
+
+class BinanceRateScheduler:
+    # Paces requests against Binance's REQUEST_WEIGHT (per minute) and ORDERS (per
+    # 10s and per day) limits, corrected from the X-MBX-* usage headers. A 429/418
+    # pauses every caller until Retry-After has passed instead of hammering into a ban.
+    def __init__(self, weight=(6000, 60.0), orders=(50, 10.0), orders_day=(160_000, 86_400.0)):
+        self.weight = WindowLimiter(*weight)
+        self.orders = WindowLimiter(*orders)
+        self.orders_day = WindowLimiter(*orders_day)
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "wait_s": 0.0}
+
+    def acquire(self, weight=1, is_order=False):
+        t0 = time.monotonic()
+        while True:
+            with self._lock:
+                wait = self.paused_until - time.monotonic()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        if is_order:
+            self.orders_day.acquire()
+            self.orders.acquire()
+        self.weight.acquire(weight)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["wait_s"] += time.monotonic() - t0
+
+    def update(self, headers):
+        for header, limiter in (("X-MBX-USED-WEIGHT-1M", self.weight),
+                                ("X-MBX-ORDER-COUNT-10S", self.orders),
+                                ("X-MBX-ORDER-COUNT-1D", self.orders_day)):
+            used = headers.get(header)
+            if used is not None:
+                limiter.sync_used(int(used))
+
+    def back_off(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.stats["throttled"] += 1
+
+_binance_scheduler = None
+
+def get_binance_scheduler():
+    # Limits are per IP/account, so all BinanceAPI clients in the process share one
+    global _binance_scheduler
+    if _binance_scheduler is None:
+        _binance_scheduler = BinanceRateScheduler()
+    return _binance_scheduler
+
+def _fmt(x):
+    return f"{float(x):.8f}".rstrip("0").rstrip(".")
+
+class BinanceAPI(BrokerClient):
+    name = "binance"
+    # -2010 is NEW_ORDER_REJECTED for any reason (balance, filters, ...); only
+    # this message means an earlier attempt with our client order id got through
+    ORDER_REJECTED = -2010
+    DUPLICATE_MSG = "Duplicate order sent."
+
+    def __init__(self, credentials, base_url="https://api.binance.com", ws_url="wss://stream.binance.com:9443/ws",
+                 session=None, max_workers=8, recv_window=5000, scheduler=None):
+        super().__init__(session, max_workers)
         self.api_key = credentials.get("binance_key")
         self.secret = credentials.get("binance_secret")
-        # ... implement REST calls or use ccxt ...
+        self.base_url = base_url
+        self.ws_url = ws_url
+        self.recv_window = recv_window
+        self.scheduler = scheduler or get_binance_scheduler()
+        # HMAC key schedule is computed once; each request signs a copy
+        self._mac = hmac.new((self.secret or "").encode(), digestmod=hashlib.sha256)
+        self.session.headers["X-MBX-APIKEY"] = self.api_key or ""
+
+    def sign(self, params):
+        query = urlencode(params)
+        mac = self._mac.copy()
+        mac.update(query.encode())
+        return f"{query}&signature={mac.hexdigest()}"
+
+    def _request(self, method, path, params=None, signed=False, weight=1, is_order=False, retries=3):
+        for attempt in range(retries + 1):
+            self.scheduler.acquire(weight, is_order)
+            query = dict(params or {})
+            if signed:
+                query["timestamp"] = int(time.time() * 1000)
+                query["recvWindow"] = self.recv_window
+                query = self.sign(query)
+            else:
+                query = urlencode(query)
+            r = self.session.request(method, f"{self.base_url}{path}?{query}", timeout=10)
+            self.scheduler.update(r.headers)
+            if r.status_code in (418, 429) and attempt < retries:
+                wait = float(r.headers.get("Retry-After", 2 ** attempt))
+                logging.warning(f"Binance rate limited ({r.status_code}) on {path}, pausing {wait}s")
+                self.scheduler.back_off(wait)
+                continue
+            if r.status_code in (418, 429):
+                self.scheduler.back_off(float(r.headers.get("Retry-After", 2 ** attempt)))
+                raise Throttled(r.status_code, r.text)
+            if r.status_code >= 400:
+                raise BrokerError(r.status_code, r.text)
+            return r.json() if r.content else {}
+
+    def connect(self):
+        try:
+            self._request("GET", "/api/v3/account", signed=True, weight=20)
+            return True
+        except (requests.RequestException, BrokerError) as e:
+            logging.error(f"Binance connect failed: {e}")
+            return False
+
+    def _submit(self, order):
+        params = {
+            "symbol": order["symbol"],
+            "side": order["side"].upper(),
+            "type": order["type"].upper(),
+            "quantity": _fmt(order["qty"]),
+            "newClientOrderId": order["client_order_id"],
+            "newOrderRespType": "FULL",
+        }
+        if order["type"] == "limit":
+            params["timeInForce"] = order["time_in_force"].upper()
+            params["price"] = _fmt(order["price"])
+        try:
+            return self._request("POST", "/api/v3/order", params, signed=True, is_order=True)
+        except BrokerError as e:
+            try:
+                err = json.loads(e.body)
+            except ValueError:
+                raise e
+            if not isinstance(err, dict) or err.get("code") != self.ORDER_REJECTED:
+                raise
+            if err.get("msg") != self.DUPLICATE_MSG:
+                raise OrderRejected(e.status, e.body)
+            # An earlier attempt already reached the exchange: return that order
+            return self.get_order(order["symbol"], client_order_id=order["client_order_id"])
+
+    def get_order(self, symbol, order_id=None, client_order_id=None):
+        params = {"symbol": symbol}
+        if order_id is not None:
+            params["orderId"] = order_id
+        else:
+            params["origClientOrderId"] = client_order_id
+        return self._request("GET", "/api/v3/order", params, signed=True, weight=4)
+
+    def _cancel(self, order_id, symbol=None):
+        if symbol is None:
+            raise ValueError("Binance cancel needs the order's symbol")
+        # Exchange order ids are the ints Binance returns; our client order ids
+        # (new_client_order_id or the caller's own) are always strings
+        key = "orderId" if isinstance(order_id, (int, np.integer)) else "origClientOrderId"
+        return self._request("DELETE", "/api/v3/order", {"symbol": symbol, key: order_id}, signed=True)
+
+    def new_listen_key(self):
+        return self._request("POST", "/api/v3/userDataStream", weight=2)["listenKey"]
+
+    def keepalive_listen_key(self, listen_key):
+        return self._request("PUT", "/api/v3/userDataStream", {"listenKey": listen_key}, weight=2)
+
+    def user_stream(self, on_fill, on_event=None):
+        return BinanceUserStream(self, on_fill, on_event).start()
+
+def parse_execution_report(ev):
+    return {"symbol": ev["s"], "client_order_id": ev["c"], "order_id": ev["i"], "side": ev["S"],
+            "status": ev["X"], "exec_type": ev["x"], "last_qty": float(ev["l"]),
+            "last_price": float(ev["L"]), "cum_qty": float(ev["z"]), "ts": ev["T"]}
+
+class BinanceUserStream(BackgroundLoop):
+    # Fills arrive over the user-data websocket instead of by polling order status.
+    # Holds a listenKey (renewed every keepalive_s) and reconnects with jittered backoff.
+    def __init__(self, client, on_fill, on_event=None, keepalive_s=30 * 60, backoff=(0.5, 30.0)):
+        self.client = client
+        self.on_fill = on_fill
+        self.on_event = on_event
+        self.keepalive_s = keepalive_s
+        self.backoff = backoff
+        self.stats = {"events": 0, "fills": 0, "reconnects": 0}
+
+    async def _keepalive(self, listen_key):
+        while True:
+            await asyncio.sleep(self.keepalive_s)
+            await asyncio.to_thread(self.client.keepalive_listen_key, listen_key)
+
+    def _handle(self, raw):
+        ev = json.loads(raw)
+        self.stats["events"] += 1
+        if self.on_event:
+            self.on_event(ev)
+        if ev.get("e") == "executionReport" and ev.get("x") == "TRADE":
+            self.stats["fills"] += 1
+            self.on_fill(parse_execution_report(ev))
+
+    async def _listen(self):
+        backoff = Backoff(*self.backoff)
+        while True:
+            keepalive = None
+            try:
+                listen_key = await asyncio.to_thread(self.client.new_listen_key)
+                async with websockets.connect(f"{self.client.ws_url}/{listen_key}") as ws:
+                    backoff.reset()
+                    keepalive = asyncio.ensure_future(self._keepalive(listen_key))
+                    async for raw in ws:
+                        try:
+                            self._handle(raw)
+                        except Exception as e:
+                            logging.error(f"Binance user event handler failed: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Binance user stream error: {e}")
+            finally:
+                if keepalive:
+                    keepalive.cancel()
+            self.stats["reconnects"] += 1
+            await backoff.sleep()
+
+    def _start_tasks(self):
+        return [asyncio.ensure_future(self._listen())]
+
+class DemoBroker(BrokerClient):
+    # Fills everything immediately in memory; the dashboard's default "Demo" broker
+    name = "demo"
+
+    def __init__(self, credentials=None, max_workers=2):
+        super().__init__(max_workers=max_workers)
+        self.orders = {}
+
+    def _submit(self, order):
+        filled = dict(order, id=order["client_order_id"], status="filled")
+        self.orders.setdefault(order["client_order_id"], filled)
+        return self.orders[order["client_order_id"]]
+
+    def _cancel(self, order_id, symbol=None):
+        order = self.orders.get(order_id)
+        if order is None:
+            raise BrokerError(404, "order not found")
+        return order
 
-def get_broker(broker, credentials):
+def get_broker(broker, credentials, **kwargs):
     if broker == "Alpaca":
-        return AlpacaAPI(credentials)
+        return AlpacaAPI(credentials, **kwargs)
     elif broker == "Binance":
-        return BinanceAPI(credentials)
+        return BinanceAPI(credentials, **kwargs)
+    elif broker == "Demo":
+        return DemoBroker(credentials)
     # Add more as needed
     else:
-        raise Exception("Unknown broker")
\ No newline at end of file
+        raise Exception("Unknown broker")
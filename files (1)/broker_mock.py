@@ -0,0 +1,267 @@
+import hmac
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import websockets
+
+class MockBrokerServer:
+    # Local stand-in for the Alpaca REST API (/v2/account, /v2/orders,
+    # /v2/orders:by_client_order_id, DELETE /v2/orders/{id}) and the Binance spot
+    # API (/api/v3/order, /api/v3/account, /api/v3/userDataStream, plus the
+    # user-data websocket from start_user_stream()). Binance requests are signature
+    # checked and metered: usage headers are returned and going over weight_limit
+    # per minute or order_limit per 10s window answers 429 with Retry-After.
+    # latency adds a fixed delay per request; lose_responses makes the next N
+    # orders be accepted but answered with a 503, to exercise client_order_id retries.
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, binance_secret="secret",
+                 weight_limit=6000, order_limit=50):
+        self.host = host
+        self.latency = latency
+        self.lose_responses = 0
+        self.binance_secret = binance_secret.encode()
+        self.weight_limit = weight_limit
+        self.order_limit = order_limit
+        self.orders = {}
+        self.by_client_id = {}
+        self.requests = 0
+        self.rejected = 0
+        self._weight_window = [None, 0]  # [minute, weight used]
+        self._order_window = [None, 0]  # [10s window, orders placed]
+        self.listen_keys = set()
+        self._ws_clients = set()
+        self._ws_loop = None
+        self._ws_server = None
+        self._next_id = 1
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self):
+                n = int(self.headers.get("Content-Length", 0) or 0)
+                return self.rfile.read(n) if n else b""
+
+            def _send(self, status, obj, headers):
+                data = b"" if status == 204 else json.dumps(obj).encode()
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, str(v))
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _dispatch(self, method):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                url = urlparse(self.path)
+                status, obj, *extra = server.handle(method, url.path, url.query, self._body(), self.headers)
+                self._send(status, obj, extra[0] if extra else {})
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+            def do_PUT(self):
+                self._dispatch("PUT")
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.request_queue_size = 128
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle(self, method, path, raw_query, body, headers):
+        if path.startswith("/api/v3/"):
+            return self._binance(method, path, raw_query, headers)
+        query = parse_qs(raw_query)
+        if path == "/v2/account" and method == "GET":
+            return 200, {"status": "ACTIVE", "buying_power": "100000"}
+        if path == "/v2/orders" and method == "POST":
+            return self._alpaca_order(json.loads(body or b"{}"))
+        if path == "/v2/orders:by_client_order_id" and method == "GET":
+            order = self.by_client_id.get(query.get("client_order_id", [""])[0])
+            return (200, order) if order else (404, {"message": "order not found"})
+        if path.startswith("/v2/orders/") and method == "DELETE":
+            with self._lock:
+                order = self.orders.get(path.rsplit("/", 1)[1])
+                if order is None:
+                    return 404, {"message": "order not found"}
+                order["status"] = "canceled"
+            return 204, {}
+        return 404, {"message": f"unknown endpoint {method} {path}"}
+
+    def _alpaca_order(self, payload):
+        cid = payload.get("client_order_id") or uuid.uuid4().hex
+        with self._lock:
+            if cid in self.by_client_id:
+                return 422, {"code": 40010001, "message": "client_order_id must be unique"}
+            order = dict(payload, id=uuid.uuid4().hex, client_order_id=cid,
+                         status="filled" if payload.get("type") == "market" else "new")
+            self.orders[order["id"]] = order
+            self.by_client_id[cid] = order
+            if self.lose_responses > 0:
+                self.lose_responses -= 1
+                return 503, {"message": "upstream timeout"}
+        return 200, order
+
+    # --- Binance ---
+    WEIGHTS = {("POST", "/api/v3/order"): 1, ("DELETE", "/api/v3/order"): 1, ("GET", "/api/v3/order"): 4,
+               ("GET", "/api/v3/account"): 20, ("POST", "/api/v3/userDataStream"): 2,
+               ("PUT", "/api/v3/userDataStream"): 2}
+
+    def _binance(self, method, path, raw_query, headers):
+        weight = self.WEIGHTS.get((method, path), 1)
+        is_order = (method, path) == ("POST", "/api/v3/order")
+        now = time.time()
+        with self._lock:
+            # Fixed clock-aligned windows, as Binance counts them
+            if self._weight_window[0] != int(now // 60):
+                self._weight_window = [int(now // 60), 0]
+            if self._order_window[0] != int(now // 10):
+                self._order_window = [int(now // 10), 0]
+            used = self._weight_window[1] + weight
+            orders = self._order_window[1] + is_order
+            if used > self.weight_limit or orders > self.order_limit:
+                self.rejected += 1
+                retry = 60 - now % 60 if used > self.weight_limit else 10 - now % 10
+                return 429, {"code": -1003, "msg": "Too many requests"}, {"Retry-After": max(1, int(retry + 0.999))}
+            self._weight_window[1] = used
+            self._order_window[1] = orders
+            usage = {"X-MBX-USED-WEIGHT-1M": used, "X-MBX-ORDER-COUNT-10S": orders}
+        params = {k: v[0] for k, v in parse_qs(raw_query).items()}
+        if path == "/api/v3/userDataStream":
+            if method == "POST":
+                key = uuid.uuid4().hex
+                self.listen_keys.add(key)
+                return 200, {"listenKey": key}, usage
+            return 200, {}, usage
+        if "signature" in params:
+            unsigned = raw_query.rsplit("&signature=", 1)[0]
+            expected = hmac.new(self.binance_secret, unsigned.encode(), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, params["signature"]) or not headers.get("X-MBX-APIKEY"):
+                return 401, {"code": -1022, "msg": "Signature for this request is not valid."}, usage
+        else:
+            return 400, {"code": -1102, "msg": "Mandatory parameter 'signature' was not sent."}, usage
+        if path == "/api/v3/account":
+            return 200, {"canTrade": True, "balances": []}, usage
+        if path == "/api/v3/order":
+            status, obj = self._binance_order(method, params)
+            return status, obj, usage
+        return 404, {"code": -1, "msg": "unknown endpoint"}, usage
+
+    def _binance_order(self, method, params):
+        with self._lock:
+            if method == "POST":
+                cid = params.get("newClientOrderId") or uuid.uuid4().hex
+                if cid in self.by_client_id:
+                    return 400, {"code": -2010, "msg": "Duplicate order sent."}
+                market = params["type"] == "MARKET"
+                order = {"symbol": params["symbol"], "orderId": self._next_id, "clientOrderId": cid,
+                         "side": params["side"], "type": params["type"], "origQty": params["quantity"],
+                         "price": params.get("price", "0"), "status": "FILLED" if market else "NEW",
+                         "executedQty": params["quantity"] if market else "0",
+                         "transactTime": int(time.time() * 1000)}
+                self._next_id += 1
+                self.orders[str(order["orderId"])] = order
+                self.by_client_id[cid] = order
+                if market:
+                    self._push(self._execution_report(order))
+                if self.lose_responses > 0:
+                    self.lose_responses -= 1
+                    return 503, {"code": -1007, "msg": "Timeout waiting for response from backend server."}
+                return 200, order
+            order = self.orders.get(params.get("orderId", "")) or self.by_client_id.get(params.get("origClientOrderId", ""))
+            if order is None or order["symbol"] != params.get("symbol"):
+                return 400, {"code": -2013, "msg": "Order does not exist."}
+            if method == "DELETE":
+                order["status"] = "CANCELED"
+            return 200, order
+
+    def _execution_report(self, order):
+        return {"e": "executionReport", "E": int(time.time() * 1000), "s": order["symbol"],
+                "c": order["clientOrderId"], "S": order["side"], "o": order["type"], "q": order["origQty"],
+                "x": "TRADE", "X": order["status"], "i": order["orderId"], "l": order["executedQty"],
+                "z": order["executedQty"], "L": order["price"] if order["type"] == "LIMIT" else "100.0",
+                "T": order["transactTime"]}
+
+    def fill(self, order_id):
+        # Fill a resting limit order and push its executionReport
+        with self._lock:
+            order = self.orders[str(order_id)]
+            order.update(status="FILLED", executedQty=order["origQty"])
+            self._push(self._execution_report(order))
+
+    def _push(self, event):
+        if self._ws_loop is None:
+            return
+        data = json.dumps(event)
+        for ws in list(self._ws_clients):
+            asyncio.run_coroutine_threadsafe(ws.send(data), self._ws_loop)
+
+    def start_user_stream(self, port=0):
+        # Binance user-data websocket at ws://host:port/ws/<listenKey>
+        ready = threading.Event()
+
+        async def handler(ws):
+            if ws.request.path.rsplit("/", 1)[-1] not in self.listen_keys:
+                await ws.close(4001, "invalid listenKey")
+                return
+            self._ws_clients.add(ws)
+            try:
+                await ws.wait_closed()
+            finally:
+                self._ws_clients.discard(ws)
+
+        async def main():
+            self._ws_loop = asyncio.get_running_loop()
+            self._ws_stop = asyncio.Event()
+            self._ws_server = await websockets.serve(handler, self.host, port)
+            ready.set()
+            await self._ws_stop.wait()
+            self._ws_server.close()
+            await self._ws_server.wait_closed()
+
+        self._ws_thread = threading.Thread(target=lambda: asyncio.run(main()), daemon=True)
+        self._ws_thread.start()
+        ready.wait()
+        return self
+
+    @property
+    def ws_url(self):
+        host, port = list(self._ws_server.sockets)[0].getsockname()[:2]
+        return f"ws://{host}:{port}/ws"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._ws_loop is not None:
+            self._ws_loop.call_soon_threadsafe(self._ws_stop.set)
+            self._ws_thread.join()
+            self._ws_loop = None
+        self.httpd.shutdown()
+        self.httpd.server_close()
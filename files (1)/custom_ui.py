@@ -1,15 +1,25 @@
 import streamlit as st
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 
-def watchlist_ui(watchlist, data_fetcher):
+def watchlist_ui(watchlist, data_fetcher, fetch_many=None):
+    # fetch_many(symbols) -> iterable of (symbol, df, error), e.g. data_sources.get_many
     st.sidebar.header("My Watchlist")
     symbol_add = st.sidebar.text_input("Add Symbol to Watchlist")
     if symbol_add and symbol_add not in watchlist:
         watchlist.append(symbol_add)
     if st.sidebar.button("Clear Watchlist"):
         watchlist.clear()
+    if fetch_many:
+        frames = {sym: df for sym, df, err in fetch_many(list(watchlist)) if err is None}
+    else:
+        with ThreadPoolExecutor(max_workers=min(16, max(1, len(watchlist)))) as pool:
+            frames = dict(zip(watchlist, pool.map(data_fetcher, watchlist)))
     for sym in watchlist:
-        df = data_fetcher(sym)
+        df = frames.get(sym)
+        if df is None or df.empty:
+            st.sidebar.write(f"{sym}: n/a")
+            continue
         st.sidebar.write(f"{sym}: {df['Close'].iloc[-1]:.2f}")
         # Add sparkline, % change, or AI signal!
 
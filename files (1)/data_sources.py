@@ -1,20 +1,135 @@
+import io
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from history_cache import CachedSource, INTERVAL_SECONDS
+
+def make_session(pool_size=32):
+    # Keep-alive connections shared by all fetch threads
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_session = None
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = make_session()
+    return _session
+
+class RateLimiter:
+    # Token bucket of `capacity` units per `period` seconds, shared across threads.
+    # sync_used() lets a provider's own usage header correct the local estimate.
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.period)
+                self.updated = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                wait = (cost - self.tokens) * self.period / self.capacity
+            time.sleep(wait)
+
+    def sync_used(self, used):
+        with self._lock:
+            self.tokens = min(self.tokens, self.capacity - used)
+
+# Binance: 6000 request weight per minute per IP; klines cost 2
+RATE_LIMITS = {"binance": (6000, 60.0), "yahoo": (100, 1.0)}
+_limiters = {}
+
+def get_limiter(provider):
+    if provider not in _limiters:
+        _limiters[provider] = RateLimiter(*RATE_LIMITS[provider])
+    return _limiters[provider]
+
+def _get(session, limiter, url, weight=1, retries=3, **kwargs):
+    for attempt in range(retries + 1):
+        limiter.acquire(weight)
+        r = session.get(url, **kwargs)
+        if r.status_code in (418, 429) and attempt < retries:
+            # Back off as told instead of escalating into an IP ban
+            wait = float(r.headers.get("Retry-After", 2 ** attempt))
+            logging.warning(f"Rate limited ({r.status_code}) on {url}, retrying in {wait}s")
+            time.sleep(wait)
+            continue
+        r.raise_for_status()
+        return r
 
 class YahooFinanceSource:
+    def __init__(self, base_url="https://query1.finance.yahoo.com", session=None):
+        self.base_url = base_url
+        self.session = session or get_session()
+        self.limiter = get_limiter("yahoo")
+
     def get_history(self, symbol, start, end, interval="1d"):
-        url = f"https://query1.finance.yahoo.com/v7/finance/download/{symbol}?period1={int(pd.Timestamp(start).timestamp())}&period2={int(pd.Timestamp(end).timestamp())}&interval={interval}&events=history"
-        df = pd.read_csv(url)
+        url = f"{self.base_url}/v7/finance/download/{symbol}?period1={int(pd.Timestamp(start).timestamp())}&period2={int(pd.Timestamp(end).timestamp())}&interval={interval}&events=history"
+        r = _get(self.session, self.limiter, url, headers={"User-Agent": "Mozilla/5.0"})
+        df = pd.read_csv(io.StringIO(r.text))
         df['Date'] = pd.to_datetime(df['Date'])
         df = df.set_index('Date')
         return df
 
 class BinanceSource:
-    def get_history(self, symbol, interval="1h", limit=500):
+    PAGE = 1000  # klines per request (API maximum)
+    WEIGHT = 2
+
+    def __init__(self, base_url="https://api.binance.com", session=None):
+        self.base_url = base_url
+        self.session = session or get_session()
+        self.limiter = get_limiter("binance")
+
+    def _klines(self, pair, interval, limit, start_ms=None, end_ms=None):
+        url = f"{self.base_url}/api/v3/klines?symbol={pair}&interval={interval}&limit={limit}"
+        if start_ms is not None:
+            url += f"&startTime={start_ms}"
+        if end_ms is not None:
+            url += f"&endTime={end_ms}"
+        r = _get(self.session, self.limiter, url, weight=self.WEIGHT)
+        used = r.headers.get("X-MBX-USED-WEIGHT-1M")
+        if used is not None:
+            self.limiter.sync_used(int(used))
+        return r.json()
+
+    def get_history(self, symbol, start=None, end=None, interval="1h", limit=500):
+        # With a start, pages forward PAGE klines at a time until end; without one,
+        # returns the latest `limit` klines (paging when limit > PAGE).
         base, quote = symbol[:3], symbol[3:]
-        url = f"https://api.binance.com/api/v3/klines?symbol={base}{quote}&interval={interval}&limit={limit}"
-        r = requests.get(url)
-        data = r.json()
+        pair = f"{base}{quote}"
+        end_ms = None if end is None else int(pd.Timestamp(end).timestamp() * 1000)
+        if start is None and limit <= self.PAGE:
+            data = self._klines(pair, interval, limit, end_ms=end_ms)
+        else:
+            if start is None:
+                step = INTERVAL_SECONDS.get(interval, 3600) * 1000
+                start_ms = (end_ms or int(time.time() * 1000)) - limit * step
+            else:
+                start_ms = int(pd.Timestamp(start).timestamp() * 1000)
+            data = []
+            while True:
+                page = self._klines(pair, interval, self.PAGE, start_ms, end_ms)
+                data.extend(page)
+                if len(page) < self.PAGE:
+                    break
+                start_ms = page[-1][0] + 1
+            if start is None:
+                data = data[-limit:]
         df = pd.DataFrame(data, columns=[
             'Open time','Open','High','Low','Close','Volume',
             'Close time','Quote Asset Volume','Number of Trades',
@@ -22,14 +137,31 @@ class BinanceSource:
         ])
         df['Open time'] = pd.to_datetime(df['Open time'], unit='ms')
         df = df.set_index('Open time')
-        df['Close'] = df['Close'].astype(float)
+        for col in ['Open', 'High', 'Low', 'Close', 'Volume']:
+            df[col] = df[col].astype(float)
         return df
 
 # Add Alpaca, Polygon, Tiingo...
-def get_source(provider):
+def get_source(provider, cache=True):
+    # cache=True serves history through the shared on-disk HistoryCache
     if provider == "yahoo":
-        return YahooFinanceSource()
+        source = YahooFinanceSource()
     elif provider == "binance":
-        return BinanceSource()
+        source = BinanceSource()
     else:
-        raise Exception("Unknown provider")
\ No newline at end of file
+        raise Exception("Unknown provider")
+    return CachedSource(source, provider) if cache else source
+
+def get_many(symbols, start, end, interval="1d", provider="yahoo", max_workers=16, source=None):
+    # Fetches all symbols concurrently over the pooled session (the provider's rate
+    # limiter still applies) and yields (symbol, df, error) as each one completes.
+    source = source or get_source(provider)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(source.get_history, sym, start, end, interval): sym for sym in symbols}
+        for fut in as_completed(futures):
+            sym = futures[fut]
+            try:
+                yield sym, fut.result(), None
+            except Exception as e:
+                logging.error(f"History fetch failed for {sym}: {e}")
+                yield sym, None, e
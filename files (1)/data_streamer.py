@@ -1,50 +1,40 @@
-import websocket
-import json
-import pandas as pd
-from threading import Thread, Event
+from threading import Event
+from async_data_streamer import TickPipeline
+from tick_buffer import ColumnarTickBuffer
 
 class MarketDataStreamer:
-    def __init__(self, symbol, api_key, provider='finnhub'):
+    # Thin sync wrapper over TickPipeline: the websocket runs on the pipeline's
+    # event loop and ticks land in a bounded columnar buffer instead of a list of dicts.
+    def __init__(self, symbol, api_key, provider='finnhub', on_tick=None, max_ticks=1_000_000,
+                 max_age_s=None, url=None):
         self.symbol = symbol
+        self.on_tick = on_tick  # e.g. FeatureStore.on_tick
         self.api_key = api_key
         self.provider = provider
-        self.ws = None
-        self.data = []
+        self.data = ColumnarTickBuffer(max_ticks=max_ticks, max_age_s=max_age_s)
         self.stop_event = Event()
+        self.pipeline = TickPipeline()
+        self.pipeline.add_source(provider, [symbol], api_key=api_key, url=url)
+        self.pipeline.subscribe(self.data.append_tick, name='buffer', maxsize=10_000)
+        if on_tick:
+            self.pipeline.subscribe(on_tick, name='on_tick')
 
-    def on_message(self, ws, message):
-        msg = json.loads(message)
-        # Parse according to provider schema
-        if 'data' in msg:
-            for tick in msg['data']:
-                self.data.append(tick)
-
-    def on_error(self, ws, error):
-        print("Websocket error:", error)
-
-    def on_close(self, ws):
-        print("Websocket closed")
+    def start(self):
+        self.stop_event.clear()
+        self.pipeline.start()
 
     def stream(self):
-        # For Finnhub example
-        url = f"wss://ws.finnhub.io?token={self.api_key}"
-        self.ws = websocket.WebSocketApp(
-            url,
-            on_message=self.on_message,
-            on_error=self.on_error,
-            on_close=self.on_close
-        )
-        def run_ws():
-            self.ws.run_forever()
-        t = Thread(target=run_ws)
-        t.start()
-        self.ws.send(json.dumps({'type':'subscribe','symbol':self.symbol}))
-        while not self.stop_event.is_set():
-            pass
-        self.ws.close()
+        # Blocks until stop() without spinning a core
+        self.start()
+        self.stop_event.wait()
+
+    def get_data(self, start_ts=None, end_ts=None):
+        # Zero-copy view of the ticks in [start_ts, end_ts) (ms)
+        return self.data.window(start_ts, end_ts)
 
-    def get_data(self):
-        return pd.DataFrame(self.data)
+    def get_bars(self, freq_s=60, start_ts=None, end_ts=None):
+        return self.data.ohlcv(freq_s, self.symbol, start_ts, end_ts)
 
     def stop(self):
-        self.stop_event.set()
\ No newline at end of file
+        self.stop_event.set()
+        self.pipeline.stop()
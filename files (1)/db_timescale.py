@@ -1,10 +1,337 @@
-import psycopg2
+import io
+import os
+import json
+import time
+import queue
+import logging
+import sqlite3
+import threading
+from collections import deque
+
+# Errors caused by the rows themselves (bad values, wrong arity), not by the DB
+# being unavailable: a batch failing with one is bisected down to the bad rows
+ROW_ERRORS = (ValueError, TypeError, sqlite3.DataError, sqlite3.IntegrityError)
+
+try:
+    import psycopg2
+    from psycopg2.extras import execute_values
+    ROW_ERRORS += (psycopg2.DataError, psycopg2.IntegrityError)
+except ImportError:  # SQLite stand-in still works without the driver
+    psycopg2 = None
+
+PG_DSN = dict(dbname='trading', user='user', password='pass', host='localhost')
+COLUMNS = ("symbol", "ts", "price", "volume")
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+def _copy_field(v):
+    # COPY text format: NULL is \N and backslash, tab, newline, CR are escaped
+    return "\\N" if v is None else str(v).translate(_COPY_ESCAPES)
+
+class ConnectionPool:
+    # Minimal blocking pool around any DB-API connect() factory
+    def __init__(self, connect, size=4):
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._sem = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        self._sem.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self._connect()
+            except Exception:
+                self._sem.release()
+                raise
+
+    def release(self, conn, broken=False):
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        else:
+            self._idle.put(conn)
+        self._sem.release()
+
+    def closeall(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class TickWriter:
+    # Buffers ticks in memory and writes them in batches (COPY / execute_values on
+    # Postgres, executemany on SQLite) when batch_size rows are pending or every
+    # flush_interval seconds. A full buffer blocks writers for up to block_timeout
+    # and then spills to disk; failed batches are spilled too. Spilled rows
+    # (JSON lines, fsynced) are replayed before new rows once the DB is back,
+    # including after a restart. A batch the DB rejects for its data is bisected
+    # so the good rows still land and only the offending rows go to the
+    # dead-letter file (spill_path + '.rejected', with the error).
+    def __init__(self, connect=None, dialect='postgres', batch_size=1000, flush_interval=1.0,
+                 max_buffer=100_000, block_timeout=0.5, spill_path='ticks.spill', pool_size=4,
+                 method='copy', table='ticks', dead_letter_path=None):
+        if connect is None:
+            connect = lambda: psycopg2.connect(**PG_DSN)
+        self.pool = ConnectionPool(connect, pool_size)
+        self.dialect = dialect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.block_timeout = block_timeout
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path or spill_path + '.rejected'
+        self.method = method
+        self.table = table
+        self._buf = deque()
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._retry_at = 0.0
+        self._backoff = 0.5
+        self.stats = {"rows_in": 0, "rows_written": 0, "rows_spilled": 0, "rows_replayed": 0,
+                      "rows_rejected": 0, "flushes": 0, "flush_errors": 0, "blocked_writes": 0, "write_time_total": 0.0,
+                      "flush_latency_last": 0.0, "flush_latency_max": 0.0}
+
+    @classmethod
+    def sqlite(cls, path, **kwargs):
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE IF NOT EXISTS ticks (symbol TEXT, ts TEXT, price REAL, volume REAL)")
+        conn.commit()
+        conn.close()
+        return cls(connect=lambda: sqlite3.connect(path, check_same_thread=False), dialect='sqlite', **kwargs)
+
+    # --- lifecycle ---
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._buf:
+            self._spill(self._take(len(self._buf)))
+        self.pool.closeall()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for k, v in deltas.items():
+                self.stats[k] += v
+
+    # --- producer side ---
+    def write(self, symbol, ts, price, volume):
+        row = (symbol, ts, price, volume)
+        with self._cond:
+            if len(self._buf) >= self.max_buffer:
+                self._count(blocked_writes=1)
+                self._wake.set()
+                self._cond.wait_for(lambda: len(self._buf) < self.max_buffer, timeout=self.block_timeout)
+            if len(self._buf) >= self.max_buffer:
+                full = True
+            else:
+                full = False
+                self._buf.append(row)
+                self._count(rows_in=1)
+                if len(self._buf) >= self.batch_size:
+                    self._wake.set()
+        if full:
+            # DB can't keep up: keep the tick durable rather than growing memory
+            self._count(rows_in=1)
+            self._spill([row])
+
+    def _take(self, n):
+        with self._cond:
+            rows = [self._buf.popleft() for _ in range(min(n, len(self._buf)))]
+            self._cond.notify_all()
+            return rows
+
+    # --- consumer side ---
+    def flush(self):
+        with self._flush_lock:
+            if time.monotonic() < self._retry_at:
+                if len(self._buf) >= self.max_buffer:
+                    self._spill(self._take(len(self._buf)))
+                return 0
+            if os.path.exists(self.spill_path) and not self._replay():
+                return 0
+            written = 0
+            while self._buf:
+                rows = self._take(self.batch_size)
+                rejected = []
+                done = self._write_rows(rows, rejected)
+                self._dead_letter(rejected)
+                written += done - len(rejected)
+                if done < len(rows):
+                    self._spill(rows[done:])
+                    return written
+            return written
+
+    def _write_rows(self, rows, rejected):
+        # -> number of rows handled from the front (written, or appended to rejected
+        # as (row, error)); fewer than len(rows) means the DB itself failed
+        error = self._write_batch(rows)
+        if error is None:
+            return len(rows)
+        if not isinstance(error, ROW_ERRORS):
+            return 0
+        if len(rows) == 1:
+            rejected.append((rows[0], repr(error)))
+            return 1
+        mid = len(rows) // 2
+        done = self._write_rows(rows[:mid], rejected)
+        if done < mid:
+            return done
+        return mid + self._write_rows(rows[mid:], rejected)
+
+    def _write_batch(self, rows):
+        # -> None once committed, else the exception
+        t0 = time.perf_counter()
+        conn = None
+        try:
+            conn = self.pool.acquire()
+            cur = conn.cursor()
+            self._insert(cur, rows)
+            conn.commit()
+            cur.close()
+            self.pool.release(conn)
+        except Exception as e:
+            logging.error(f"Tick flush failed ({len(rows)} rows): {e}")
+            if conn is not None:
+                if isinstance(e, ROW_ERRORS):
+                    try:
+                        conn.rollback()
+                        self.pool.release(conn)
+                    except Exception:
+                        self.pool.release(conn, broken=True)
+                else:
+                    self.pool.release(conn, broken=True)
+            self._count(flush_errors=1)
+            if not isinstance(e, ROW_ERRORS):
+                self._retry_at = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, 30.0)
+            return e
+        elapsed = time.perf_counter() - t0
+        self._backoff = 0.5
+        with self._stats_lock:
+            self.stats['flushes'] += 1
+            self.stats['rows_written'] += len(rows)
+            self.stats['write_time_total'] += elapsed
+            self.stats['flush_latency_last'] = elapsed
+            self.stats['flush_latency_max'] = max(self.stats['flush_latency_max'], elapsed)
+        return None
+
+    def _insert(self, cur, rows):
+        cols = ", ".join(COLUMNS)
+        for row in rows:
+            if len(row) != len(COLUMNS):
+                raise ValueError(f"Tick row has {len(row)} fields: {row!r}")
+        if self.dialect == 'sqlite':
+            cur.executemany(f"INSERT INTO {self.table} ({cols}) VALUES (?, ?, ?, ?)", rows)
+        elif self.method == 'copy':
+            data = io.StringIO()
+            for row in rows:
+                data.write("\t".join(map(_copy_field, row)) + "\n")
+            data.seek(0)
+            cur.copy_from(data, self.table, columns=COLUMNS)
+        else:
+            execute_values(cur, f"INSERT INTO {self.table} ({cols}) VALUES %s", rows, page_size=len(rows))
+
+    # --- spill file ---
+    def _spill(self, rows):
+        if not rows:
+            return
+        with self._spill_lock:
+            with open(self.spill_path, 'a') as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self._count(rows_spilled=len(rows))
+
+    def _dead_letter(self, rejected):
+        if not rejected:
+            return
+        with open(self.dead_letter_path, 'a') as f:
+            for row, error in rejected:
+                f.write(json.dumps({"row": row, "error": error}, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._count(rows_rejected=len(rejected))
+        logging.error(f"{len(rejected)} tick rows rejected, see {self.dead_letter_path}")
+
+    def _replay(self):
+        # Batches in file order; rejected rows go to the dead-letter file. If the
+        # DB fails part way, the spill file is atomically cut down to the rows not
+        # yet handled, so committed rows are never replayed twice.
+        with self._spill_lock:
+            rows, rejected = [], []
+            with open(self.spill_path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        rows.append(tuple(json.loads(line)))
+                    except ValueError as e:  # torn last line after a crash
+                        rejected.append((line.rstrip("\n"), repr(e)))
+            done = 0
+            while done < len(rows):
+                batch = rows[done:done + self.batch_size]
+                n = self._write_rows(batch, rejected)
+                done += n
+                if n < len(batch):
+                    break
+            self._dead_letter(rejected)
+            replayed = done - sum(1 for r, _ in rejected if isinstance(r, tuple))
+            self._count(rows_replayed=replayed)
+            if done < len(rows):
+                tmp = self.spill_path + '.tmp'
+                with open(tmp, 'w') as f:
+                    for row in rows[done:]:
+                        f.write(json.dumps(row, default=str) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.spill_path)
+                return False
+            os.remove(self.spill_path)
+        return True
+
+    def get_stats(self):
+        with self._stats_lock:
+            out = dict(self.stats)
+        out['buffered'] = len(self._buf)
+        out['rows_per_sec'] = out['rows_written'] / out['write_time_total'] if out['write_time_total'] else 0.0
+        out['flush_latency_avg'] = out['write_time_total'] / out['flushes'] if out['flushes'] else 0.0
+        return out
+
+_default_writer = None
+_writer_lock = threading.Lock()
+
+def get_tick_writer():
+    global _default_writer
+    with _writer_lock:
+        if _default_writer is None:
+            _default_writer = TickWriter().start()
+        return _default_writer
+
 def store_tick(symbol, ts, price, volume):
-    conn = psycopg2.connect(dbname='trading', user='user', password='pass', host='localhost')
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO ticks (symbol, ts, price, volume) VALUES (%s, %s, %s, %s)",
-        (symbol, ts, price, volume))
-    conn.commit()
-    cur.close()
-    conn.close()
\ No newline at end of file
+    get_tick_writer().write(symbol, ts, price, volume)
@@ -1,25 +1,181 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 import numpy as np
+import pandas as pd
+
+# Signals are +1 Buy / -1 Sell / 0 Hold, as in rsi_signal_matrix. Ties in a
+# vote go to Hold, then Buy, then Sell.
+CODES = {'Buy': 1, 'Sell': -1, 'Hold': 0}
+LABELS = np.array(['Sell', 'Hold', 'Buy'], dtype=object)  # indexed by code + 1
+_VOTE_ORDER = np.array([0, 1, -1], dtype=np.int8)
+
+def vectorized(signals_fn, func=None):
+    # Declares a strategy's whole-history form: signals_fn(df) returns one signal
+    # (code or label) per bar. func is the per-bar form df -> label; by default
+    # it is the last bar of signals_fn. Returns a new callable carrying both, so
+    # func itself (a bound method, a shared function) is never modified.
+    if func is None:
+        func = lambda df: LABELS[int(to_codes(signals_fn(df))[-1]) + 1] if len(df) else 'Hold'
+    def strategy(df):
+        return func(df)
+    strategy.__name__ = getattr(func, "__name__", type(func).__name__)
+    strategy.vectorized = signals_fn
+    return strategy
+
+def to_codes(signals):
+    signals = np.asarray(signals)
+    if signals.dtype.kind in "OUS":
+        return np.array([CODES.get(s, 0) for s in signals.ravel()], dtype=np.int8).reshape(signals.shape)
+    return np.nan_to_num(np.sign(signals.astype(float))).astype(np.int8)
+
+def vote(signals, valid=None, weights=None):
+    # (strategies, bars) codes -> (bars,) codes. Majority vote, or the class with
+    # the largest summed weight; rows not in valid (failed strategies) are ignored.
+    signals = np.asarray(signals, dtype=np.int8)
+    w = np.ones(signals.shape[0]) if weights is None else np.asarray(weights, dtype=float)
+    if valid is not None:
+        w = np.where(valid, w, 0.)
+    scores = np.stack([w @ (signals == c) for c in _VOTE_ORDER])  # (3, bars)
+    return _VOTE_ORDER[np.argmax(scores, axis=0)]
 
 class StrategyEnsemble:
-    def __init__(self, strategies):
+    # Strategies are per-bar functions df -> 'Buy'/'Sell'/'Hold' (or ML models
+    # called the same way), optionally with a .vectorized form (see vectorized())
+    # giving a signal for every bar in one call. Whole-history evaluation builds a
+    # (strategies x bars) matrix and votes over it with NumPy; strategies without
+    # a vectorized form fall back to one call per bar prefix. Strategies run on a
+    # thread pool when the last evaluation took longer than parallel_threshold_s,
+    # each bounded by timeout seconds; failures and timeouts are recorded per
+    # strategy (get_stats) and left out of the vote. A timed-out call is abandoned,
+    # not killed: its thread finishes in the background, and that strategy is
+    # skipped (counted as a timeout) until it does, so it never queues up twice.
+    def __init__(self, strategies, weights=None, max_workers=None, timeout=None, parallel_threshold_s=0.005):
         # strategies is a list of functions or ML models
         self.strategies = strategies
+        self.weights = weights
+        self.timeout = timeout
+        self.parallel_threshold_s = parallel_threshold_s
+        self.max_workers = max_workers or min(32, max(len(strategies), 1))
+        self._pool = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.names = [getattr(s, "__name__", type(s).__name__) + f"#{i}" for i, s in enumerate(strategies)]
+        self.stats = {name: {"runs": 0, "errors": 0, "timeouts": 0, "last_error": None, "last_runtime": None}
+                      for name in self.names}
+        self._last_total = None
+
+    def _evaluate(self, strat, df, last_only):
+        t0 = time.perf_counter()
+        vec = getattr(strat, "vectorized", None)
+        if vec is not None:
+            codes = to_codes(vec(df)).reshape(-1)
+            if len(codes) != len(df):
+                raise ValueError(f"vectorized form returned {len(codes)} signals for {len(df)} bars")
+            if last_only:
+                codes = codes[-1:]
+        elif last_only:
+            codes = to_codes([strat(df)])
+        else:
+            codes = to_codes([strat(df.iloc[:i + 1]) for i in range(len(df))])
+        return codes, time.perf_counter() - t0
+
+    def _record(self, i, runtime=None, error=None, timed_out=False):
+        st = self.stats[self.names[i]]
+        with self._lock:
+            st["runs"] += 1
+            if runtime is not None:
+                st["last_runtime"] = runtime
+            if error is not None:
+                st["errors" if not timed_out else "timeouts"] += 1
+                st["last_error"] = error
+        if error is not None:
+            logging.warning(f"Ensemble strategy {self.names[i]} failed: {error}")
+
+    def signal_matrix(self, df, last_only=False):
+        # -> (codes (strategies, bars), valid (strategies,)); bars is 1 with last_only
+        n = 1 if last_only else len(df)
+        signals = np.zeros((len(self.strategies), n), dtype=np.int8)
+        valid = np.zeros(len(self.strategies), dtype=bool)
+        t0 = time.perf_counter()
+        parallel = len(self.strategies) > 1 and self.max_workers > 1 and \
+            (self._last_total is None or self._last_total > self.parallel_threshold_s or self.timeout)
+        if parallel:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ensemble")
+            results = []
+            futures = {}
+            for i, s in enumerate(self.strategies):
+                prev = self._inflight.get(i)
+                if prev is not None and not prev.done():
+                    self._record(i, error="previous call still running", timed_out=True)
+                    continue
+                futures[i] = self._inflight[i] = self._pool.submit(self._evaluate, s, df, last_only)
+            deadline = None if self.timeout is None else time.monotonic() + self.timeout
+            for i, fut in futures.items():
+                try:
+                    left = None if deadline is None else max(0., deadline - time.monotonic())
+                    results.append((i, fut.result(timeout=left), None))
+                except FutureTimeout:
+                    fut.cancel()
+                    self._record(i, error=f"timed out after {self.timeout}s", timed_out=True)
+                except Exception as e:
+                    results.append((i, None, repr(e)))
+        else:
+            results = []
+            for i, s in enumerate(self.strategies):
+                try:
+                    results.append((i, self._evaluate(s, df, last_only), None))
+                except Exception as e:
+                    results.append((i, None, repr(e)))
+        for i, res, error in results:
+            if error is not None:
+                self._record(i, error=error)
+                continue
+            codes, runtime = res
+            signals[i] = codes
+            valid[i] = True
+            self._record(i, runtime)
+        self._last_total = time.perf_counter() - t0
+        return signals, valid
+
+    def _weights(self, weights):
+        weights = self.weights if weights is None else weights
+        return weights if weights is not None and len(weights) == len(self.strategies) else None
+
+    def predict_all(self, df, weights=None):
+        # Ensemble signal for every bar, as a Series of labels aligned with df
+        signals, valid = self.signal_matrix(df)
+        return pd.Series(LABELS[vote(signals, valid, self._weights(weights)) + 1], index=df.index)
 
     def predict(self, df):
-        votes = []
-        for strat in self.strategies:
-            try:
-                votes.append(strat(df))
-            except Exception:
-                pass
         # Majority vote or weighted if available
-        return max(set(votes), key = votes.count) if votes else 'Hold'
+        if not self.strategies:
+            return 'Hold'
+        signals, valid = self.signal_matrix(df, last_only=True)
+        return LABELS[int(vote(signals, valid, self._weights(None))[0]) + 1]
 
     def weighted_predict(self, df, weights=None):
-        if not weights or len(weights)!=len(self.strategies):
+        if self._weights(weights) is None:
             return self.predict(df)
-        preds = [strat(df) for strat in self.strategies]
-        choices = {'Buy':0, 'Sell':0, 'Hold':0}
-        for p, w in zip(preds, weights):
-            choices[p] += w
-        return max(choices, key=choices.get)
\ No newline at end of file
+        signals, valid = self.signal_matrix(df, last_only=True)
+        return LABELS[int(vote(signals, valid, self._weights(weights))[0]) + 1]
+
+    def backtest(self, df, weights=None):
+        # Long-only backtest of the ensemble's per-bar signal (see vectorized_backtest)
+        from ml_strategy_optimizer import vectorized_backtest
+        signals, valid = self.signal_matrix(df)
+        combined = vote(signals, valid, self._weights(weights))[None, :]
+        profit, win_rate, trades = vectorized_backtest(df["Close"].values.astype(float), combined)
+        return {"profit": float(profit[0]), "win_rate": float(win_rate[0]), "trades": int(trades[0]),
+                "failed": [self.names[i] for i in np.flatnonzero(~valid)]}
+
+    def get_stats(self):
+        with self._lock:
+            return {name: dict(st) for name, st in self.stats.items()}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
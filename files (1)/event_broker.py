@@ -1,21 +1,694 @@
-import redis
-import threading
+import os
 import json
+import time
+import fcntl
+import mmap
+import socket
+import struct
+import logging
+import tempfile
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+import redis
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- wire format ---
+# b'\x01' + msgpack, or b'\x02' + JSON (orjson when available). Payloads with
+# neither marker are read as plain JSON, so older publishers keep working.
+MSGPACK, JSON = b'\x01', b'\x02'
+
+def _ns(values):
+    # datetime values -> (int64 ns since epoch as a list, tz name or None)
+    values = pd.DatetimeIndex(values)
+    return values.as_unit('ns').asi8.tolist(), str(values.tz) if values.tz is not None else None
+
+def _dt(ns, tz):
+    values = pd.to_datetime(ns, unit='ns', utc=tz is not None)
+    return values.tz_convert(tz) if tz is not None else values
+
+def _to_builtin(obj):
+    if isinstance(obj, pd.DataFrame):
+        cols, dt_cols = {}, {}
+        for c in obj.columns:
+            s = obj[c]
+            if pd.api.types.is_datetime64_any_dtype(s):
+                cols[str(c)], dt_cols[str(c)] = _ns(s)
+            else:
+                cols[str(c)] = s.tolist()
+        out = {"__frame__": 1, "columns": list(cols), "data": cols, "dt_columns": dt_cols}
+        if isinstance(obj.index, pd.DatetimeIndex):
+            out["index"], out["index_tz"] = _ns(obj.index)
+            out["dt_index"] = True
+        else:
+            out["index"], out["dt_index"] = obj.index.tolist(), False
+        return out
+    if isinstance(obj, pd.Series):
+        return _to_builtin(obj.to_frame())
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+def _from_builtin(obj):
+    if isinstance(obj, dict) and obj.get("__frame__") == 1:
+        df = pd.DataFrame(obj["data"], columns=obj["columns"])
+        for c, tz in obj["dt_columns"].items():
+            df[c] = _dt(obj["data"][c], tz)  # from the raw list: Series.tz_convert would act on the index
+        df.index = _dt(obj["index"], obj["index_tz"]) if obj["dt_index"] else obj["index"]
+        return df
+    return obj
+
+def encode(data, codec=None):
+    codec = codec or ("msgpack" if msgpack is not None else "json")
+    if codec == "msgpack":
+        return MSGPACK + msgpack.packb(data, default=_to_builtin, use_bin_type=True)
+    if orjson is not None:
+        return JSON + orjson.dumps(data, default=_to_builtin, option=orjson.OPT_SERIALIZE_NUMPY)
+    return JSON + json.dumps(data, default=_to_builtin).encode()
+
+def decode(raw):
+    if isinstance(raw, str):
+        raw = raw.encode()
+    head, body = raw[:1], raw[1:]
+    if head == MSGPACK:
+        return _from_builtin(msgpack.unpackb(body, raw=False))
+    if head != JSON:
+        body = raw
+    return _from_builtin(orjson.loads(body) if orjson is not None else json.loads(body))
+
+class RedisTransport:
+    # Cross-node event bus. publish() only buffers; a flusher thread sends buffered
+    # events through one non-transactional pipeline per batch_size events or
+    # flush_interval seconds after the first buffered event (it sleeps while the
+    # buffer is empty). While Redis is unreachable the buffer holds at most
+    # max_buffer events, dropping the oldest. Subscriptions share one connection
+    # owned by a single listener thread, which also applies (un)subscribe
+    # requests, and dispatches to handlers by channel.
+    #
+    # mode='streams' uses Redis Streams instead of pub/sub: events are XADDed
+    # (trimmed to about maxlen), and subscribers join a consumer group, so each
+    # event goes to one worker of the group, is acknowledged after the handler
+    # returns, and is redelivered (its own pending list first, then XAUTOCLAIM
+    # of entries idle for claim_idle_ms) if a worker dies before acking. An entry
+    # claimed more than max_deliveries times is moved to the '<stream>:dead'
+    # stream and acked instead of crashing workers forever.
+    def __init__(self, host='localhost', client=None, mode='pubsub', codec=None, batch_size=500,
+                 flush_interval=0.002, maxlen=100_000, group='workers', consumer=None, claim_idle_ms=60_000,
+                 max_buffer=100_000, max_deliveries=5):
+        self.r = client or redis.Redis(host=host)
+        self.mode = mode
+        self.codec = codec
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.maxlen = maxlen
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.claim_idle_ms = claim_idle_ms
+        self.max_buffer = max_buffer
+        self.max_deliveries = max_deliveries
+        self._buf = deque(maxlen=max_buffer)
+        self._cond = threading.Condition()
+        self._flusher = None
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._pubsub = None
+        self._requests = deque()  # (op, channel, done) for the listener thread
+        self._listener = None
+        self._stop = threading.Event()
+        self.stats = {"published": 0, "batches": 0, "delivered": 0, "errors": 0, "acked": 0, "claimed": 0,
+                      "dropped": 0, "dead_lettered": 0}
+
+    # --- publishing ---
+    def publish(self, channel, data):
+        payload = encode(data, self.codec)
+        with self._cond:
+            if len(self._buf) == self.max_buffer:
+                self.stats["dropped"] += 1
+            self._buf.append((channel, payload))
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+            if len(self._buf) == 1 or len(self._buf) >= self.batch_size:
+                self._cond.notify()
+
+    def publish_many(self, channel, items):
+        for data in items:
+            self.publish(channel, data)
+
+    def _send(self, batch):
+        pipe = self.r.pipeline(transaction=False)
+        for channel, payload in batch:
+            if self.mode == 'streams':
+                pipe.xadd(channel, {"d": payload}, maxlen=self.maxlen, approximate=True)
+            else:
+                pipe.publish(channel, payload)
+        pipe.execute()
+        self.stats["published"] += len(batch)
+        self.stats["batches"] += 1
+
+    def flush(self):
+        with self._cond:
+            batch = list(self._buf)
+            self._buf.clear()
+        if batch:
+            try:
+                self._send(batch)
+            except redis.RedisError as e:
+                self.stats["errors"] += 1
+                logging.error(f"Event publish of {len(batch)} failed: {e}")
+                with self._cond:
+                    # Failed batch goes back in front of newer events; past max_buffer the oldest go
+                    merged = batch + list(self._buf)
+                    self.stats["dropped"] += max(0, len(merged) - self.max_buffer)
+                    self._buf.clear()
+                    self._buf.extend(merged[-self.max_buffer:])
+                raise
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            with self._cond:
+                while not self._buf and not self._stop.is_set():
+                    self._cond.wait()
+                if len(self._buf) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+            try:
+                self.flush()
+            except redis.RedisError:
+                self._stop.wait(min(1.0, self.flush_interval * 100))
+
+    # --- pub/sub subscriptions ---
+    def subscribe(self, channel, handler, timeout=5.0):
+        with self._lock:
+            first = channel not in self._handlers
+            self._handlers.setdefault(channel, []).append(handler)
+        if self.mode == 'streams':
+            if first:
+                self._ensure_group(channel)
+            self._start_listener(self._stream_loop)
+            return
+        if first:
+            self._request("subscribe", channel, timeout)
+
+    def unsubscribe(self, channel, timeout=5.0):
+        with self._lock:
+            self._handlers.pop(channel, None)
+        if self.mode != 'streams':
+            self._request("unsubscribe", channel, timeout)
+
+    def _request(self, op, channel, timeout):
+        # PubSub connections are not thread-safe: the listener thread applies the
+        # request; wait (up to timeout) so events published after return arrive
+        done = threading.Event()
+        self._requests.append((op, channel, done))
+        self._start_listener(self._pubsub_loop)
+        if threading.current_thread() is not self._listener:
+            done.wait(timeout)
+
+    def _apply_requests(self):
+        while self._requests:
+            op, channel, done = self._requests[0]
+            if self._pubsub is None:
+                self._pubsub = self.r.pubsub(ignore_subscribe_messages=True)
+            getattr(self._pubsub, op)(channel)  # on RedisError the request stays queued
+            self._requests.popleft()
+            done.set()
+
+    def _start_listener(self, target):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=target, daemon=True)
+                self._listener.start()
+
+    def _dispatch(self, channel, raw):
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        handlers = self._handlers.get(channel, ())
+        try:
+            data = decode(raw)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logging.error(f"Undecodable event on {channel}: {e}")
+            return True  # acknowledged anyway: redelivery cannot fix it
+        ok = True
+        for handler in handlers:
+            try:
+                handler(data)
+                self.stats["delivered"] += 1
+            except Exception as e:
+                ok = False
+                self.stats["errors"] += 1
+                logging.error(f"Event handler for {channel} failed: {e}")
+        return ok
+
+    def _pubsub_loop(self, poll=0.25):
+        # poll bounds how long a queued (un)subscribe waits for the listener
+        while not self._stop.is_set():
+            try:
+                self._apply_requests()
+                if self._pubsub is None or not self._pubsub.subscribed:
+                    self._stop.wait(poll)
+                    continue
+                m = self._pubsub.get_message(timeout=poll)
+            except redis.RedisError as e:
+                logging.warning(f"Event listener error: {e}")
+                time.sleep(1.0)
+                continue
+            if m and m.get('type') == 'message':
+                self._dispatch(m['channel'], m['data'])
+
+    # --- streams ---
+    def _ensure_group(self, stream):
+        try:
+            self.r.xgroup_create(stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _process(self, stream, entries):
+        acks = []
+        for entry_id, fields in entries:
+            if fields is None:  # entry trimmed away while pending
+                acks.append(entry_id)
+                continue
+            if self._dispatch(stream, fields.get(b"d", fields.get("d"))):
+                acks.append(entry_id)
+        if acks:
+            self.r.xack(stream, self.group, *acks)
+            self.stats["acked"] += len(acks)
+
+    def _dead_letter(self, stream, claimed):
+        # Claimed entries past max_deliveries go to '<stream>:dead' and are acked;
+        # returns the rest. XAUTOCLAIM has already counted this delivery.
+        if not claimed:
+            return claimed
+        pending = self.r.xpending_range(stream, self.group, min=claimed[0][0], max=claimed[-1][0],
+                                        count=len(claimed), consumername=self.consumer)
+        times = {p["message_id"]: p["times_delivered"] for p in pending}
+        keep, dead = [], []
+        for entry_id, fields in claimed:
+            if fields is not None and times.get(entry_id, 0) > self.max_deliveries:
+                dead.append((entry_id, fields))
+            else:
+                keep.append((entry_id, fields))
+        if dead:
+            pipe = self.r.pipeline(transaction=False)
+            for entry_id, fields in dead:
+                eid = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+                pipe.xadd(f"{stream}:dead", dict(fields, id=eid, deliveries=times[entry_id]),
+                          maxlen=self.maxlen, approximate=True)
+            pipe.xack(stream, self.group, *[entry_id for entry_id, _ in dead])
+            pipe.execute()
+            self.stats["dead_lettered"] += len(dead)
+            logging.error(f"{len(dead)} events on {stream} failed {self.max_deliveries} deliveries, "
+                          f"moved to {stream}:dead")
+        return keep
+
+    def _stream_loop(self, count=100, block_ms=1000):
+        # Replay this consumer's unacked entries first (walking its pending list by
+        # id, so a failing handler cannot pin the loop), then read new ones
+        cursor = {}
+        last_claim = 0.0
+        while not self._stop.is_set():
+            streams = list(self._handlers)
+            if not streams:
+                time.sleep(0.1)
+                continue
+            try:
+                if time.monotonic() - last_claim > self.claim_idle_ms / 1000.0:
+                    last_claim = time.monotonic()
+                    for stream in streams:
+                        # XAUTOCLAIM scans the PEL `count` entries at a time; follow its
+                        # cursor until it wraps to 0-0 so one pass covers every idle entry
+                        start = '0-0'
+                        while True:
+                            start, claimed, *_ = self.r.xautoclaim(stream, self.group, self.consumer,
+                                                                   self.claim_idle_ms, start_id=start, count=count)
+                            self.stats["claimed"] += len(claimed)
+                            self._process(stream, self._dead_letter(stream, claimed))
+                            if start in ('0-0', b'0-0'):
+                                break
+                for stream in streams:
+                    cursor.setdefault(stream, '0')
+                replaying = any(c != '>' for c in cursor.values())
+                resp = self.r.xreadgroup(self.group, self.consumer, {s: cursor[s] for s in streams}, count=count,
+                                         block=None if replaying else block_ms)
+                got = {}
+                for stream, entries in resp or []:
+                    stream = stream.decode() if isinstance(stream, bytes) else stream
+                    got[stream] = entries
+                    self._process(stream, entries)
+                for stream in streams:
+                    if cursor[stream] != '>':
+                        entries = got.get(stream)
+                        cursor[stream] = entries[-1][0] if entries else '>'
+
+            except redis.RedisError as e:
+                logging.warning(f"Event stream consumer error: {e}")
+                time.sleep(1.0)
+
+    def replay(self, stream, start='-', end='+', count=None):
+        # Decoded events already in the stream, e.g. to rebuild state after a restart
+        return [(entry_id, decode(fields[b"d"] if b"d" in fields else fields["d"]))
+                for entry_id, fields in self.r.xrange(stream, start, end, count=count)]
+
+    def close(self):
+        self.flush()
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for t in (self._flusher, self._listener):
+            if t is not None:
+                t.join(timeout=2)
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+    def get_stats(self):
+        out = dict(self.stats)
+        out["buffered"] = len(self._buf)
+        out["channels"] = len(self._handlers)
+        return out
+
+class InProcessTransport:
+    # Same-process bus: published objects reach handlers as-is, with no encoding
+    # and no copy. Each broker owns a bounded deque (appends are atomic under the
+    # GIL, so publishers take no lock) drained by one dispatcher thread; when a
+    # subscriber falls maxsize events behind, its oldest events are dropped.
+    _bus = {}  # channel -> tuple of subscribed transports, replaced on change
+    _bus_lock = threading.Lock()
+
+    def __init__(self, maxsize=100_000, **_):
+        self._q = deque(maxlen=maxsize)
+        self._wake = threading.Event()
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {"published": 0, "delivered": 0, "errors": 0, "dropped": 0}
+
+    def publish(self, channel, data):
+        self.stats["published"] += 1
+        for t in InProcessTransport._bus.get(channel, ()):
+            q = t._q
+            if len(q) == q.maxlen:
+                t.stats["dropped"] += 1
+            q.append((channel, data))
+            if not t._wake.is_set():
+                t._wake.set()
+
+    def subscribe(self, channel, handler):
+        with self._lock:
+            self._handlers.setdefault(channel, []).append(handler)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        with InProcessTransport._bus_lock:
+            subs = InProcessTransport._bus.get(channel, ())
+            if self not in subs:
+                InProcessTransport._bus[channel] = subs + (self,)
+
+    def unsubscribe(self, channel):
+        with self._lock:
+            self._handlers.pop(channel, None)
+        with InProcessTransport._bus_lock:
+            subs = tuple(t for t in InProcessTransport._bus.get(channel, ()) if t is not self)
+            InProcessTransport._bus[channel] = subs
+
+    def _run(self):
+        q = self._q
+        while not self._stop.is_set():
+            self._wake.wait(0.5)
+            self._wake.clear()
+            while q:
+                channel, data = q.popleft()
+                for handler in self._handlers.get(channel, ()):
+                    try:
+                        handler(data)
+                        self.stats["delivered"] += 1
+                    except Exception as e:
+                        self.stats["errors"] += 1
+                        logging.error(f"Event handler for {channel} failed: {e}")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        for channel in list(self._handlers):
+            self.unsubscribe(channel)
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def get_stats(self):
+        out = dict(self.stats)
+        out["queued"] = len(self._q)
+        out["channels"] = len(self._handlers)
+        return out
+
+class ShmRing:
+    # Fixed-slot ring in a memory-mapped file on tmpfs, shared by all processes of
+    # a host. Writers serialise on flock; readers never lock: each slot carries
+    # the sequence number it holds, written last, and is re-checked after the
+    # copy, so a reader that gets lapped notices and skips ahead.
+    #   header: magic u32, pad u32, nslots u64, slot_size u64 | write_seq u64 at 32
+    #   slot:   seq+1 u64, length u32, pad u32, payload
+    MAGIC = 0x45425247
+    HEAD = struct.Struct("<IIQQ")
+    SEQ = struct.Struct("<Q")
+    SLOT = struct.Struct("<QI4x")
+    DATA = 64
+
+    def __init__(self, path, nslots=4096, slot_size=4096):
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+            created = True
+        except FileExistsError:
+            fd = os.open(path, os.O_RDWR)
+            created = False
+        self.fd = fd
+        if created:
+            os.ftruncate(fd, self.DATA + nslots * slot_size)
+            self.mm = mmap.mmap(fd, 0)
+            self.HEAD.pack_into(self.mm, 0, 0, 0, nslots, slot_size)
+            self.HEAD.pack_into(self.mm, 0, self.MAGIC, 0, nslots, slot_size)
+        else:
+            deadline = time.monotonic() + 5
+            while os.fstat(fd).st_size < self.DATA:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Ring {path} was never initialised")
+                time.sleep(0.001)
+            self.mm = mmap.mmap(fd, 0)
+            while self.HEAD.unpack_from(self.mm, 0)[0] != self.MAGIC:
+                time.sleep(0.001)
+        _, _, self.nslots, self.slot_size = self.HEAD.unpack_from(self.mm, 0)
+        self.capacity = self.slot_size - self.SLOT.size
+        self._lock = threading.Lock()
+
+    def write_seq(self):
+        return self.SEQ.unpack_from(self.mm, 32)[0]
+
+    def write(self, payload):
+        if len(payload) > self.capacity:
+            raise ValueError(f"Event of {len(payload)} bytes exceeds ring slot capacity {self.capacity}")
+        with self._lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                seq = self.write_seq()
+                off = self.DATA + (seq % self.nslots) * self.slot_size
+                self.SLOT.pack_into(self.mm, off, 0, len(payload))
+                self.mm[off + self.SLOT.size:off + self.SLOT.size + len(payload)] = payload
+                self.SEQ.pack_into(self.mm, off, seq + 1)
+                self.SEQ.pack_into(self.mm, 32, seq + 1)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def read(self, cursor):
+        # -> (payload or None, next cursor, dropped)
+        head = self.write_seq()
+        if cursor >= head:
+            return None, cursor, 0
+        dropped = 0
+        if head - cursor > self.nslots - 1:
+            dropped = head - cursor - (self.nslots - 1)
+            cursor += dropped
+        off = self.DATA + (cursor % self.nslots) * self.slot_size
+        tag, length = self.SLOT.unpack_from(self.mm, off)
+        if tag != cursor + 1:
+            return None, cursor + (tag > cursor + 1), dropped + (tag > cursor + 1)
+        payload = self.mm[off + self.SLOT.size:off + self.SLOT.size + length]
+        if self.SEQ.unpack_from(self.mm, off)[0] != cursor + 1:
+            return None, cursor + 1, dropped + 1
+        return payload, cursor + 1, dropped
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+class ShmRingTransport:
+    # Same-host, cross-process bus: one ShmRing per channel under directory
+    # (tmpfs /dev/shm by default), events encoded like the Redis transport.
+    # Subscribers start at the current head, like pub/sub, and one poller thread
+    # per broker reads all its rings, backing off while they are idle.
+    def __init__(self, namespace="default", directory=None, nslots=4096, slot_size=4096, codec=None, **_):
+        self.directory = directory or os.environ.get("EVENT_SHM_DIR") or \
+            ("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+        self.namespace = namespace
+        self.nslots = nslots
+        self.slot_size = slot_size
+        self.codec = codec
+        self._rings = {}
+        self._cursors = {}
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {"published": 0, "delivered": 0, "errors": 0, "dropped": 0}
+
+    def path(self, channel):
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in channel)
+        return os.path.join(self.directory, f"eventbus-{self.namespace}-{safe}.ring")
+
+    def ring(self, channel):
+        ring = self._rings.get(channel)
+        if ring is None:
+            with self._lock:
+                ring = self._rings.get(channel)
+                if ring is None:
+                    ring = self._rings[channel] = ShmRing(self.path(channel), self.nslots, self.slot_size)
+        return ring
+
+    def publish(self, channel, data):
+        self.ring(channel).write(encode(data, self.codec))
+        self.stats["published"] += 1
+
+    def subscribe(self, channel, handler):
+        ring = self.ring(channel)
+        with self._lock:
+            if channel not in self._handlers:
+                self._cursors[channel] = ring.write_seq()
+            self._handlers.setdefault(channel, []).append(handler)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, channel):
+        with self._lock:
+            self._handlers.pop(channel, None)
+            self._cursors.pop(channel, None)
+
+    def _run(self):
+        idle = 0.0
+        while not self._stop.is_set():
+            got = False
+            for channel in list(self._cursors):
+                ring = self._rings[channel]
+                cursor = self._cursors.get(channel)
+                while cursor is not None:
+                    payload, cursor, dropped = ring.read(cursor)
+                    self.stats["dropped"] += dropped
+                    if payload is None and not dropped:
+                        break
+                    self._cursors[channel] = cursor
+                    if payload is None:
+                        continue
+                    got = True
+                    try:
+                        data = decode(payload)
+                    except Exception as e:
+                        self.stats["errors"] += 1
+                        logging.error(f"Undecodable event on {channel}: {e}")
+                        continue
+                    for handler in self._handlers.get(channel, ()):
+                        try:
+                            handler(data)
+                            self.stats["delivered"] += 1
+                        except Exception as e:
+                            self.stats["errors"] += 1
+                            logging.error(f"Event handler for {channel} failed: {e}")
+            if got:
+                idle = 0.0
+            else:
+                idle = min(0.001, idle * 2 or 0.00005)
+                time.sleep(idle)
+
+    def flush(self):
+        pass
+
+    def unlink(self, channel):
+        try:
+            os.unlink(self.path(channel))
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        for ring in self._rings.values():
+            ring.close()
+        self._rings = {}
+
+    def get_stats(self):
+        out = dict(self.stats)
+        out["channels"] = len(self._handlers)
+        return out
+
+TRANSPORTS = {"redis": RedisTransport, "inproc": InProcessTransport, "shm": ShmRingTransport}
 
 class EventBroker:
-    def __init__(self, host='localhost'):
-        self.r = redis.Redis(host=host)
-        self.pubsub = self.r.pubsub()
+    # publish/subscribe facade over a transport: 'redis' (cross-node, see
+    # RedisTransport for the Streams mode), 'shm' (processes on one host) or
+    # 'inproc' (one process). Handlers get the same decoded objects either way.
+    def __init__(self, host='localhost', transport='redis', **kwargs):
+        if transport == 'redis':
+            kwargs['host'] = host
+        self.transport_name = transport
+        self.transport = TRANSPORTS[transport](**kwargs)
 
     def publish(self, channel, data):
-        self.r.publish(channel, json.dumps(data))
+        self.transport.publish(channel, data)
+
+    def publish_many(self, channel, items):
+        for data in items:
+            self.transport.publish(channel, data)
 
     def subscribe(self, channel, handler):
-        def listen():
-            self.pubsub.subscribe(channel)
-            for message in self.pubsub.listen():
-                if message['type'] == 'message':
-                    handler(json.loads(message['data']))
-        t = threading.Thread(target=listen)
-        t.daemon = True
-        t.start()
\ No newline at end of file
+        self.transport.subscribe(channel, handler)
+
+    def unsubscribe(self, channel):
+        self.transport.unsubscribe(channel)
+
+    def flush(self):
+        self.transport.flush()
+
+    def close(self):
+        self.transport.close()
+
+    def get_stats(self):
+        return dict(self.transport.get_stats(), transport=self.transport_name)
+
+    def __getattr__(self, name):
+        # Transport-specific extras, e.g. replay() in Redis Streams mode
+        return getattr(self.transport, name)
+
+_default_broker = None
+
+def get_event_broker(host=None, mode=None, transport=None):
+    global _default_broker
+    if _default_broker is None:
+        transport = transport or os.environ.get("EVENT_TRANSPORT", "redis")
+        kwargs = {"mode": mode or os.environ.get("EVENT_MODE", "pubsub")} if transport == "redis" else {}
+        _default_broker = EventBroker(host or os.environ.get("REDIS_HOST", "localhost"), transport=transport, **kwargs)
+    return _default_broker
@@ -1,8 +1,17 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import openai
 import pandas as pd
 
 NEWS_API_KEY = "38ede88b65c442b5b27cd6ef6bedd6b9"
+LABELS = ("positive", "negative", "neutral")
 
 def get_events(symbol):
     # Gets economic events/earnings - extend as needed
@@ -18,14 +27,149 @@ def get_headlines(symbol, count=5):
     except Exception:
         return []
 
-def sentiment_score(texts):
-    results = []
-    for txt in texts:
+def _label(text):
+    # First whole word that is a label; hyphenated words stay one word, so
+    # "non-negative" is not "negative"
+    for word in re.findall(r"[a-z]+(?:-[a-z]+)*", text.lower()):
+        if word in LABELS:
+            return word
+    return "neutral"
+
+# --- backends: score_batch(texts) -> one label per text ---
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(self, model="text-davinci-003", batch_size=20):
+        self.model = model
+        self.batch_size = batch_size
+
+    def score_one(self, txt):
         response = openai.Completion.create(
-            model="text-davinci-003", prompt=f"Is this news positive, negative, or neutral? Headline: {txt}", max_tokens=15
+            model=self.model, prompt=f"Is this news positive, negative, or neutral? Headline: {txt}", max_tokens=15
         )
-        results.append(response.choices[0].text.strip())
-    return results
+        return _label(response.choices[0].text)
+
+    def score_batch(self, texts):
+        # One completion for the whole batch, answered as numbered lines
+        numbered = "\n".join(f"{i + 1}. {t}" for i, t in enumerate(texts))
+        prompt = ("For each numbered headline answer positive, negative, or neutral, "
+                  f"one per line as '<number>. <label>'.\n{numbered}\nAnswers:\n")
+        response = openai.Completion.create(model=self.model, prompt=prompt, max_tokens=8 * len(texts) + 16)
+        answers = {}
+        for line in response.choices[0].text.splitlines():
+            m = re.match(r"\s*(\d+)[.):]\s*(\w+)", line)
+            if m:
+                answers[int(m.group(1))] = _label(m.group(2))
+        if len(answers) < len(texts):
+            # Malformed batch answer: fall back to one call per missing headline
+            return [answers.get(i + 1) or self.score_one(t) for i, t in enumerate(texts)]
+        return [answers[i + 1] for i in range(len(texts))]
+
+class KeywordBackend:
+    # Local lexicon scorer; no network, handy as a fallback and in tests
+    name = "keyword"
+    batch_size = 256
+    POSITIVE = {"beat", "beats", "surge", "surges", "gain", "gains", "rally", "record", "upgrade", "growth", "profit", "soar", "soars", "jump", "jumps"}
+    NEGATIVE = {"miss", "misses", "fall", "falls", "drop", "drops", "plunge", "plunges", "downgrade", "loss", "lawsuit", "probe", "cut", "cuts", "slump"}
+
+    def score_batch(self, texts):
+        out = []
+        for t in texts:
+            words = set(re.findall(r"[a-z]+", t.lower()))
+            score = len(words & self.POSITIVE) - len(words & self.NEGATIVE)
+            out.append("positive" if score > 0 else "negative" if score < 0 else "neutral")
+        return out
+
+class SentimentCache:
+    # sqlite table keyed by sha1(backend id + normalised headline), entries expire after ttl seconds
+    def __init__(self, path="data/sentiment_cache.sqlite", ttl=7 * 86400):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS sentiment (key TEXT PRIMARY KEY, label TEXT, created REAL)")
+        self.conn.commit()
+
+    @staticmethod
+    def key(backend_name, text):
+        return hashlib.sha1(f"{backend_name}\x00{' '.join(text.split()).lower()}".encode()).hexdigest()
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT key, label FROM sentiment WHERE created >= ? AND key IN ({','.join('?' * len(keys))})",
+                [cutoff, *keys]).fetchall()
+        return dict(rows)
+
+    def put_many(self, items):
+        now = time.time()
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO sentiment (key, label, created) VALUES (?, ?, ?)",
+                                  [(k, v, now) for k, v in items.items()])
+            self.conn.commit()
+
+class SentimentPipeline:
+    # Dedupes headlines, serves cached labels, and scores the rest in batches with
+    # at most max_concurrency backend calls in flight. A batch whose backend call
+    # fails is answered neutral and not cached; the other batches are unaffected.
+    # Cache keys include the backend's model, so switching models rescores.
+    def __init__(self, backend=None, cache=None, max_concurrency=4):
+        self.backend = backend or OpenAIBackend()
+        self.cache = cache or SentimentCache()
+        self.max_concurrency = max_concurrency
+        self.backend_id = f"{self.backend.name}:{getattr(self.backend, 'model', '')}"
+        self.stats = {"requested": 0, "cache_hits": 0, "scored": 0, "batches": 0, "failed": 0}
+
+    def _score_batch(self, texts):
+        try:
+            return self.backend.score_batch(texts)
+        except Exception as e:
+            logging.error(f"Sentiment batch of {len(texts)} failed, marking neutral: {e}")
+            return None
+
+    def score(self, texts):
+        texts = list(texts)
+        self.stats["requested"] += len(texts)
+        keys = [SentimentCache.key(self.backend_id, t) for t in texts]
+        labels = self.cache.get_many(list(set(keys)))
+        self.stats["cache_hits"] += sum(1 for k in keys if k in labels)
+        todo = {}
+        for k, t in zip(keys, texts):
+            if k not in labels:
+                todo.setdefault(k, t)
+        if todo:
+            items = list(todo.items())
+            size = max(1, getattr(self.backend, "batch_size", 20))
+            batches = [items[i:i + size] for i in range(0, len(items), size)]
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                results = pool.map(lambda b: self._score_batch([t for _, t in b]), batches)
+                scored, failed = {}, {}
+                for batch, out in zip(batches, results):
+                    if out is None:
+                        failed.update({k: "neutral" for k, _ in batch})
+                    else:
+                        scored.update({k: label for (k, _), label in zip(batch, out)})
+            self.cache.put_many(scored)
+            labels.update(scored)
+            labels.update(failed)
+            self.stats["scored"] += len(scored)
+            self.stats["failed"] += len(failed)
+            self.stats["batches"] += len(batches)
+        return [labels[k] for k in keys]
+
+_default_pipeline = None
+
+def get_sentiment_pipeline():
+    global _default_pipeline
+    if _default_pipeline is None:
+        _default_pipeline = SentimentPipeline()
+    return _default_pipeline
+
+def sentiment_score(texts):
+    return get_sentiment_pipeline().score(texts)
 
 def news_with_sentiment(symbol):
     headlines = get_headlines(symbol)
@@ -38,4 +182,4 @@ def event_driven_signal(symbol):
     for ev in events:
         if 'positive' in ev.get('impact',''):
             return 'Buy'
-    return 'Hold'
\ No newline at end of file
+    return 'Hold'
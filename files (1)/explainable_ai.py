@@ -1,12 +1,214 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import joblib
 import openai
+from prometheus_client import Counter, Histogram
+from model_registry import get_registry
+try:
+    import shap
+except ImportError:
+    shap = None
 
-def explain_signal(signal, indicators):
+explain_requests = Counter("explain_requests_total", "Explanation lookups by outcome", ["result"])
+explain_latency = Histogram("explain_generation_seconds", "Time spent generating an explanation")
+
+PLACEHOLDER = "Generating explanation..."
+
+def generate_explanation(signal, indicators):
     # For demo: use GPT-3.5 to generate explanation
     expl_prompt = f"Explain why the strategy issued '{signal}'. Indicators: {indicators}"
     response = openai.Completion.create(model="text-davinci-003",
         prompt=expl_prompt, max_tokens=80)
     return response.choices[0].text.strip()
 
-def feature_importance(model, X):
-    # Use SHAP values if available, dummy for now
-    return {"feature_importance": "Not implemented (add SHAP or LIME here)"}
\ No newline at end of file
+def quantize(value, digits=2):
+    # Round to `digits` significant figures so near-identical renders share a key
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return value
+    if value == 0 or not math.isfinite(value):
+        return value
+    return round(value, digits - 1 - int(math.floor(math.log10(abs(value)))))
+
+class ExplanationService:
+    # LRU of explanations keyed on (signal, quantized indicators). Misses are generated
+    # on a small worker pool; concurrent lookups of the same key share one job, and
+    # callers get the last explanation for that signal (or a placeholder) meanwhile.
+    def __init__(self, generate=None, max_entries=1024, digits=2, max_workers=2):
+        self.generate = generate or generate_explanation
+        self.max_entries = max_entries
+        self.digits = digits
+        self._cache = OrderedDict()
+        self._last = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="explain")
+
+    def key(self, signal, indicators):
+        return (signal, tuple(sorted((k, quantize(v, self.digits)) for k, v in indicators.items())))
+
+    def _run(self, key, signal, indicators):
+        start = time.perf_counter()
+        try:
+            text = self.generate(signal, indicators)
+        except Exception as e:
+            logging.error(f"Explanation failed for {signal}: {e}")
+            with self._lock:
+                self._inflight.pop(key, None)
+            raise
+        explain_latency.observe(time.perf_counter() - start)
+        with self._lock:
+            self._cache[key] = text
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            self._last[signal] = text
+            self._inflight.pop(key, None)
+        return text
+
+    def submit(self, signal, indicators):
+        # Returns (text, future): text is cached if known, future is None on a hit
+        key = self.key(signal, indicators)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                explain_requests.labels("hit").inc()
+                return self._cache[key], None
+            fut = self._inflight.get(key)
+            if fut is None:
+                explain_requests.labels("miss").inc()
+                fut = self._inflight[key] = self._pool.submit(self._run, key, signal, dict(indicators))
+            else:
+                explain_requests.labels("inflight").inc()
+            return self._last.get(signal), fut
+
+    def explain(self, signal, indicators, wait=False, timeout=None):
+        # Non-blocking by default: the last-known explanation or PLACEHOLDER while generating
+        text, fut = self.submit(signal, indicators)
+        if fut is None:
+            return text
+        if wait:
+            return fut.result(timeout=timeout)
+        return text or PLACEHOLDER
+
+    def get_stats(self):
+        with self._lock:
+            return {"entries": len(self._cache), "inflight": len(self._inflight)}
+
+_service = None
+
+def get_explanation_service():
+    global _service
+    if _service is None:
+        _service = ExplanationService()
+    return _service
+
+def explain_signal(signal, indicators, wait=True):
+    return get_explanation_service().explain(signal, indicators, wait=wait)
+
+def _is_tree_model(model):
+    # A tree, an ensemble whose members are all trees (forests, boosting), or a
+    # GBM library model; estimators_ alone also matches voting/bagging of anything
+    if hasattr(model, "tree_") or type(model).__module__.split(".")[0] in ("xgboost", "lightgbm", "catboost"):
+        return True
+    members = np.ravel(np.asarray(getattr(model, "estimators_", []), dtype=object))
+    return len(members) > 0 and all(hasattr(m, "tree_") for m in members)
+
+def _predict(model, X):
+    if hasattr(model, "predict_proba"):
+        proba = model.predict_proba(X)
+        return proba[:, -1] if proba.ndim == 2 else proba
+    return model.predict(X)
+
+def _score(model, X, y):
+    # Higher is better: accuracy for classifiers, negative MSE otherwise
+    pred = model.predict(X)
+    if hasattr(model, "classes_"):
+        return float(np.mean(pred == y))
+    return -float(np.mean((pred - y) ** 2))
+
+# Per-worker state so the model and sample are pickled once per process, not per feature
+_perm = {}
+
+def _init_permutation(model, X, y, n_repeats, seed):
+    _perm.update(model=model, X=X, y=y, n_repeats=n_repeats, seed=seed)
+    _perm["base"] = _score(model, X, y) if y is not None else _predict(model, X)
+
+def _permute_feature(j):
+    # All repeats for feature j go through the model as one stacked batch
+    model, X, y, n_repeats = _perm["model"], _perm["X"], _perm["y"], _perm["n_repeats"]
+    rng = np.random.default_rng(_perm["seed"] + j)
+    n = len(X)
+    stacked = pd.concat([X] * n_repeats, ignore_index=True)
+    col = X.iloc[:, j].to_numpy()
+    stacked.iloc[:, j] = np.concatenate([rng.permutation(col) for _ in range(n_repeats)])
+    if y is None:
+        pred = np.asarray(_predict(model, stacked)).reshape(n_repeats, n)
+        return float(np.mean(np.abs(pred - _perm["base"])))
+    pred = np.asarray(model.predict(stacked)).reshape(n_repeats, n)
+    if hasattr(model, "classes_"):
+        scores = np.mean(pred == np.asarray(y), axis=1)
+    else:
+        scores = -np.mean((pred - np.asarray(y)) ** 2, axis=1)
+    return float(_perm["base"] - scores.mean())
+
+def permutation_importance(model, X, y=None, n_repeats=5, n_jobs=None, seed=0):
+    # Score drop when a feature is shuffled (or mean prediction change without labels)
+    n_jobs = n_jobs or min(X.shape[1], os.cpu_count() or 1)
+    if n_jobs <= 1 or X.shape[1] <= 1:
+        _init_permutation(model, X, y, n_repeats, seed)
+        values = [_permute_feature(j) for j in range(X.shape[1])]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_permutation,
+                                 initargs=(model, X, y, n_repeats, seed)) as pool:
+            values = list(pool.map(_permute_feature, range(X.shape[1])))
+    return dict(zip(map(str, X.columns), values))
+
+def tree_shap_importance(model, X):
+    # Mean |SHAP value| per feature (averaged over classes for multi-output models)
+    values = shap.TreeExplainer(model).shap_values(X)
+    values = np.abs(np.stack(values) if isinstance(values, list) else np.asarray(values))
+    if values.ndim == 3:
+        values = values.mean(axis=0) if values.shape[0] != len(X) else values.mean(axis=2)
+    return dict(zip(map(str, X.columns), map(float, values.mean(axis=0))))
+
+def feature_importance(model, X, y=None, symbol=None, max_rows=2000, n_repeats=5, n_jobs=None, seed=0, registry=None):
+    # TreeSHAP for tree models when shap is installed, batched permutation importance
+    # otherwise, on at most max_rows sampled rows. Cached in the ModelRegistry per
+    # (model version, dataset fingerprint); symbol ties the version to the model file.
+    X = X if isinstance(X, pd.DataFrame) else pd.DataFrame(np.asarray(X))
+    if y is not None:
+        y = np.asarray(y)
+    if len(X) > max_rows:
+        rows = np.sort(np.random.default_rng(seed).choice(len(X), max_rows, replace=False))
+        X = X.iloc[rows].reset_index(drop=True)
+        y = y[rows] if y is not None else None
+    else:
+        X = X.reset_index(drop=True)
+    method = "tree_shap" if shap is not None and _is_tree_model(model) else "permutation"
+    registry = registry or get_registry()
+    version = (registry.model_version(symbol) if symbol else None) or joblib.hash(model)
+    fingerprint = joblib.hash((X, y, method, n_repeats, seed))
+
+    def compute():
+        used = method
+        values = None
+        if method == "tree_shap":
+            try:
+                values = tree_shap_importance(model, X)
+            except Exception as e:  # tree shapes TreeExplainer does not support
+                logging.warning(f"TreeSHAP failed for {type(model).__name__}, using permutation importance: {e}")
+                used = "permutation"
+        if values is None:
+            values = permutation_importance(model, X, y, n_repeats, n_jobs, seed)
+        ranked = dict(sorted(values.items(), key=lambda kv: -kv[1]))
+        return {"method": used, "rows": len(X), "feature_importance": ranked}
+    return registry.get_importance(version, fingerprint, compute)
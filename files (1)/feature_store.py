@@ -0,0 +1,192 @@
+import io
+import os
+import csv
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+
+def last_row_features(rows):
+    # Default feature function: the latest row is the model input (same as df.tail(1))
+    return dict(rows[-1])
+
+def normalize_tick(tick):
+    # Finnhub/TickPipeline: {'s','p','v','t'(ms)}; raw Binance trade: {'s','p','q','T'(ms)}, where 't' is the trade id
+    symbol = tick.get('s')
+    price = float(tick.get('p'))
+    if 'q' in tick:
+        # Trade time T, else the event time E; never 't'
+        ts = tick.get('T', tick.get('E'))
+        if ts is None:
+            raise ValueError(f"Binance trade without T/E timestamp: {tick}")
+        return symbol, float(ts) / 1000.0, price, float(tick['q'])
+    return symbol, float(tick['t']) / 1000.0, price, float(tick.get('v', 0) or 0)
+
+def _parse_value(v):
+    # Same as read_csv: empty fields are NaN
+    if v == "":
+        return np.nan
+    for cast in (int, float):
+        try:
+            return cast(v)
+        except ValueError:
+            pass
+    return v
+
+class SymbolBuffer:
+    def __init__(self, maxlen):
+        self.rows = deque(maxlen=maxlen)
+        self.bar = None          # bar currently being built from ticks
+        self.features = None     # latest feature row (dict)
+        self.frame = None        # cached one-row DataFrame of self.features
+        self.columns = None
+        self.csv_offset = 0
+        self.csv_inode = None
+
+class FeatureStore:
+    # Per-symbol ring buffer of recent bars with the latest feature row kept
+    # up to date, so the signal path only pays for model.predict.
+    def __init__(self, data_path='data', maxlen=500, bar_seconds=60, feature_fn=None):
+        self.data_path = data_path
+        self.maxlen = maxlen
+        self.bar_seconds = bar_seconds
+        self.feature_fn = feature_fn or last_row_features
+        self._buffers = {}
+        self._lock = threading.RLock()
+
+    def csv_path(self, symbol):
+        return f"{self.data_path}/{symbol}_latest.csv"
+
+    def _buf(self, symbol):
+        buf = self._buffers.get(symbol)
+        if buf is None:
+            buf = self._buffers[symbol] = SymbolBuffer(self.maxlen)
+        return buf
+
+    def _recompute(self, buf):
+        if buf.bar is None and not buf.rows:
+            return
+        if self.feature_fn is last_row_features:
+            # Avoid copying the ring buffer on every tick for the default feature row
+            buf.features = dict(buf.bar if buf.bar is not None else buf.rows[-1])
+        else:
+            rows = list(buf.rows)
+            if buf.bar is not None:
+                rows.append(buf.bar)
+            buf.features = self.feature_fn(rows)
+        buf.frame = None
+
+    # --- row / tick ingestion ---
+    def append_row(self, symbol, row):
+        with self._lock:
+            buf = self._buf(symbol)
+            buf.rows.append(row)
+            self._recompute(buf)
+
+    def on_tick(self, tick, symbol=None):
+        sym, ts, price, volume = normalize_tick(tick)
+        symbol = symbol or sym
+        bucket = int(ts // self.bar_seconds) * self.bar_seconds
+        with self._lock:
+            buf = self._buf(symbol)
+            bar = buf.bar
+            if bar is not None and bar['time'] != bucket:
+                buf.rows.append(bar)
+                bar = None
+            if bar is None:
+                bar = {'time': bucket, 'Open': price, 'High': price, 'Low': price, 'Close': price, 'Volume': volume}
+            else:
+                bar['High'] = max(bar['High'], price)
+                bar['Low'] = min(bar['Low'], price)
+                bar['Close'] = price
+                bar['Volume'] += volume
+            buf.bar = bar
+            self._recompute(buf)
+
+    # --- CSV cold start and tail-follow ---
+    def load_csv(self, symbol):
+        path = self.csv_path(symbol)
+        # The tail offset comes from the bytes actually parsed (complete lines only),
+        # so rows appended meanwhile are left for follow_csv, not skipped
+        with open(path, 'rb') as f:
+            data = f.read()
+            inode = os.fstat(f.fileno()).st_ino
+        end = data.rfind(b'\n') + 1 or len(data)
+        df = pd.read_csv(io.BytesIO(data[:end]))
+        with self._lock:
+            buf = self._buffers[symbol] = SymbolBuffer(self.maxlen)
+            buf.columns = list(df.columns)
+            buf.rows.extend(df.tail(self.maxlen).to_dict('records'))
+            buf.csv_offset = end
+            buf.csv_inode = inode
+            self._recompute(buf)
+            return buf
+
+    def follow_csv(self, symbol):
+        # Read only complete lines appended since the last call; reload if the file was replaced/truncated
+        path = self.csv_path(symbol)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return 0
+        with self._lock:
+            buf = self._buffers.get(symbol)
+            if buf is None or buf.columns is None or st.st_ino != buf.csv_inode or st.st_size < buf.csv_offset:
+                self.load_csv(symbol)
+                return -1
+            if st.st_size == buf.csv_offset:
+                return 0
+            with open(path, 'r', newline='') as f:
+                f.seek(buf.csv_offset)
+                chunk = f.read()
+            end = chunk.rfind('\n') + 1
+            if end == 0:
+                return 0
+            buf.csv_offset += len(chunk[:end].encode())
+            n = 0
+            for values in csv.reader(chunk[:end].splitlines()):
+                if values:
+                    buf.rows.append(dict(zip(buf.columns, map(_parse_value, values))))
+                    n += 1
+            if n:
+                self._recompute(buf)
+            return n
+
+    # --- reads ---
+    def latest_features(self, symbol):
+        with self._lock:
+            buf = self._buffers.get(symbol)
+            if buf is None or buf.features is None:
+                buf = self.load_csv(symbol)
+            return buf.features
+
+    def latest_frame(self, symbol, refresh=True):
+        # One-row DataFrame for model.predict; falls back to the CSV on a cold start
+        with self._lock:
+            if refresh and (symbol not in self._buffers or self._buffers[symbol].columns is not None):
+                self.follow_csv(symbol)
+            buf = self._buffers.get(symbol)
+            if buf is None or buf.features is None:
+                buf = self.load_csv(symbol)
+            if buf.frame is None:
+                buf.frame = pd.DataFrame([buf.features])
+            return buf.frame
+
+    def history(self, symbol):
+        with self._lock:
+            buf = self._buffers.get(symbol)
+            if buf is None:
+                return pd.DataFrame()
+            rows = list(buf.rows) + ([buf.bar] if buf.bar is not None else [])
+            return pd.DataFrame(rows)
+
+    def symbols(self):
+        return list(self._buffers)
+
+_default_store = None
+
+def get_feature_store(data_path='data'):
+    global _default_store
+    if _default_store is None:
+        _default_store = FeatureStore(data_path)
+    return _default_store
@@ -0,0 +1,145 @@
+import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+INTERVAL_SECONDS = {"1m": 60, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "4h": 14400,
+                    "1d": 86400, "1wk": 604800}
+
+def _ts(x):
+    ts = pd.Timestamp(x)
+    return ts.tz_convert(None) if ts.tzinfo is not None else ts
+
+def _merge_ranges(ranges):
+    out = []
+    for s, e in sorted(ranges):
+        if out and s <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], e)
+        else:
+            out.append([s, e])
+    return out
+
+def missing_ranges(start, end, covered):
+    # Parts of [start, end] not inside any covered range
+    gaps, cur = [], start
+    for s, e in covered:
+        if e < cur:
+            continue
+        if s > end:
+            break
+        if s > cur:
+            gaps.append((cur, min(s, end)))
+        cur = max(cur, e)
+        if cur >= end:
+            break
+    if cur < end:
+        gaps.append((cur, end))
+    return gaps
+
+class HistoryCache:
+    # Parquet partitions at root/provider/symbol/interval/data.parquet; the time
+    # ranges already fetched live in the file's own metadata, so bars and ranges
+    # are replaced together by one atomic rename. Only the gaps of a request hit
+    # the provider. Read-merge-write runs under a per-partition flock on .lock,
+    # so several processes (API server, backtesters, dashboard) can share one root
+    # without losing each other's merges.
+    def __init__(self, root=None):
+        self.root = root or os.environ.get("HISTORY_CACHE_DIR", "data/history_cache")
+        self._lock = threading.Lock()
+        self._partition_locks = {}
+        self.stats = {"hits": 0, "partial": 0, "misses": 0, "fetches": 0}
+
+    def _dir(self, provider, symbol, interval):
+        return os.path.join(self.root, provider, symbol.replace("/", "_"), interval)
+
+    @contextmanager
+    def _flock(self, d):
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load_meta(self, d):
+        # Caches written before ranges moved into the parquet metadata
+        try:
+            with open(os.path.join(d, "meta.json")) as f:
+                return json.load(f)["ranges"]
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def _load(self, d):
+        # -> (df or None, covered ranges)
+        path = os.path.join(d, "data.parquet")
+        if not os.path.exists(path):
+            return None, []
+        table = pq.read_table(path)
+        meta = (table.schema.metadata or {}).get(b"history_cache")
+        ranges = json.loads(meta)["ranges"] if meta else self._load_meta(d)
+        return table.to_pandas(), [[_ts(s), _ts(e)] for s, e in ranges]
+
+    def _save(self, d, df, ranges):
+        table = pa.Table.from_pandas(df)
+        meta = dict(table.schema.metadata or {})
+        meta[b"history_cache"] = json.dumps({"ranges": [[s.isoformat(), e.isoformat()] for s, e in ranges]})
+        tmp = os.path.join(d, f".data.{os.getpid()}.{threading.get_ident()}.parquet")
+        pq.write_table(table.replace_schema_metadata(meta), tmp)
+        os.replace(tmp, os.path.join(d, "data.parquet"))
+
+    def get(self, provider, symbol, start, end, interval, fetch):
+        # fetch(symbol, start, end, interval) -> DataFrame indexed by bar time
+        start, end = _ts(start), _ts(end)
+        d = self._dir(provider, symbol, interval)
+        with self._lock:
+            lock = self._partition_locks.setdefault(d, threading.Lock())
+        # Per-partition locks (threads, then processes): different symbols fetch concurrently
+        with lock, self._flock(d):
+            df, covered = self._load(d)
+            gaps = missing_ranges(start, end, covered)
+            if not gaps:
+                self.stats["hits"] += 1
+            else:
+                self.stats["partial" if covered else "misses"] += 1
+                # The still-forming latest bar is never marked as covered
+                horizon = pd.Timestamp.utcnow().tz_convert(None) - pd.Timedelta(seconds=INTERVAL_SECONDS.get(interval, 0))
+                parts = [df] if df is not None else []
+                for s, e in gaps:
+                    self.stats["fetches"] += 1
+                    part = fetch(symbol, s, e, interval)
+                    if part is not None and len(part):
+                        parts.append(part)
+                    covered.append([s, min(e, max(s, horizon))])
+                if parts:
+                    df = pd.concat(parts)
+                    df = df[~df.index.duplicated(keep="last")].sort_index()
+                self._save(d, df if df is not None else pd.DataFrame(), _merge_ranges(covered))
+        if df is None or df.empty:
+            return pd.DataFrame() if df is None else df
+        index = df.index.tz_convert(None) if getattr(df.index, "tz", None) is not None else df.index
+        return df[(index >= start) & (index <= end)]
+
+class CachedSource:
+    def __init__(self, source, provider, cache=None):
+        self.source = source
+        self.provider = provider
+        self.cache = cache or get_history_cache()
+
+    def get_history(self, symbol, start, end, interval="1d"):
+        return self.cache.get(self.provider, symbol, start, end, interval, self.source.get_history)
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+_default_cache = None
+
+def get_history_cache(root=None):
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = HistoryCache(root)
+    return _default_cache
@@ -0,0 +1,355 @@
+import numpy as np
+import pandas as pd
+
+# Stateful indicator kernels that update in O(1) per bar. Every kernel works on
+# a float or on a NumPy vector of symbols, so one engine can step many symbols
+# at once. The arithmetic follows pandas' own ewm/rolling kernels step for step
+# (Kahan-compensated rolling sums, ewm old_wt bookkeeping) so streaming values
+# equal the batch pandas results, not just approximately.
+
+def _com(com=None, span=None, alpha=None):
+    # Same parameter conversion as pandas' get_center_of_mass
+    if com is not None:
+        return float(com)
+    if span is not None:
+        return (span - 1) / 2
+    return (1 - alpha) / alpha
+
+class EWMState:
+    # ewm(adjust=False, ignore_na=False).mean()
+    def __init__(self, com=None, span=None, alpha=None, min_periods=0, shape=()):
+        a = 1. / (1. + _com(com, span, alpha))
+        self.old_wt_factor = 1. - a
+        self.new_wt = a
+        self.min_periods = max(int(min_periods), 1)
+        self.weighted = np.full(shape, np.nan)
+        self.old_wt = np.ones(shape)
+        self.nobs = np.zeros(shape, dtype=np.int64)
+
+    def update(self, x):
+        x = np.asarray(x, dtype=float)
+        w = self.weighted
+        obs = x == x
+        have = w == w
+        self.nobs = self.nobs + obs
+        old_wt = np.where(have, self.old_wt * self.old_wt_factor, self.old_wt)
+        mix = have & obs & (w != x)
+        with np.errstate(invalid='ignore'):
+            mixed = (old_wt * w + self.new_wt * x) / (old_wt + self.new_wt)
+        w = np.where(mix, mixed, w)
+        w = np.where(~have & obs, x, w)
+        self.old_wt = np.where(have & obs, 1., old_wt)
+        self.weighted = w
+        return np.where(self.nobs >= self.min_periods, w, np.nan)
+
+    def snapshot(self):
+        return {"weighted": self.weighted.copy(), "old_wt": self.old_wt.copy(), "nobs": self.nobs.copy()}
+
+    def restore(self, state):
+        self.weighted = np.array(state["weighted"], dtype=float)
+        self.old_wt = np.array(state["old_wt"], dtype=float)
+        self.nobs = np.array(state["nobs"], dtype=np.int64)
+
+class _RollingWindow:
+    # Ring buffer of the last `window` inputs; the value leaving the window is returned on push
+    def __init__(self, window, shape=()):
+        self.window = int(window)
+        self.buf = np.full((self.window,) + tuple(shape), np.nan)
+        self.count = 0
+
+    def push(self, x):
+        i = self.count % self.window
+        leaving = self.buf[i].copy() if self.count >= self.window else None
+        self.buf[i] = x
+        self.count += 1
+        return leaving
+
+    def window_values(self):
+        # Current window contents, oldest first
+        n = min(self.count, self.window)
+        start = self.count - n
+        return [self.buf[i % self.window] for i in range(start, self.count)]
+
+    def snapshot(self):
+        return {"buf": self.buf.copy(), "count": self.count}
+
+    def restore(self, state):
+        self.buf = np.array(state["buf"], dtype=float)
+        self.count = int(state["count"])
+
+class RollingMean:
+    # rolling(window, min_periods).mean() -- pandas roll_mean add/remove steps
+    def __init__(self, window, min_periods=None, shape=()):
+        self.min_periods = window if min_periods is None else min_periods
+        self.ring = _RollingWindow(window, shape)
+        self.sum_x = np.zeros(shape)
+        self.comp_add = np.zeros(shape)
+        self.comp_remove = np.zeros(shape)
+        self.nobs = np.zeros(shape, dtype=np.int64)
+        self.neg_ct = np.zeros(shape, dtype=np.int64)
+        self.same = np.zeros(shape, dtype=np.int64)
+        self.prev = np.full(shape, np.nan)
+
+    def update(self, x):
+        x = np.asarray(x, dtype=float)
+        if self.ring.count == 0:
+            self.prev = x.copy()
+        leaving = self.ring.push(x)
+        if leaving is not None:
+            obs = leaving == leaving
+            y = -leaving - self.comp_remove
+            t = self.sum_x + y
+            self.comp_remove = np.where(obs, t - self.sum_x - y, self.comp_remove)
+            self.sum_x = np.where(obs, t, self.sum_x)
+            self.nobs = self.nobs - obs
+            self.neg_ct = self.neg_ct - (obs & np.signbit(leaving))
+        obs = x == x
+        y = x - self.comp_add
+        t = self.sum_x + y
+        self.comp_add = np.where(obs, t - self.sum_x - y, self.comp_add)
+        self.sum_x = np.where(obs, t, self.sum_x)
+        self.nobs = self.nobs + obs
+        self.neg_ct = self.neg_ct + (obs & np.signbit(x))
+        self.same = np.where(obs, np.where(x == self.prev, self.same + 1, 1), self.same)
+        self.prev = np.where(obs, x, self.prev)
+        return self._value()
+
+    def _value(self):
+        nobs = self.nobs
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = self.sum_x / nobs
+        result = np.where(self.same >= nobs, self.prev, result)
+        result = np.where((self.same < nobs) & (self.neg_ct == 0) & (result < 0), 0., result)
+        result = np.where((self.same < nobs) & (self.neg_ct == nobs) & (result > 0), 0., result)
+        return np.where((nobs >= self.min_periods) & (nobs > 0), result, np.nan)
+
+    def snapshot(self):
+        return {"ring": self.ring.snapshot(), "sum_x": self.sum_x.copy(), "comp_add": self.comp_add.copy(),
+                "comp_remove": self.comp_remove.copy(), "nobs": self.nobs.copy(), "neg_ct": self.neg_ct.copy(),
+                "same": self.same.copy(), "prev": self.prev.copy()}
+
+    def restore(self, state):
+        self.ring.restore(state["ring"])
+        for k in ("sum_x", "comp_add", "comp_remove", "prev"):
+            setattr(self, k, np.array(state[k], dtype=float))
+        for k in ("nobs", "neg_ct", "same"):
+            setattr(self, k, np.array(state[k], dtype=np.int64))
+
+_INV_COND_TOL = np.finfo(np.float64).eps * 1e3
+
+class RollingStd:
+    # rolling(window, min_periods).std(ddof) -- pandas roll_var steps: Welford with
+    # Kahan compensation, and a from-scratch pass over the window whenever an
+    # update looks ill-conditioned (same trigger as pandas)
+    def __init__(self, window, min_periods=None, ddof=1, shape=()):
+        self.min_periods = max(window if min_periods is None else min_periods, 1)
+        self.ddof = ddof
+        self.ring = _RollingWindow(window, shape)
+        self.mean_x = np.zeros(shape)
+        self.ssqdm_x = np.zeros(shape)
+        self.comp_add = np.zeros(shape)
+        self.comp_remove = np.zeros(shape)
+        self.nobs = np.zeros(shape)
+
+    @staticmethod
+    def _add(x, nobs, mean_x, ssqdm_x, comp):
+        obs = x == x
+        prev_m2 = ssqdm_x
+        n = nobs + obs
+        prev_mean = mean_x - comp
+        y = x - comp
+        t = y - mean_x
+        new_comp = t + mean_x - y
+        new_mean = np.where(n > 0, mean_x + t / n, 0.)
+        new_m2 = ssqdm_x + (x - prev_mean) * (x - new_mean)
+        unstable = obs & (prev_m2 * _INV_COND_TOL > new_m2)
+        return (n, np.where(obs, new_mean, mean_x), np.where(obs, new_m2, ssqdm_x),
+                np.where(obs, new_comp, comp), unstable)
+
+    def update(self, x):
+        x = np.asarray(x, dtype=float)
+        leaving = self.ring.push(x)
+        unstable = np.zeros(self.nobs.shape, dtype=bool)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if leaving is not None:
+                obs = leaving == leaving
+                prev_m2 = self.ssqdm_x
+                nobs = self.nobs - obs
+                prev_mean = self.mean_x - self.comp_remove
+                y = leaving - self.comp_remove
+                t = y - self.mean_x
+                comp = t + self.mean_x - y
+                mean_x = self.mean_x - t / nobs
+                ssqdm_x = self.ssqdm_x - (leaving - prev_mean) * (leaving - mean_x)
+                live = obs & (nobs > 0)
+                emptied = obs & (nobs == 0)
+                unstable = live & (prev_m2 * _INV_COND_TOL > ssqdm_x)
+                self.comp_remove = np.where(live, comp, self.comp_remove)
+                self.mean_x = np.where(live, mean_x, np.where(emptied, 0., self.mean_x))
+                self.ssqdm_x = np.where(live, ssqdm_x, np.where(emptied, 0., self.ssqdm_x))
+                self.nobs = nobs
+            self.nobs, self.mean_x, self.ssqdm_x, self.comp_add, added_unstable = self._add(
+                x, self.nobs, self.mean_x, self.ssqdm_x, self.comp_add)
+            # pandas keeps the flag from the remove step unless the last remove emptied the window
+            if leaving is not None:
+                unstable = np.where(emptied, False, unstable)
+            unstable = unstable | added_unstable
+            if unstable.any():
+                self._recompute(unstable)
+            return self._value()
+
+    def _recompute(self, mask):
+        shape = self.nobs.shape
+        nobs, mean_x, ssqdm_x, comp = np.zeros(shape), np.zeros(shape), np.zeros(shape), np.zeros(shape)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for v in self.ring.window_values():
+                nobs, mean_x, ssqdm_x, comp, _ = self._add(v, nobs, mean_x, ssqdm_x, comp)
+        self.nobs = np.where(mask, nobs, self.nobs)
+        self.mean_x = np.where(mask, mean_x, self.mean_x)
+        self.ssqdm_x = np.where(mask, ssqdm_x, self.ssqdm_x)
+        self.comp_add = np.where(mask, comp, self.comp_add)
+        self.comp_remove = np.where(mask, 0., self.comp_remove)
+
+    def _value(self):
+        nobs = self.nobs
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = self.ssqdm_x / (nobs - self.ddof)
+            var = np.where((nobs >= self.min_periods) & (nobs > self.ddof), var, np.nan)
+            std = np.sqrt(var)
+        return np.where(var < 0, 0., std)
+
+    def snapshot(self):
+        return {"ring": self.ring.snapshot(), "mean_x": self.mean_x.copy(), "ssqdm_x": self.ssqdm_x.copy(),
+                "comp_add": self.comp_add.copy(), "comp_remove": self.comp_remove.copy(), "nobs": self.nobs.copy()}
+
+    def restore(self, state):
+        self.ring.restore(state["ring"])
+        for k in ("mean_x", "ssqdm_x", "comp_add", "comp_remove", "nobs"):
+            setattr(self, k, np.array(state[k], dtype=float))
+
+class RSIState:
+    # Wilder RSI: ewm(alpha=1/period, adjust=False, min_periods=period) of gains and losses
+    def __init__(self, period=14, shape=()):
+        self.period = period
+        self.prev_close = np.full(shape, np.nan)
+        self.avg_gain = EWMState(alpha=1. / period, min_periods=period, shape=shape)
+        self.avg_loss = EWMState(alpha=1. / period, min_periods=period, shape=shape)
+
+    def update(self, close):
+        close = np.asarray(close, dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = close - self.prev_close
+            zero_or_nan = np.where(delta == delta, 0., np.nan)
+            gain = self.avg_gain.update(np.where(delta > 0, delta, zero_or_nan))
+            loss = self.avg_loss.update(np.where(delta < 0, -delta, zero_or_nan))
+            rsi = 100 - 100 / (1 + gain / loss)
+        self.prev_close = close
+        return rsi
+
+    def run(self, closes):
+        closes = np.asarray(closes, dtype=float)
+        out = np.empty(closes.shape)
+        for i in range(closes.shape[0]):
+            out[i] = self.update(closes[i])
+        return out
+
+    def snapshot(self):
+        return {"prev_close": self.prev_close.copy(), "avg_gain": self.avg_gain.snapshot(),
+                "avg_loss": self.avg_loss.snapshot()}
+
+    def restore(self, state):
+        self.prev_close = np.array(state["prev_close"], dtype=float)
+        self.avg_gain.restore(state["avg_gain"])
+        self.avg_loss.restore(state["avg_loss"])
+
+class IndicatorEngine:
+    # RSI (Wilder), SMA, EMA, MACD and rolling volatility of returns, one bar at a time.
+    # n_symbols=None steps a single series with floats; an int steps a vector of symbols.
+    def __init__(self, n_symbols=None, rsi_period=14, sma_period=20, ema_span=20,
+                 macd_fast=12, macd_slow=26, macd_signal=9, vol_window=10):
+        shape = () if n_symbols is None else (int(n_symbols),)
+        self.shape = shape
+        self.params = {"rsi_period": rsi_period, "sma_period": sma_period, "ema_span": ema_span,
+                       "macd_fast": macd_fast, "macd_slow": macd_slow, "macd_signal": macd_signal,
+                       "vol_window": vol_window}
+        self.prev_close = np.full(shape, np.nan)
+        self.rsi = RSIState(rsi_period, shape=shape)
+        self.sma = RollingMean(sma_period, shape=shape)
+        self.ema = EWMState(span=ema_span, shape=shape)
+        self.ema_fast = EWMState(span=macd_fast, shape=shape)
+        self.ema_slow = EWMState(span=macd_slow, shape=shape)
+        self.macd_signal = EWMState(span=macd_signal, shape=shape)
+        self.vol = RollingStd(vol_window, shape=shape)
+        self.last = None
+
+    def update(self, close):
+        close = np.asarray(close, dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ret = close / self.prev_close - 1
+        self.prev_close = close
+        macd = self.ema_fast.update(close) - self.ema_slow.update(close)
+        self.last = {
+            "Close": close,
+            "RSI": self.rsi.update(close),
+            "SMA": self.sma.update(close),
+            "EMA": self.ema.update(close),
+            "MACD": macd,
+            "MACD_signal": self.macd_signal.update(macd),
+            "vol": self.vol.update(ret),
+        }
+        return self.last
+
+    def run(self, closes):
+        # Batch mode: closes is (bars,) or (bars, n_symbols); returns arrays of the same shape
+        closes = np.asarray(closes, dtype=float)
+        out = {}
+        for i in range(closes.shape[0]):
+            for k, v in self.update(closes[i]).items():
+                out.setdefault(k, np.empty(closes.shape))[i] = v
+        return out
+
+    def frame(self, close):
+        # Batch mode for a single pd.Series, column names as used by app.py
+        res = self.run(close.values)
+        return pd.DataFrame({"RSI": res["RSI"], f"SMA_{self.params['sma_period']}": res["SMA"],
+                             "MACD": res["MACD"], "vol": res["vol"]}, index=close.index)
+
+    def snapshot(self):
+        return {
+            "params": dict(self.params), "shape": self.shape, "prev_close": self.prev_close.copy(),
+            "rsi": self.rsi.snapshot(),
+            "sma": self.sma.snapshot(), "ema": self.ema.snapshot(), "ema_fast": self.ema_fast.snapshot(),
+            "ema_slow": self.ema_slow.snapshot(), "macd_signal": self.macd_signal.snapshot(),
+            "vol": self.vol.snapshot(),
+        }
+
+    def restore(self, state):
+        self.prev_close = np.array(state["prev_close"], dtype=float)
+        for k in ("rsi", "sma", "ema", "ema_fast", "ema_slow", "macd_signal", "vol"):
+            getattr(self, k).restore(state[k])
+
+    @classmethod
+    def from_snapshot(cls, state):
+        n = state["shape"][0] if state["shape"] else None
+        engine = cls(n, **state["params"])
+        engine.restore(state)
+        return engine
+
+# --- pandas reference formulations the engine reproduces ---
+def rsi_batch(close, period=14):
+    delta = close.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+    loss = (-delta.clip(upper=0)).ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+    return 100 - 100 / (1 + gain / loss)
+
+def sma_batch(close, period=20):
+    return close.rolling(period).mean()
+
+def ema_batch(close, span=20):
+    return close.ewm(span=span, adjust=False).mean()
+
+def macd_batch(close, fast=12, slow=26):
+    return ema_batch(close, fast) - ema_batch(close, slow)
+
+def volatility_batch(close, window=10):
+    return close.pct_change().rolling(window).std()
@@ -0,0 +1,108 @@
+import time
+import uuid
+import importlib
+import logging
+import threading
+from collections import OrderedDict
+import pandas as pd
+from model_registry import get_registry
+
+class JobManager:
+    # Tracks work handed to an executor (thread or process pool) so an endpoint can
+    # return a job id at once and clients poll the status. Finished jobs are kept
+    # for lookup; the oldest are dropped beyond max_jobs.
+    def __init__(self, executor, max_jobs=1000):
+        self.executor = executor
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, meta=None, **kwargs):
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "kind": kind, "status": "queued", "submitted": time.time(),
+               "finished": None, "error": None, "result": None, **(meta or {})}
+        with self._lock:
+            self._jobs[job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                old_id, _ = self._jobs.popitem(last=False)
+                self._futures.pop(old_id, None)
+        fut = self.executor.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._futures[job_id] = fut
+        fut.add_done_callback(lambda f: self._done(job_id, f))
+        return job_id
+
+    def _done(self, job_id, fut):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            self._futures.pop(job_id, None)
+            if job is None:
+                return
+            job["finished"] = time.time()
+            if fut.cancelled():
+                job["status"] = "cancelled"
+            elif fut.exception() is not None:
+                job["status"] = "failed"
+                job["error"] = repr(fut.exception())
+                logging.error(f"{job['kind']} job {job_id} failed: {fut.exception()}")
+            else:
+                job["status"] = "done"
+                job["result"] = fut.result()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            fut = self._futures.get(job_id)
+            out = dict(job)
+        if fut is not None and job["status"] == "queued" and fut.running():
+            out["status"] = "running"
+        return out
+
+    def list(self, kind=None):
+        with self._lock:
+            ids = [j for j, job in self._jobs.items() if kind is None or job["kind"] == kind]
+        return [self.get(j) for j in ids]
+
+# Estimators /train_model may build, by name; nothing else is ever imported
+MODEL_CLASSES = {
+    "RandomForestClassifier": "sklearn.ensemble:RandomForestClassifier",
+    "RandomForestRegressor": "sklearn.ensemble:RandomForestRegressor",
+    "GradientBoostingClassifier": "sklearn.ensemble:GradientBoostingClassifier",
+    "GradientBoostingRegressor": "sklearn.ensemble:GradientBoostingRegressor",
+    "LogisticRegression": "sklearn.linear_model:LogisticRegression",
+    "LinearRegression": "sklearn.linear_model:LinearRegression",
+    "Ridge": "sklearn.linear_model:Ridge",
+    "DecisionTreeClassifier": "sklearn.tree:DecisionTreeClassifier",
+    "DecisionTreeRegressor": "sklearn.tree:DecisionTreeRegressor",
+}
+
+def check_model_request(model_class, params):
+    # -> allowlist name; ValueError for anything else. Accepts the short name or
+    # its "module:Class" path.
+    name = model_class.rpartition(":")[2] if isinstance(model_class, str) else None
+    if name not in MODEL_CLASSES or model_class not in (name, MODEL_CLASSES[name]):
+        raise ValueError(f"Unsupported model_class {model_class!r}; allowed: {sorted(MODEL_CLASSES)}")
+    if not isinstance(params, dict) or not all(isinstance(k, str) for k in params):
+        raise ValueError("params must be an object of keyword arguments")
+    return name
+
+def _model_class(name):
+    module, _, attr = MODEL_CLASSES[name].partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+def train_model_job(records, model_class, params, symbol, model_path, target=None):
+    # Runs in a worker process: fits an allowlisted model_class and saves it
+    # through the registry; the API process picks the new file up on its next get_model.
+    t0 = time.time()
+    df = pd.DataFrame(records)
+    params = params or {}
+    model = _model_class(check_model_request(model_class, params))(**params)
+    if target is not None:
+        model.fit(df.drop(columns=[target]), df[target])
+    else:
+        model.fit(df)
+    get_registry(model_path).save_model(symbol, model)
+    return {"symbol": symbol, "rows": len(df), "seconds": time.time() - t0}
@@ -1,19 +1,27 @@
 import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import pandas as pd
-import joblib
-from concurrent.futures import ProcessPoolExecutor
-from apscheduler.schedulers.background import BackgroundScheduler
-import dask.dataframe as dd
-from fastapi import FastAPI, WebSocket, Request
+from fastapi import FastAPI, WebSocket, Request, HTTPException
 import redis
-import psycopg2
+import redis.asyncio as aioredis
 from prometheus_client import start_http_server, Counter, Summary
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from tenacity import retry, AsyncRetrying, stop_after_attempt, wait_exponential, retry_if_exception_type, retry_if_exception
 import requests
 import logging
+from backtest_mp import iter_backtests
+from db_timescale import get_tick_writer
+from model_registry import get_registry, warm_symbols_from_env
+from feature_store import get_feature_store
+from broker_api import get_broker, order_spec, is_retryable
+from jobs import JobManager, train_model_job, check_model_request
+from tick_hub import TickHub, parse_symbols
+from event_broker import get_event_broker
+from scheduler import get_scheduler, FIXED_DELAY
 
 FINNHUB_KEY = "d4c40i1r01qoua32ddv0d4c40i1r01qoua32ddvg"
-ALPACA_BASE = "https://paper-api.alpaca.markets/v2"
+ALPACA_BASE = os.environ.get("ALPACA_BASE", "https://paper-api.alpaca.markets")
 ALPACA_KEY = os.environ.get("ALPACA_KEY", "")
 ALPACA_SECRET = os.environ.get("ALPACA_SECRET", "")
 
@@ -23,9 +31,16 @@ query_duration = Summary("query_duration_seconds", "Duration for queries")
 start_http_server(9100)
 
 # ------- Redis Pub/Sub --------
-REDIS_HOST = "localhost"
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
 redis_client = redis.Redis(host=REDIS_HOST)
-pubsub = redis_client.pubsub()
+async_redis = aioredis.Redis(host=REDIS_HOST)
+
+# ------- Worker pools --------
+# Blocking HTTP/DB calls run on io_pool and CPU-heavy training on a process pool,
+# so neither a slow upstream nor a fit ever stalls the event loop.
+io_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("IO_WORKERS", 32)), thread_name_prefix="io")
+train_pool = ProcessPoolExecutor(max_workers=int(os.environ.get("TRAIN_WORKERS", 2)))
+jobs = JobManager(train_pool)
 
 # ------- FastAPI --------
 app = FastAPI()
@@ -44,6 +59,22 @@ def resilient(callable_fn, *args, **kwargs):
         log_error(e)
         raise
 
+async def run_io(callable_fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(io_pool, functools.partial(callable_fn, *args, **kwargs))
+
+async def resilient_async(callable_fn, *args, retry_on=None, **kwargs):
+    # Same policy as resilient(), but attempts run on io_pool and the backoff is an asyncio sleep;
+    # retry_on(exc) limits which failures are retried
+    retry_if = retry_if_exception(retry_on) if retry_on else retry_if_exception_type(Exception)
+    async for attempt in AsyncRetrying(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, max=10),
+                                       retry=retry_if, before_sleep=log_retry, reraise=True):
+        with attempt:
+            try:
+                return await run_io(callable_fn, *args, **kwargs)
+            except Exception as e:
+                log_error(e)
+                raise
+
 # ------- Finnhub Market Data --------
 def get_finnhub_stock(symbol, start_ts, end_ts):
     url = f"https://finnhub.io/api/v1/stock/candle"
@@ -99,33 +130,21 @@ def get_finnhub_news(symbol, count=5):
     news = r.json()
     return news[:count] if isinstance(news, list) else []
 
-# ------- Model Registry (joblib) --------
+# ------- Model Registry (in-process LRU cache) --------
+registry = get_registry("models")
+features = get_feature_store("data")
+
 def get_model(symbol):
-    try:
-        return joblib.load(f"models/{symbol}_best.pkl")
-    except Exception as e:
-        logging.error(f"Model load error: {e}")
-        return None
+    return registry.get_model(symbol)
 
 def save_model(symbol, model):
-    joblib.dump(model, f"models/{symbol}_best.pkl")
+    registry.save_model(symbol, model)
 
 # ------- TimescaleDB Integration --------
+# Ticks are buffered and written in batches by a pooled TickWriter; failed
+# batches go to a local spill file and are replayed, so no retry wrapper is needed.
 def store_tick(symbol, ts, price, volume):
-    conn = psycopg2.connect(dbname='trading', user='user', password='pass', host='localhost')
-    cur = conn.cursor()
-    cur.execute("INSERT INTO ticks (symbol, ts, price, volume) VALUES (%s, %s, %s, %s)", (symbol, ts, price, volume))
-    conn.commit()
-    cur.close()
-    conn.close()
-
-# ------- Distributed ML (Dask) --------
-def train_model(df, model_class, params, symbol):
-    ddf = dd.from_pandas(df, npartitions=4)
-    model = model_class(**params)
-    model.fit(ddf.compute())
-    save_model(symbol, model)
-    return model
+    get_tick_writer().write(symbol, ts, price, volume)
 
 # ------- Multiprocessed Backtest + Scheduler --------
 def run_backtest(symbol, df, strategy_func):
@@ -133,87 +152,134 @@ def run_backtest(symbol, df, strategy_func):
     return {"symbol": symbol, "log": log, "stats": stats}
 
 def batch_backtest(symbols, dfs, strategy_func):
-    with ProcessPoolExecutor() as pool:
-        results = pool.map(lambda args: run_backtest(*args), [(sym, dfs[sym], strategy_func) for sym in symbols])
-    return list(results)
+    # strategy_func(df) -> (log, stats); prices are memory-mapped into the workers
+    results = iter_backtests(symbols, dfs, strategy_func, direct=True)
+    return [{"symbol": r['symbol'], "log": r['log'], "stats": r['stats'], "error": r['error'], "timing": r['timing']}
+            for r in results]
 
 def start_scheduled_backtest(interval_s, symbols, dfs, strategy_func):
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(lambda: batch_backtest(symbols, dfs, strategy_func), 'interval', seconds=interval_s)
-    scheduler.start()
-    return scheduler
+    # Fixed delay: a slow batch pushes the next one back instead of stacking up
+    return get_scheduler().schedule(f"backtest:{','.join(symbols)}", batch_backtest, interval_s,
+                                    mode=FIXED_DELAY, start_in=interval_s, args=(symbols, dfs, strategy_func))
+
+@app.get("/scheduler/stats")
+def scheduler_stats():
+    return get_scheduler().get_stats()
 
 # ------- Redis Event Broker --------
+# Batched, pipelined publishes; one listener thread dispatches to handlers by
+# channel. DataFrames round-trip as DataFrames without going through read_json.
 def publish_event(channel, data):
-    redis_client.publish(channel, pd.io.json.dumps(data))
+    get_event_broker(REDIS_HOST).publish(channel, data)
 
 def subscribe_events(channel, handler):
-    def listen():
-        pubsub.subscribe(channel)
-        for m in pubsub.listen():
-            if m['type'] == 'message':
-                handler(pd.read_json(m['data']))
-    import threading; threading.Thread(target=listen, daemon=True).start()
+    get_event_broker(REDIS_HOST).subscribe(channel, handler)
 
 # ------- Alpaca Broker API --------
-def alpaca_order(side, symbol, qty):
-    url = f"{ALPACA_BASE}/orders"
-    headers = {
-        "APCA-API-KEY-ID": ALPACA_KEY,
-        "APCA-API-SECRET-KEY": ALPACA_SECRET
-    }
-    payload = {
-        "symbol": symbol,
-        "qty": qty,
-        "side": side,
-        "type": "market",
-        "time_in_force": "gtc"
-    }
-    r = requests.post(url, json=payload, headers=headers)
-    return r.json()
+broker = get_broker("Alpaca", {"alpaca_key": ALPACA_KEY, "alpaca_secret": ALPACA_SECRET}, base_url=ALPACA_BASE)
+
+def alpaca_order(side, symbol, qty, price=None, client_order_id=None):
+    return broker.submit(order_spec(symbol, qty, side, price, client_order_id))
 
 # ------- FastAPI Endpoints --------
+@app.on_event("startup")
+def warm_models():
+    registry.warmup(warm_symbols_from_env())
+
+@app.get("/models/stats")
+def model_stats():
+    return registry.get_stats()
+
 @app.get("/signal/{symbol}")
 @query_duration.time()
 def get_signal(symbol: str):
-    df = pd.read_csv(f"data/{symbol}_latest.csv")
+    df = features.latest_frame(symbol)
     model = get_model(symbol)
-    signal = model.predict(df.tail(1))[0]
+    signal = model.predict(df)[0]
     q_counter.inc()
     return {"signal": signal}
 
+# One Redis subscription per worker, fanned out to every /ws/ticks client
+tick_hub = TickHub()
+
+@app.on_event("startup")
+async def start_tick_hub():
+    tick_hub.start_redis(async_redis, "ticks")
+
 @app.websocket("/ws/ticks")
-async def ticks_ws(websocket: WebSocket):
-    await websocket.accept()
-    while True:
-        tick = resilient(redis_client.brpop, "ticks")
-        await websocket.send_json(tick)
+async def ticks_ws(websocket: WebSocket, symbols: str = "*", format: str = "json"):
+    # ?symbols=AAPL,MSFT (default all) &format=json|msgpack; subscriptions can be
+    # changed later with {"op": "subscribe"|"unsubscribe", "symbols": [...]}
+    await tick_hub.serve(websocket, parse_symbols(symbols), format)
+
+@app.get("/ws/ticks/stats")
+def ticks_ws_stats():
+    return tick_hub.get_stats()
 
 @app.post("/store_tick")
 async def store_tick_api(req: Request):
     payload = await req.json()
-    resilient(store_tick, payload['symbol'], payload['ts'], payload['price'], payload['volume'])
+    # write() can block when the TickWriter buffer is full, so it always runs in the pool
+    await run_io(get_tick_writer().write, payload['symbol'], payload['ts'], payload['price'], payload['volume'])
     return {"status": "ok"}
 
-@app.post("/train_model")
+@app.get("/store_tick/stats")
+def store_tick_stats():
+    return get_tick_writer().get_stats()
+
+@app.post("/train_model", status_code=202)
 async def train_model_api(req: Request):
+    # Training runs as a background job in train_pool; poll /jobs/{job_id}
     payload = await req.json()
-    df = pd.DataFrame(payload['data'])
-    model_class = payload.get("model_class")  # Should be passed as a class (from scikit-learn)
-    params = payload.get("params", {})
+    model_class = payload.get("model_class")  # allowlisted name, see jobs.MODEL_CLASSES
+    params = payload.get("params") or {}
+    try:
+        check_model_request(model_class, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     symbol = payload.get("symbol", "latest")
-    resilient(train_model, df, model_class, params, symbol)
-    return {"status": "trained"}
+    job_id = jobs.submit("train_model", train_model_job, payload['data'], model_class, params, symbol,
+                         registry.path, payload.get("target"), meta={"symbol": symbol})
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@app.get("/jobs")
+def job_list(kind: str = None):
+    return {"jobs": jobs.list(kind)}
 
 @app.post("/alpaca_order")
 async def alpaca_order_api(req: Request):
     p = await req.json()
-    resp = resilient(alpaca_order, p["side"], p["symbol"], p["qty"])
-    return resp
+    # Retries reuse the order's client_order_id, so a retried order is never doubled
+    order = order_spec(p["symbol"], p["qty"], p["side"], p.get("price"), p.get("client_order_id"))
+    return await resilient_async(broker.submit, order, retry=False, retry_on=is_retryable)
+
+@app.post("/alpaca_orders")
+async def alpaca_orders_api(req: Request):
+    orders = [order_spec(o["symbol"], o["qty"], o["side"], o.get("price"), o.get("client_order_id"))
+              for o in (await req.json())["orders"]]
+    results = await asyncio.gather(*(resilient_async(broker.submit, o, retry=False, retry_on=is_retryable) for o in orders),
+                                   return_exceptions=True)
+    return {"results": [{"error": str(r), "client_order_id": o["client_order_id"]} if isinstance(r, Exception) else r
+                        for o, r in zip(orders, results)]}
+
+@app.delete("/alpaca_order/{order_id}")
+def alpaca_cancel_api(order_id: str):
+    return broker.cancel(order_id)
+
+@app.get("/broker/stats")
+def broker_stats():
+    return broker.get_stats()
 
 @app.get("/finnhub_news/{symbol}")
-def finnhub_news_api(symbol: str):
-    news = resilient(get_finnhub_news, symbol)
+async def finnhub_news_api(symbol: str):
+    news = await resilient_async(get_finnhub_news, symbol)
     return {"news": news}
 
 # ------- Entry point (Docker/K8s Ready) -------
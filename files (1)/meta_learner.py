@@ -1,23 +1,186 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
 import pandas as pd
 
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (symbol TEXT, strategy TEXT, ts REAL, stats TEXT,
+    PRIMARY KEY (symbol, strategy, ts)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS metrics (symbol TEXT, metric TEXT, ts REAL, strategy TEXT, value REAL,
+    PRIMARY KEY (symbol, metric, ts, strategy)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_metrics_metric ON metrics (metric, ts);
+CREATE TABLE IF NOT EXISTS latest (symbol TEXT, metric TEXT, strategy TEXT, value REAL, ts REAL,
+    PRIMARY KEY (symbol, metric, strategy)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_latest_rank ON latest (symbol, metric, value DESC, strategy);
+CREATE INDEX IF NOT EXISTS ix_latest_metric ON latest (metric, value DESC);
+"""
+
+def _numeric(stats):
+    # Metrics are the finite numeric entries of a stats dict
+    return {k: float(v) for k, v in stats.items()
+            if isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v)}
+
 class MetaLearner:
-    def __init__(self):
-        # symbol: {'best_strategy': str, 'meta_stats': dict}
-        self.symbol_meta = {}
-
-    def update(self, symbol, strategy_name, stats):
-        meta = self.symbol_meta.setdefault(symbol, {"strategies": {}, "best_strategy": None, "meta_stats": {}})
-        meta['strategies'][strategy_name] = stats
-        # Select best strategy based on win_rate or other meta-stat
-        best = max(meta['strategies'], key=lambda k: meta['strategies'][k].get('win_rate', 0))
-        meta['best_strategy'] = best
-        meta['meta_stats'] = meta['strategies'][best]
-
-    def get_best_strategy(self, symbol):
-        meta = self.symbol_meta.get(symbol)
-        if meta:
-            return meta['best_strategy'], meta['meta_stats']
-        return None, {}
-
-    def get_all(self):
-        return self.symbol_meta
\ No newline at end of file
+    # Per-symbol strategy meta-stats in SQLite. Every update is a run at time ts:
+    # the full stats go to `runs`, numeric entries to `metrics` (history, keyed
+    # by symbol/metric/time for window queries) and to `latest` (current value per
+    # symbol x metric x strategy, indexed by value for ranked lookups). The top-k
+    # strategies per (symbol, rank_metric) are also kept in memory and adjusted
+    # on each update; only a top entry dropping out of the top k reloads the list
+    # from the index. A run replaces the strategy's latest metrics: metrics the
+    # new stats no longer report are dropped from `latest` rather than ranking on
+    # a stale value.
+    def __init__(self, path="data/meta_learner.sqlite", rank_metric="win_rate", top_k=10):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.rank_metric = rank_metric
+        self.top_k = top_k
+        self._top = {}  # (symbol, metric) -> [(value, strategy)] best first
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def update(self, symbol, strategy_name, stats, ts=None):
+        self.update_many([(symbol, strategy_name, stats, ts)])
+
+    def update_many(self, rows):
+        # Bulk upsert in one transaction: rows of (symbol, strategy, stats[, ts])
+        now = time.time()
+        runs, metrics, current = [], [], {}
+        for row in rows:
+            symbol, strategy, stats = row[:3]
+            ts = row[3] if len(row) > 3 and row[3] is not None else now
+            numeric = _numeric(stats)
+            runs.append((symbol, strategy, ts, json.dumps(stats, default=str)))
+            metrics.extend((symbol, m, ts, strategy, v) for m, v in numeric.items())
+            if (symbol, strategy) not in current or ts >= current[(symbol, strategy)][0]:
+                current[(symbol, strategy)] = (ts, set(numeric))
+        # Key order keeps the b-tree inserts local; latest only needs the newest row per key
+        # (stable sorts on the key, so a later row for the same key still wins)
+        runs.sort(key=lambda r: r[:3])
+        metrics.sort(key=lambda r: r[:4])
+        newest = {}
+        for row in metrics:
+            newest[(row[0], row[1], row[3])] = row
+        with self._lock:
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)", runs)
+                self.conn.executemany("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?)", metrics)
+                self.conn.executemany(
+                    "INSERT INTO latest (symbol, metric, ts, strategy, value) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (symbol, metric, strategy) DO UPDATE SET value = excluded.value, ts = excluded.ts "
+                    "WHERE excluded.ts >= latest.ts", newest.values())
+                stale = []
+                for (symbol, strategy), (ts, reported) in current.items():
+                    stale.extend((symbol, m, strategy) for m, in self.conn.execute(
+                        "SELECT metric FROM latest WHERE symbol = ? AND strategy = ? AND ts <= ?",
+                        (symbol, strategy, ts)) if m not in reported)
+                self.conn.executemany("DELETE FROM latest WHERE symbol = ? AND metric = ? AND strategy = ?", stale)
+            for symbol, metric, strategy in list(newest) + stale:
+                if (symbol, metric) in self._top:
+                    try:
+                        self._adjust_top(symbol, metric, strategy)
+                    except Exception:
+                        # The DB has committed; a half-adjusted list must not survive
+                        self._top.pop((symbol, metric), None)
+                        raise
+
+    def update_backtests(self, results, strategy_name, ts=None):
+        # batch_backtest output -> one run per symbol; failed backtests are skipped
+        return self.update_many([(r["symbol"], strategy_name, r["stats"], ts)
+                                 for r in results if not r.get("error") and r.get("stats")])
+
+    def _load_top(self, symbol, metric, k):
+        rows = self.conn.execute("SELECT value, strategy FROM latest WHERE symbol = ? AND metric = ? "
+                                 "ORDER BY value DESC, strategy LIMIT ?", (symbol, metric, k)).fetchall()
+        return [(v, s) for v, s in rows]
+
+    def _adjust_top(self, symbol, metric, strategy):
+        # Keep the cached top-k list right after strategy's latest value changed
+        top = self._top[(symbol, metric)]
+        row = self.conn.execute("SELECT value FROM latest WHERE symbol = ? AND metric = ? AND strategy = ?",
+                                (symbol, metric, strategy)).fetchone()
+        was_in = any(s == strategy for _, s in top)
+        if row is None:
+            # Its latest value was dropped; something further down may move up
+            if was_in:
+                self._top[(symbol, metric)] = self._load_top(symbol, metric, self.top_k)
+            return
+        value = row[0]
+        top[:] = [(v, s) for v, s in top if s != strategy]
+        full = len(top) >= self.top_k - (1 if was_in else 0)
+        if not full or (top and (-value, strategy) < (-top[-1][0], top[-1][1])):
+            top.append((value, strategy))
+            top.sort(key=lambda e: (-e[0], e[1]))
+            del top[self.top_k:]
+        elif was_in:
+            # It fell out of the top k; the next best is somewhere in the index
+            self._top[(symbol, metric)] = self._load_top(symbol, metric, self.top_k)
+
+    def top_strategies(self, symbol, metric=None, k=None):
+        # [(strategy, latest value)] best first
+        metric = metric or self.rank_metric
+        k = k or self.top_k
+        with self._lock:
+            if k > self.top_k:
+                return [(s, v) for v, s in self._load_top(symbol, metric, k)]
+            top = self._top.get((symbol, metric))
+            if top is None:
+                top = self._top[(symbol, metric)] = self._load_top(symbol, metric, self.top_k)
+            return [(s, v) for v, s in top[:k]]
+
+    def _latest_stats(self, symbol, strategy):
+        row = self.conn.execute("SELECT stats FROM runs WHERE symbol = ? AND strategy = ? ORDER BY ts DESC LIMIT 1",
+                                (symbol, strategy)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def get_best_strategy(self, symbol, metric=None):
+        top = self.top_strategies(symbol, metric, 1)
+        with self._lock:
+            if top:
+                return top[0][0], self._latest_stats(symbol, top[0][0])
+            # No strategy reports the metric: fall back to the most recent run
+            row = self.conn.execute("SELECT strategy, stats FROM runs WHERE symbol = ? ORDER BY ts DESC LIMIT 1",
+                                    (symbol,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, {})
+
+    def best_by_window(self, metric, days, symbols=None, agg="avg", now=None):
+        # Best strategy per symbol by agg(metric) over runs in the last `days` days,
+        # e.g. best_by_window("sharpe", 30). Reads only that window through the
+        # (symbol, metric, ts) key or the (metric, ts) index.
+        fn = {"avg": "AVG", "max": "MAX", "min": "MIN", "sum": "SUM"}[agg]
+        where, params = "metric = ? AND ts >= ?", [metric, (now or time.time()) - days * 86400]
+        if symbols is not None:
+            symbols = list(symbols)
+            where += f" AND symbol IN ({','.join('?' * len(symbols))})"
+            params += symbols
+        sql = (f"SELECT symbol, strategy, agg, runs FROM ("
+               f" SELECT symbol, strategy, {fn}(value) AS agg, COUNT(*) AS runs,"
+               f"  ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY {fn}(value) DESC, strategy) AS rn"
+               f" FROM metrics WHERE {where} GROUP BY symbol, strategy) WHERE rn = 1 ORDER BY symbol")
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return pd.DataFrame(rows, columns=["symbol", "strategy", metric, "runs"])
+
+    def get_all(self, symbols=None):
+        # symbol: {'best_strategy': str, 'meta_stats': dict, 'strategies': {name: latest stats}}
+        with self._lock:
+            if symbols is None:
+                symbols = [r[0] for r in self.conn.execute("SELECT DISTINCT symbol FROM runs")]
+            out = {}
+            for symbol in symbols:
+                rows = self.conn.execute("SELECT strategy, stats, MAX(ts) FROM runs WHERE symbol = ? GROUP BY strategy",
+                                         (symbol,)).fetchall()
+                best, meta = self.get_best_strategy(symbol)
+                out[symbol] = {"strategies": {s: json.loads(st) for s, st, _ in rows},
+                               "best_strategy": best, "meta_stats": meta}
+        return out
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,83 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+class MicroBatcher:
+    # Collects concurrent single-row requests per key (e.g. symbol) for up to
+    # window_ms, or until max_batch rows are waiting, then answers all of them
+    # with one batch_fn(key, rows) call run off the event loop. batch_fn returns
+    # one result per row, in order. If the batch call raises, each row is retried
+    # on its own and only the rows that fail again get the exception.
+    def __init__(self, batch_fn, window_ms=5.0, max_batch=256, max_workers=4):
+        self.batch_fn = batch_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch")
+        self._pending = {}  # key -> [(row, future)]
+        self._timers = {}
+        self.stats = {"requests": 0, "batches": 0, "rows": 0, "max_batch_seen": 0, "batch_time_total": 0.0,
+                      "batch_failures": 0, "row_failures": 0}
+
+    async def submit(self, key, row):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.stats["requests"] += 1
+        pending = self._pending.setdefault(key, [])
+        pending.append((row, fut))
+        if len(pending) >= self.max_batch:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await fut
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if batch:
+            asyncio.ensure_future(self._run(key, batch))
+
+    def _run_each(self, key, rows):
+        # Fallback after a failed batch: one call per row, so a bad row only fails itself
+        out = []
+        for row in rows:
+            try:
+                out.append((self.batch_fn(key, [row])[0], None))
+            except Exception as e:
+                out.append((None, e))
+        return out
+
+    async def _run(self, key, batch):
+        rows = [row for row, _ in batch]
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        try:
+            results = [(r, None) for r in await loop.run_in_executor(self._pool, self.batch_fn, key, rows)]
+        except Exception as e:
+            if len(rows) == 1:
+                results = [(None, e)]
+            else:
+                logging.warning(f"Batch of {len(rows)} for {key} failed ({e}), retrying rows one by one")
+                self.stats["batch_failures"] += 1
+                results = await loop.run_in_executor(self._pool, self._run_each, key, rows)
+        self.stats["batches"] += 1
+        self.stats["rows"] += len(rows)
+        self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(rows))
+        self.stats["batch_time_total"] += time.perf_counter() - t0
+        for (_, fut), (result, error) in zip(batch, results):
+            if fut.done():
+                continue
+            if error is not None:
+                self.stats["row_failures"] += 1
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+
+    def get_stats(self):
+        out = dict(self.stats)
+        out["avg_batch"] = out["rows"] / out["batches"] if out["batches"] else 0.0
+        out["window_ms"] = self.window * 1000.0
+        out["max_batch"] = self.max_batch
+        return out
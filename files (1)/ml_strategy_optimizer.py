@@ -1,33 +1,155 @@
+import os
+import math
+import hashlib
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import ParameterGrid
 from backtest import backtest_strategy
-from signals import compute_rsi
+from indicators import RSIState
+try:
+    import optuna
+except ImportError:
+    optuna = None
 
 def random_strategy(df):
     # For demo: returns random Buy/Hold/Sell
     choice = np.random.choice(['Buy', 'Hold', 'Sell'])
     return choice
 
+def rsi_signal_matrix(rsi, lows, highs):
+    # (combos, bars) of +1 Buy / -1 Sell / 0 Hold, same branch order as strategy_func
+    rsi = rsi[None, :]
+    return np.where(rsi < lows[:, None], 1, np.where(rsi > highs[:, None], -1, 0)).astype(np.int8)
+
+def rsi_series(close, period=14):
+    # Whole-history Wilder RSI via pandas ewm; RSIState steps to the same values
+    delta = pd.Series(close, dtype=float).diff()
+    zero_or_nan = delta * 0.
+    gain = delta.where(delta > 0, zero_or_nan).ewm(alpha=1. / period, adjust=False, min_periods=period).mean()
+    loss = (-delta).where(delta < 0, zero_or_nan).ewm(alpha=1. / period, adjust=False, min_periods=period).mean()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (100 - 100 / (1 + gain / loss)).values
+
+def vectorized_backtest(close, signals):
+    # Long-only backtest of every signal row at once: Buy opens a position at the
+    # bar's close when flat, Sell closes it when long, a position still open at the
+    # end is not counted. Profit is accumulated trade by trade (cumsum is sequential)
+    # so it matches a bar-by-bar loop exactly.
+    n = signals.shape[1]
+    bars = np.arange(n)
+    last = np.where(signals != 0, bars, -1)
+    np.maximum.accumulate(last, axis=1, out=last)
+    state = np.take_along_axis(signals, np.maximum(last, 0), axis=1)
+    long = (state == 1) & (last >= 0)
+    prev_long = np.zeros_like(long)
+    prev_long[:, 1:] = long[:, :-1]
+    entries = long & ~prev_long
+    exits = prev_long & ~long
+    entry_bar = np.where(entries, bars, 0)
+    np.maximum.accumulate(entry_bar, axis=1, out=entry_bar)
+    pnl = np.where(exits, close[None, :] - close[entry_bar], 0.)
+    profit = np.cumsum(pnl, axis=1)[:, -1] if n else np.zeros(signals.shape[0])
+    trades = exits.sum(axis=1)
+    wins = (exits & (pnl > 0)).sum(axis=1)
+    win_rate = np.where(trades > 0, wins / np.maximum(trades, 1), 0.)
+    return profit, win_rate, trades
+
+# Per-worker state for search trials, set once by _init_search
+_search = {}
+
+def _init_search(close):
+    _search['close'] = close
+    _search['rsi'] = {}
+
+# Part of every study name: bump when _fold_score's scoring changes, so resumed
+# studies never mix trial values from two objectives
+OBJECTIVE_VERSION = 1
+
+def _fold_score(params, end):
+    # Grid objective (profit + win_rate * 1000) on bars [0, end). RSI at a bar only
+    # depends on earlier bars, so one RSI per period serves every fold.
+    close = _search['close']
+    period = int(params.get('rsi_period', 14))
+    rsi = _search['rsi'].get(period)
+    if rsi is None:
+        rsi = _search['rsi'][period] = rsi_series(close, period)
+    signals = rsi_signal_matrix(rsi[:end], np.array([params['rsi_low']]), np.array([params['rsi_high']]))
+    profit, win_rate, _ = vectorized_backtest(close[:end], signals)
+    return float(profit[0] + win_rate[0] * 1000)
+
+def _suggest(trial, name, space):
+    # (low, high) -> int or float range; a grid list of evenly spaced ints -> an
+    # int range with that step, so TPE can use their order; other lists -> categorical
+    if isinstance(space, tuple):
+        low, high = space
+        if isinstance(low, int) and isinstance(high, int):
+            return trial.suggest_int(name, low, high)
+        return trial.suggest_float(name, low, high)
+    values = sorted(space) if all(isinstance(v, int) and not isinstance(v, bool) for v in space) else None
+    if values and len(values) > 2 and len(set(np.diff(values))) == 1:
+        return trial.suggest_int(name, values[0], values[-1], step=int(values[1] - values[0]))
+    return trial.suggest_categorical(name, list(space))
+
 class MLStrategyOptimizer:
     def __init__(self, param_grid=None):
         self.param_grid = param_grid or {'rsi_low':[15,25,30], 'rsi_high':[70,75,80], 'sma_period':[15,20,30]}
         self.top_strategies = []
+        self._rsi_local = threading.local()  # per-thread RSI cache: strategies may run on a pool
+
+    def last_rsi(self, close, period=14):
+        # Backtests call the strategy on growing prefixes of one frame: step the
+        # RSI state by one bar when the frame extends the last one seen, and only
+        # rebuild it from scratch otherwise. The cache is per thread, so concurrent
+        # callers (e.g. StrategyEnsemble's pool) never step each other's state.
+        n = len(close)
+        if n == 0:
+            return np.nan
+        idx, values = close.index, close.values
+        caches = self._rsi_local.__dict__.setdefault('rsi', {})
+        cache = caches.get(period)
+        if cache and (idx[0], values[0]) == cache['first']:
+            if n == cache['n'] and (idx[-1], values[-1]) == cache['last']:
+                return cache['value']
+            if n == cache['n'] + 1 and (idx[-2], values[-2]) == cache['last']:
+                cache['value'] = float(cache['state'].update(values[-1]))
+                cache['n'], cache['last'] = n, (idx[-1], values[-1])
+                return cache['value']
+        state = RSIState(period)
+        value = float(state.run(values)[-1])
+        caches[period] = {'state': state, 'first': (idx[0], values[0]),
+                                   'last': (idx[-1], values[-1]), 'n': n, 'value': value}
+        return value
 
     def strategy_func(self, df, params):
-        rsi = compute_rsi(df["Close"], period=14)
-        if rsi.iloc[-1] < params['rsi_low']:
+        rsi = self.last_rsi(df["Close"], period=params.get('rsi_period', 14))
+        if rsi < params['rsi_low']:
             return 'Buy'
-        elif rsi.iloc[-1] > params['rsi_high']:
+        elif rsi > params['rsi_high']:
             return 'Sell'
         else:
             return 'Hold'
 
-    def optimize(self, df):
+    def strategy_signals(self, df, params):
+        # strategy_func for every bar at once, as +1/-1/0 codes
+        rsi = rsi_series(df["Close"].values, params.get('rsi_period', 14))
+        return rsi_signal_matrix(rsi, np.array([params['rsi_low']]), np.array([params['rsi_high']]))[0]
+
+    def optimize(self, df, backend='grid', chunk_cells=4_000_000, **search):
+        if backend == 'vectorized':
+            return self.optimize_vectorized(df, chunk_cells=chunk_cells)
+        if backend == 'optuna':
+            return self.optimize_optuna(df, **search)
+        return self.optimize_grid(df)
+
+    def optimize_grid(self, df, param_grid=None):
+        # Reference search: every combination through backtest_strategy
         best_score = -np.inf
         best_params = None
         best_log = []
-        for params in ParameterGrid(self.param_grid):
+        for params in ParameterGrid(param_grid or self.param_grid):
             strat = lambda data: self.strategy_func(data, params)
             log, stats = backtest_strategy(df, strategy_func=strat)
             score = stats['profit'] + stats['win_rate'] * 1000
@@ -36,6 +158,129 @@ class MLStrategyOptimizer:
         self.top_strategies.append({'params': best_params, 'score': best_score, 'log': best_log})
         return best_params, best_score, best_log
 
+    def _replay(self, df, params, score):
+        # Trade log of the winner through backtest_strategy -> (log, stats), or None
+        # when the replay's score is not bit-identical to the fast scorer's: that
+        # scorer has drifted from the reference, so its winner cannot be trusted.
+        log, stats = backtest_strategy(df, strategy_func=lambda data: self.strategy_func(data, params))
+        replay_score = stats['profit'] + stats['win_rate'] * 1000
+        if replay_score != score:
+            logging.error(f"Search score {score} for {params} differs from the backtest_strategy "
+                          f"replay ({replay_score}); rerunning the grid search")
+            return None
+        return log, stats
+
+    def optimize_vectorized(self, df, chunk_cells=4_000_000):
+        # Whole grid in one pass: RSI once per distinct period, signal matrices for
+        # every distinct (period, rsi_low, rsi_high) by broadcasting, chunked so a
+        # chunk holds at most chunk_cells signal cells. Grid order and the strict '>'
+        # tie-break are kept, so the winner is the one the grid loop would pick.
+        grid = list(ParameterGrid(self.param_grid))
+        close = df["Close"].values.astype(float)
+        keys = np.array([(p.get('rsi_period', 14), p['rsi_low'], p['rsi_high']) for p in grid], dtype=float)
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        scores_u = np.empty(len(uniq))
+        rows = max(1, chunk_cells // max(len(close), 1))
+        for period in np.unique(uniq[:, 0]):
+            rsi = RSIState(int(period)).run(close)
+            sel = np.flatnonzero(uniq[:, 0] == period)
+            for start in range(0, len(sel), rows):
+                part = sel[start:start + rows]
+                signals = rsi_signal_matrix(rsi, uniq[part, 1], uniq[part, 2])
+                profit, win_rate, _ = vectorized_backtest(close, signals)
+                scores_u[part] = profit + win_rate * 1000
+        scores = np.nan_to_num(scores_u[inverse], nan=-np.inf)
+        best = int(np.argmax(scores))
+        best_params, best_score = grid[best], float(scores[best])
+        # Only the winner is replayed through backtest_strategy to produce its trade log
+        replay = self._replay(df, best_params, best_score)
+        if replay is None:
+            return self.optimize_grid(df)
+        best_log, best_stats = replay
+        self.top_strategies.append({'params': best_params, 'score': best_score, 'log': best_log,
+                                    'stats': best_stats})
+        return best_params, best_score, best_log
+
+    def optimize_optuna(self, df, n_trials=100, sampler='tpe', n_folds=4, n_jobs=None, param_space=None,
+                        storage="sqlite:///data/optuna_studies.sqlite", study_name=None, seed=None, prune=True):
+        # TPE or random search instead of the full grid. Each trial is scored on
+        # walk-forward folds (growing prefixes of the history) and reported after
+        # every fold, so the median pruner drops trials that trail the median
+        # early; the last fold is the whole frame, so completed trials carry the
+        # exact grid score. Folds run on a process pool (n_jobs cores) while this
+        # process owns the study (ask/tell), so the SQLite storage has a single
+        # writer. A study is named after the data, search space, folds, sampler and
+        # objective version and reloaded from storage, so a rerun of the same search
+        # resumes it; params already scored are reused.
+        if optuna is None:
+            raise ImportError("backend='optuna' needs optuna (see requirements.txt)")
+        space = param_space or self.param_grid
+        close = df["Close"].values.astype(float)
+        n = len(close)
+        ends = sorted({max(1, round(n * (i + 1) / n_folds)) for i in range(n_folds)})
+        if study_name is None:
+            setup = repr((sorted(space.items()), n_folds, sampler, OBJECTIVE_VERSION)).encode()
+            digest = hashlib.sha1(close.tobytes() + setup).hexdigest()[:16]
+            study_name = f"rsi-v{OBJECTIVE_VERSION}-{digest}"
+        if storage and storage.startswith("sqlite:///"):
+            os.makedirs(os.path.dirname(storage[len("sqlite:///"):]) or ".", exist_ok=True)
+        samplers = {'tpe': lambda: optuna.samplers.TPESampler(seed=seed, constant_liar=True),
+                    'random': lambda: optuna.samplers.RandomSampler(seed=seed)}
+        pruner = optuna.pruners.MedianPruner(n_startup_trials=10, n_warmup_steps=1) if prune else optuna.pruners.NopPruner()
+        study = optuna.create_study(study_name=study_name, storage=storage, direction="maximize",
+                                    sampler=samplers[sampler](), pruner=pruner, load_if_exists=True)
+        key = lambda params: tuple(sorted(params.items()))
+        scored = {key(t.params): t.value for t in study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,))}
+        stats = {"trials": 0, "fold_evals": 0, "full_evals": 0, "pruned": 0, "reused": 0, "failed": 0}
+        n_jobs = n_jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_search, initargs=(close,)) as pool:
+            running = {}  # future -> (trial, params, fold)
+            while stats["trials"] < n_trials or running:
+                while stats["trials"] < n_trials and len(running) < n_jobs:
+                    trial = study.ask()
+                    stats["trials"] += 1
+                    params = {name: _suggest(trial, name, values) for name, values in space.items()}
+                    if key(params) in scored:
+                        study.tell(trial, scored[key(params)])
+                        stats["reused"] += 1
+                        continue
+                    running[pool.submit(_fold_score, params, ends[0])] = (trial, params, 0)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    trial, params, fold = running.pop(fut)
+                    try:
+                        score = fut.result()
+                    except Exception as e:
+                        score = math.nan
+                        logging.error(f"Trial {trial.number} {params} failed: {e}")
+                    stats["fold_evals"] += 1
+                    if not math.isfinite(score):
+                        study.tell(trial, state=optuna.trial.TrialState.FAIL)
+                        stats["failed"] += 1
+                    elif fold + 1 == len(ends):
+                        study.tell(trial, score)
+                        scored[key(params)] = score
+                        stats["full_evals"] += 1
+                    else:
+                        trial.report(score, fold)
+                        if trial.should_prune():
+                            study.tell(trial, state=optuna.trial.TrialState.PRUNED)
+                            stats["pruned"] += 1
+                        else:
+                            running[pool.submit(_fold_score, params, ends[fold + 1])] = (trial, params, fold + 1)
+        best_params, best_score = study.best_params, float(study.best_value)
+        replay = self._replay(df, best_params, best_score)
+        if replay is None:
+            if any(isinstance(v, tuple) for v in space.values()):
+                raise RuntimeError(f"Optuna score {best_score} for {best_params} does not match backtest_strategy "
+                                   "and the (low, high) ranges in the search space have no grid to fall back to")
+            return self.optimize_grid(df, space)
+        best_log, best_stats = replay
+        self.top_strategies.append({'params': best_params, 'score': best_score, 'log': best_log,
+                                    'stats': best_stats, 'search': dict(stats, study=study_name)})
+        return best_params, best_score, best_log
+
     def predict(self, df):
         if not self.top_strategies:
             return random_strategy(df)
@@ -1,14 +1,189 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
 import joblib
 
 class ModelRegistry:
-    def __init__(self, path='./models'):
+    # In-process LRU of unpickled models. An entry is reused until its file's
+    # mtime/size changes; with check_hash the content hash decides whether the
+    # file is actually reloaded (e.g. after a touch or an identical re-save).
+    def __init__(self, path='./models', max_entries=32, max_bytes=512 * 1024 * 1024, check_hash=True):
         self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.check_hash = check_hash
+        self._cache = OrderedDict()  # symbol -> {'model', 'mtime', 'size', 'digest'}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self._importance = OrderedDict()  # (model_version, fingerprint) -> result
+        self.stats = {"hits": 0, "misses": 0, "reloads": 0, "evictions": 0,
+                      "load_count": 0, "load_time_total": 0.0, "load_time_max": 0.0,
+                      "importance_hits": 0, "importance_misses": 0}
+
+    def model_path(self, symbol):
+        return f"{self.path}/{symbol}_best.pkl"
+
+    def _digest(self, file_path):
+        h = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _evict(self):
+        while self._cache and (len(self._cache) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._cache.popitem(last=False)
+            self._bytes -= entry['size']
+            self.stats['evictions'] += 1
+
+    def _fresh(self, entry, st, file_path):
+        if entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            return True
+        if self.check_hash and entry['digest'] == self._digest(file_path):
+            # Same bytes under a new mtime: keep the loaded model
+            entry['mtime'] = st.st_mtime_ns
+            return True
+        return False
 
     def get_model(self, symbol):
+        file_path = self.model_path(symbol)
         try:
-            return joblib.load(f"{self.path}/{symbol}_best.pkl")
-        except:
+            st = os.stat(file_path)
+        except OSError:
+            with self._lock:
+                entry = self._cache.pop(symbol, None)
+                if entry:
+                    self._bytes -= entry['size']
             return None
+        with self._lock:
+            entry = self._cache.get(symbol)
+            if entry and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+                self._cache.move_to_end(symbol)
+                self.stats['hits'] += 1
+                return entry['model']
+            load_lock = self._load_locks.setdefault(symbol, threading.Lock())
+        # One loader per symbol; concurrent requests wait for it instead of unpickling twice
+        with load_lock:
+            with self._lock:
+                entry = self._cache.get(symbol)
+                if entry and self._fresh(entry, st, file_path):
+                    self._cache.move_to_end(symbol)
+                    self.stats['hits'] += 1
+                    return entry['model']
+                self.stats['misses'] += 1
+                if entry:
+                    self.stats['reloads'] += 1
+            try:
+                t0 = time.perf_counter()
+                model = joblib.load(file_path)
+                elapsed = time.perf_counter() - t0
+                digest = self._digest(file_path) if self.check_hash else None
+            except Exception as e:
+                logging.error(f"Model load error for {symbol}: {e}")
+                return None
+            with self._lock:
+                old = self._cache.pop(symbol, None)
+                if old:
+                    self._bytes -= old['size']
+                self._cache[symbol] = {"model": model, "mtime": st.st_mtime_ns,
+                                       "size": st.st_size, "digest": digest}
+                self._bytes += st.st_size
+                self.stats['load_count'] += 1
+                self.stats['load_time_total'] += elapsed
+                self.stats['load_time_max'] = max(self.stats['load_time_max'], elapsed)
+                self._evict()
+            return model
 
     def save_model(self, symbol, model):
-        joblib.dump(model, f"{self.path}/{symbol}_best.pkl")
\ No newline at end of file
+        joblib.dump(model, self.model_path(symbol))
+        self.invalidate(symbol)
+
+    def invalidate(self, symbol=None):
+        with self._lock:
+            if symbol is None:
+                self._cache.clear()
+                self._bytes = 0
+            else:
+                entry = self._cache.pop(symbol, None)
+                if entry:
+                    self._bytes -= entry['size']
+
+    def model_version(self, symbol):
+        # Content digest of the symbol's model file (None if it does not exist)
+        file_path = self.model_path(symbol)
+        with self._lock:
+            entry = self._cache.get(symbol)
+        if entry and entry['digest']:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                return None
+            if entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+                return entry['digest']
+        return self._digest(file_path) if os.path.exists(file_path) else None
+
+    def get_importance(self, model_version, fingerprint, compute):
+        # Feature importances per (model version, dataset fingerprint), kept in memory
+        # and as JSON under path/importance/ so restarts and reruns reuse them.
+        key = (model_version, fingerprint)
+        with self._lock:
+            if key in self._importance:
+                self._importance.move_to_end(key)
+                self.stats['importance_hits'] += 1
+                return self._importance[key]
+        file_path = os.path.join(self.path, "importance", f"{model_version}_{fingerprint}.json")
+        try:
+            with open(file_path) as f:
+                result = json.load(f)
+            hit = True
+        except (OSError, ValueError):
+            result = compute()
+            hit = False
+            try:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                tmp = f"{file_path}.{os.getpid()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump(result, f)
+                os.replace(tmp, file_path)
+            except OSError as e:
+                logging.warning(f"Could not persist importance {file_path}: {e}")
+        with self._lock:
+            self.stats['importance_hits' if hit else 'importance_misses'] += 1
+            self._importance[key] = result
+            while len(self._importance) > self.max_entries * 4:
+                self._importance.popitem(last=False)
+        return result
+
+    def warmup(self, symbols):
+        # Preload models so the first request per symbol is already a hit
+        loaded = []
+        for symbol in symbols:
+            if self.get_model(symbol) is not None:
+                loaded.append(symbol)
+        return loaded
+
+    def get_stats(self):
+        with self._lock:
+            out = dict(self.stats)
+            out['entries'] = len(self._cache)
+            out['bytes'] = self._bytes
+            lookups = out['hits'] + out['misses']
+            out['hit_rate'] = out['hits'] / lookups if lookups else 0.0
+            return out
+
+_default_registry = None
+
+def get_registry(path=None):
+    # Process-wide registry shared by the API endpoints
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = ModelRegistry(path or os.environ.get("MODEL_PATH", "./models"))
+    return _default_registry
+
+def warm_symbols_from_env(var="WARM_SYMBOLS"):
+    return [s.strip() for s in os.environ.get(var, "").split(",") if s.strip()]
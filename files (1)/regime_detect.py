@@ -1,21 +1,206 @@
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
 
 def compute_volatility(prices, window=10):
     return prices.pct_change().rolling(window).std()
 
-def regime_detection(df, n_regimes=2):
-    df['vol'] = compute_volatility(df['Close'])
-    # Cluster on volatility and/or returns
-    X = df[['vol']].dropna().values
-    kmeans = KMeans(n_clusters=n_regimes)
-    regime_labels = kmeans.fit_predict(X)
-    df['regime'] = np.nan
-    df.loc[df[['vol']].dropna().index, 'regime'] = regime_labels
-    return df
-
-def is_risk_on(df):
+class OnlineRegimeDetector:
+    # Streaming volatility regimes, O(1) per bar. Volatility is compute_volatility's
+    # rolling std over a ring of the last vol_window returns; each value is
+    # assigned to the nearest of n_regimes centroids, which then moves towards it
+    # (sequential k-means, learning rate 1/count floored at min_rate so centroids
+    # keep tracking drifting markets). Centroids are seeded from quantiles of the
+    # first `warmup` values (regime is NaN until then) and stay sorted, since a
+    # centroid never moves past the point it was nearest to: regime 0 is always
+    # the calmest. Like IndicatorEngine, n_symbols=None steps one series and an
+    # int steps a vector of symbols.
+    def __init__(self, n_regimes=2, vol_window=10, warmup=50, min_rate=0.005, n_symbols=None):
+        self.scalar = n_symbols is None
+        n = 1 if self.scalar else int(n_symbols)
+        self.n_regimes = n_regimes
+        self.vol_window = vol_window
+        self.warmup = max(int(warmup), n_regimes)
+        self.min_rate = min_rate
+        self.prev_close = np.full(n, np.nan)
+        self.returns = np.full((vol_window, n), np.nan)  # oldest first
+        self.centroids = np.full((n, n_regimes), np.nan)
+        self.counts = np.zeros((n, n_regimes))
+        self.seen = np.zeros(n, dtype=np.int64)
+        self.trained = False  # every symbol past warm-up
+        self._warm = np.full((n, self.warmup), np.nan)
+        self._rows = np.arange(n)
+        self.last = None
+
+    def _volatility(self, closes):
+        # closes: (bars, n) -> rolling std for those bars, continuing from the ring
+        prev = np.vstack([self.prev_close[None, :], closes[:-1]])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rets = closes / prev - 1
+        rets = np.vstack([self.returns, rets])
+        self.prev_close = closes[-1].copy()
+        self.returns = rets[-self.vol_window:].copy()
+        if len(closes) == 1:
+            return np.std(self.returns, axis=0, ddof=1)[None, :]
+        return pd.DataFrame(rets).rolling(self.vol_window).std().values[self.vol_window:]
+
+    def _warm_up(self, vol, obs):
+        rows = self._rows[obs & (self.seen < self.warmup)]
+        if len(rows):
+            self._warm[rows, self.seen[rows]] = vol[rows]
+            ready = rows[self.seen[rows] + 1 == self.warmup]
+            if len(ready):
+                q = (np.arange(self.n_regimes) + 0.5) / self.n_regimes
+                self.centroids[ready] = np.quantile(self._warm[ready], q, axis=1).T
+                self.counts[ready] = self.warmup / self.n_regimes
+        self.seen = self.seen + obs
+        self.trained = bool((self.seen > self.warmup).all())
+
+    def _assign(self, vol):
+        obs = vol == vol
+        learn = obs & (self.seen >= self.warmup)
+        if not self.trained:
+            self._warm_up(vol, obs)
+        dist = np.abs(self.centroids - vol[:, None])
+        nearest = np.argmin(np.where(dist == dist, dist, np.inf), axis=1)
+        regime = np.where(obs & (self.seen >= self.warmup), nearest, np.nan)
+        if learn.all():
+            c = nearest
+            self.counts[self._rows, c] += 1
+            rate = np.maximum(1. / self.counts[self._rows, c], self.min_rate)
+            self.centroids[self._rows, c] += rate * (vol - self.centroids[self._rows, c])
+        elif learn.any():
+            rows, c = self._rows[learn], nearest[learn]
+            self.counts[rows, c] += 1
+            rate = np.maximum(1. / self.counts[rows, c], self.min_rate)
+            self.centroids[rows, c] += rate * (vol[rows] - self.centroids[rows, c])
+        return regime
+
+    def label(self, vol):
+        # Regime of each vol (bars,) or (bars, n_symbols) under the current
+        # centroids; NaN where vol is NaN or the symbol is still warming up
+        vol = np.asarray(vol, dtype=float)
+        v = vol.reshape(len(vol), -1)
+        dist = np.abs(v[:, :, None] - self.centroids[None, :, :])
+        nearest = np.argmin(np.where(dist == dist, dist, np.inf), axis=2)
+        ok = (v == v) & (self.seen >= self.warmup)[None, :]
+        return np.where(ok, nearest, np.nan).reshape(vol.shape)
+
+    def update(self, close):
+        close = np.atleast_1d(np.asarray(close, dtype=float))
+        vol = self._volatility(close[None, :])[0]
+        self.last = {"vol": vol, "regime": self._assign(vol)}
+        return {k: v[0] for k, v in self.last.items()} if self.scalar else self.last
+
+    def run(self, closes):
+        # Batch mode: closes is (bars,) or (bars, n_symbols); returns arrays of the same shape.
+        # Volatility for the whole batch is one vectorized rolling pass.
+        closes = np.asarray(closes, dtype=float)
+        shape = closes.shape
+        if not shape[0]:
+            return {"vol": np.empty(shape), "regime": np.empty(shape)}
+        vol = self._volatility(closes.reshape(shape[0], -1))
+        regime = np.empty(vol.shape)
+        for i in range(len(vol)):
+            regime[i] = self._assign(vol[i])
+        self.last = {"vol": vol[-1], "regime": regime[-1]}
+        return {"vol": vol.reshape(shape), "regime": regime.reshape(shape)}
+
+class RegimeCache:
+    # Fitted detectors per (symbol, n_regimes) with their vol/regime history. A
+    # repeat call on the same or a longer frame only feeds the new bars; a frame
+    # that no longer extends the cached one (history reloaded, bars revised)
+    # refits from scratch. Least recently used symbols are dropped past max_symbols.
+    def __init__(self, max_symbols=256, **params):
+        self.max_symbols = max_symbols
+        self.params = params
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "refits": 0, "bars": 0}
+
+    def _extends(self, e, close):
+        n = e["n"]
+        if n > len(close):
+            return False
+        if n == 0:
+            return True
+        last = close.iat[n - 1]
+        # NaN closes (gaps) compare unequal to themselves
+        same = last == e["last_close"] or (last != last and e["last_close"] != e["last_close"])
+        return close.index[n - 1] == e["last_index"] and same
+
+    def update(self, symbol, close, n_regimes=2):
+        key = (symbol, n_regimes)
+        with self._lock:
+            e = self._entries.get(key)
+            if e is not None and self._extends(e, close):
+                self.stats["hits"] += 1
+                self._entries.move_to_end(key)
+            else:
+                self.stats["refits"] += 1
+                e = self._entries[key] = {"detector": OnlineRegimeDetector(n_regimes, **self.params), "n": 0,
+                                          "vol": np.empty(0), "regime": np.empty(0)}
+                while len(self._entries) > self.max_symbols:
+                    self._entries.popitem(last=False)
+            new = close.values[e["n"]:]
+            if len(new):
+                res = e["detector"].run(new)
+                e["vol"] = np.concatenate([e["vol"], res["vol"]])
+                e["regime"] = np.concatenate([e["regime"], res["regime"]])
+                e["n"] = len(close)
+                e["last_index"], e["last_close"] = close.index[-1], close.iat[-1]
+                self.stats["bars"] += len(new)
+            return e["vol"], e["regime"]
+
+    def detector(self, symbol, n_regimes=2):
+        e = self._entries.get((symbol, n_regimes))
+        return None if e is None else e["detector"]
+
+    def latest(self, symbol, n_regimes=2):
+        # O(1): last (vol, regime) seen for symbol, or None
+        e = self._entries.get((symbol, n_regimes))
+        if e is None or e["n"] == 0:
+            return None
+        return e["vol"][-1], e["regime"][-1]
+
+    def get_stats(self):
+        return dict(self.stats, symbols=len(self._entries))
+
+_regime_cache = None
+
+def get_regime_cache():
+    global _regime_cache
+    if _regime_cache is None:
+        _regime_cache = RegimeCache()
+    return _regime_cache
+
+def regime_detection(df, n_regimes=2, symbol=None):
+    # Returns a copy of df with 'vol' and 'regime' columns; the caller's frame is
+    # left alone. With a symbol the fitted state is cached across calls. The
+    # online labels were assigned with the centroids of their time, so for display
+    # the whole history is relabelled against the current centroids.
+    if symbol is not None:
+        cache = get_regime_cache()
+        vol, _ = cache.update(symbol, df['Close'], n_regimes)
+        detector = cache.detector(symbol, n_regimes)
+    else:
+        detector = OnlineRegimeDetector(n_regimes)
+        vol = detector.run(df['Close'].values)["vol"]
+    out = df.copy()
+    out['vol'] = vol
+    out['regime'] = detector.label(vol)
+    return out
+
+def regime_batch(closes, n_regimes=2, **params):
+    # Many symbols in one vectorized pass: closes is a DataFrame of bars x symbols;
+    # returns (vol, regime) DataFrames of the same shape
+    res = OnlineRegimeDetector(n_regimes, n_symbols=closes.shape[1], **params).run(closes.values)
+    return (pd.DataFrame(res["vol"], index=closes.index, columns=closes.columns),
+            pd.DataFrame(res["regime"], index=closes.index, columns=closes.columns))
+
+def is_risk_on(df, window=10):
     # Basic demo: if volatility is high, risk-off. Else, risk-on.
-    vol = compute_volatility(df['Close']).iloc[-1]
-    return 'risk-on' if vol < 0.02 else 'risk-off'
\ No newline at end of file
+    # Reads the last value only: the 'vol' column if present, else the last window of returns
+    vol = df['vol'].iloc[-1] if 'vol' in df else compute_volatility(df['Close'].iloc[-(window + 1):], window).iloc[-1]
+    return 'risk-on' if vol < 0.02 else 'risk-off'
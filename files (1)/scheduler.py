@@ -1,23 +1,213 @@
-import threading
 import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from prometheus_client import Counter, Histogram
+
+job_runs = Counter("scheduler_job_runs_total", "Scheduled job runs by outcome", ["job", "result"])
+job_runtime = Histogram("scheduler_job_seconds", "Scheduled job runtime", ["job"])
+job_lateness = Histogram("scheduler_job_lateness_seconds", "Delay between a job's due time and its start", ["job"])
+
+FIXED_RATE = "fixed_rate"    # due at start + k * interval, whatever the runtime
+FIXED_DELAY = "fixed_delay"  # due interval after the previous run finished
+
+def _timed_call(func, args, kwargs):
+    # Runs in the worker (thread or process); exceptions come back as repr so
+    # they survive pickling. time.monotonic is system-wide on Linux.
+    start = time.monotonic()
+    try:
+        result, error = func(*args, **kwargs), None
+    except Exception as e:
+        result, error = None, repr(e)
+    return start, time.monotonic(), result, error
+
+class ScheduledJob:
+    def __init__(self, scheduler, name, func, interval, mode, jitter, args, kwargs):
+        self.scheduler = scheduler
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.mode = mode
+        self.jitter = jitter
+        self.args = args
+        self.kwargs = kwargs
+        self.base = None
+        self.slot = 0
+        self.due = None
+        self.running = False
+        self.cancelled = False
+        self.future = None
+        self.stats = {"runs": 0, "failures": 0, "skipped": 0, "last_error": None, "last_runtime": None, "max_runtime": 0.0, "last_lateness": None, "max_lateness": 0.0}
+
+    def cancel(self, wait=False):
+        return self.scheduler.cancel(self.name, wait)
 
 class Scheduler:
-    def __init__(self):
-        self.jobs = {}
-
-    def schedule(self, name, func, interval_sec):
-        if name in self.jobs:
-            self.cancel(name)
-        def job_wrapper():
-            while True:
-                func()
-                time.sleep(interval_sec)
-        t = threading.Thread(target=job_wrapper)
-        t.daemon = True
-        t.start()
-        self.jobs[name] = t
-
-    def cancel(self, name):
-        # For demo: cannot truly kill thread, just mark removed
-        if name in self.jobs:
-            del self.jobs[name]
\ No newline at end of file
+    # One timer thread over a heap of (due, seq, job); due runs go to a bounded
+    # worker pool (threads, or processes for picklable CPU-bound jobs). Fixed-rate
+    # jobs stay on their start + k * interval grid, so runtime never shifts later
+    # runs; fixed-delay jobs wait interval after each run. A job never overlaps
+    # itself: a fixed-rate slot that comes due while the previous run is still
+    # going is skipped and counted. jitter adds uniform [0, jitter) seconds to
+    # each due time without moving the grid. Cancelled jobs lose their queued
+    # run and are never rescheduled; a run already executing is left to finish.
+    def __init__(self, max_workers=4, processes=False, executor=None):
+        pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self.executor = executor or pool(max_workers=max_workers)
+        self._heap = []
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, name, func, interval_sec, mode=FIXED_RATE, jitter=0.0, start_in=0.0, args=(), kwargs=None):
+        if mode not in (FIXED_RATE, FIXED_DELAY):
+            raise ValueError(f"Unknown schedule mode {mode}")
+        if interval_sec <= 0:
+            raise ValueError("interval_sec must be positive")
+        job = ScheduledJob(self, name, func, interval_sec, mode, jitter, tuple(args), kwargs or {})
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Scheduler is shut down")
+            old = self._jobs.pop(name, None)
+            if old is not None:
+                self._cancel(old)
+            self._jobs[name] = job
+            job.base = time.monotonic() + start_in
+            self._push(job, job.base)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return job
+
+    def _push(self, job, due):
+        job.due = due + (random.uniform(0, job.jitter) if job.jitter else 0.0)
+        heapq.heappush(self._heap, (job.due, next(self._seq), job))
+
+    def _next_slot(self, job, now):
+        # Next grid point after now; slots the timer slept through are skipped
+        slot = max(job.slot + 1, int((now - job.base) // job.interval) + 1)
+        job.stats["skipped"] += slot - job.slot - 1
+        job.slot = slot
+        self._push(job, job.base + slot * job.interval)
+
+    def _run(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, _, job = self._heap[0]
+                now = time.monotonic()
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+                heapq.heappop(self._heap)
+                if job.cancelled or job.due != due:
+                    continue
+                if job.running:
+                    job.stats["skipped"] += 1
+                    self._next_slot(job, now)
+                    continue
+                self._dispatch(job, due)
+                if job.mode == FIXED_RATE:
+                    self._next_slot(job, now)
+
+    def _dispatch(self, job, due):
+        try:
+            fut = self.executor.submit(_timed_call, job.func, job.args, job.kwargs)
+        except Exception as e:
+            job.stats["failures"] += 1
+            job.stats["last_error"] = repr(e)
+            job_runs.labels(job.name, "error").inc()
+            logging.error(f"Could not start scheduled job {job.name}: {e}")
+            if job.mode == FIXED_DELAY:
+                self._push(job, time.monotonic() + job.interval)
+            return
+        job.running = True
+        job.future = fut
+        fut.add_done_callback(lambda f: self._done(job, due, f))
+
+    def _done(self, job, due, fut):
+        stats = job.stats
+        start = None
+        if fut.cancelled():
+            error = "cancelled"
+        else:
+            try:
+                start, end, result, error = fut.result()
+            except Exception as e:  # e.g. a crashed worker process
+                start, end, result, error = None, None, None, repr(e)
+        if start is not None:
+            lateness, runtime = max(0.0, start - due), end - start
+            job_lateness.labels(job.name).observe(lateness)
+            job_runtime.labels(job.name).observe(runtime)
+            stats["last_lateness"] = lateness
+            stats["max_lateness"] = max(stats["max_lateness"], lateness)
+            stats["last_runtime"] = runtime
+            stats["max_runtime"] = max(stats["max_runtime"], runtime)
+        if error is None:
+            stats["runs"] += 1
+            job_runs.labels(job.name, "ok").inc()
+        elif error != "cancelled":
+            stats["failures"] += 1
+            stats["last_error"] = error
+            job_runs.labels(job.name, "error").inc()
+            logging.error(f"Scheduled job {job.name} failed: {error}")
+        with self._cond:
+            job.running = False
+            if job.mode == FIXED_DELAY and not job.cancelled and not self._stopped:
+                self._push(job, time.monotonic() + job.interval)
+                self._cond.notify()
+            self._cond.notify_all()
+
+    def _cancel(self, job):
+        job.cancelled = True
+        if job.future is not None:
+            job.future.cancel()  # only succeeds while still queued in the pool
+
+    def cancel(self, name, wait=False):
+        with self._cond:
+            job = self._jobs.pop(name, None)
+            if job is None:
+                return False
+            self._cancel(job)
+            while wait and job.running:
+                self._cond.wait()
+        return True
+
+    def jobs(self):
+        return list(self._jobs)
+
+    def get_stats(self):
+        now = time.monotonic()
+        with self._cond:
+            return {name: dict(job.stats, mode=job.mode, interval=job.interval, running=job.running,
+                               next_run_in=None if job.running and job.mode == FIXED_DELAY else max(0.0, job.due - now))
+                    for name, job in self._jobs.items()}
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._stopped = True
+            for job in self._jobs.values():
+                self._cancel(job)
+            self._jobs.clear()
+            self._heap.clear()
+            self._cond.notify_all()
+        self.executor.shutdown(wait=wait)
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+def get_scheduler(max_workers=None):
+    # Process-wide scheduler shared by the app, main and backtest_tasks
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = Scheduler(max_workers=max_workers or 4)
+    return _default_scheduler
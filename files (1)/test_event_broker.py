@@ -0,0 +1,112 @@
+import time
+import threading
+import pandas as pd
+import pytest
+from event_broker import RedisTransport, msgpack
+
+fakeredis = pytest.importorskip("fakeredis")
+
+@pytest.fixture
+def r():
+    return fakeredis.FakeRedis()
+
+@pytest.fixture
+def transports():
+    opened = []
+    def make(client, **kwargs):
+        t = RedisTransport(client=client, mode="streams", **kwargs)
+        opened.append(t)
+        return t
+    yield make
+    for t in opened:
+        t.close()
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return cond()
+
+def pending(r, stream, group="workers"):
+    return r.xpending(stream, group)["pending"]
+
+@pytest.mark.parametrize("codec", ["json", pytest.param("msgpack", marks=pytest.mark.skipif(
+    msgpack is None, reason="msgpack not installed"))])
+def test_dataframe_round_trip(r, transports, codec):
+    # Datetimes travel as int64 ns
+    ts = pd.date_range("2024-01-02 09:30", periods=3, freq="min", tz="America/New_York").as_unit("ns")
+    df = pd.DataFrame({"close": [1.5, 2.5, 3.5], "volume": [10, 20, 30], "ts": ts},
+                      index=pd.date_range("2024-01-02", periods=3, freq="D").as_unit("ns"))
+    pub = transports(r, codec=codec)
+    sub = transports(r, consumer="c1")
+    got = []
+    sub.subscribe("bars", got.append)
+    pub.publish("bars", df)
+    pub.flush()
+    assert wait_for(lambda: got)
+    pd.testing.assert_frame_equal(got[0], df, check_freq=False)
+    (_, replayed), = pub.replay("bars")
+    pd.testing.assert_frame_equal(replayed, df, check_freq=False)
+    assert wait_for(lambda: pending(r, "bars") == 0)
+
+def test_consumers_in_a_group_split_the_stream(r, transports):
+    pub = transports(r)
+    for i in range(400):
+        pub.publish("ev", i)
+    pub.flush()
+    got = {"c1": [], "c2": []}
+    lock = threading.Lock()
+    def handler(name):
+        def handle(i):
+            time.sleep(0.001)  # slow enough that the other consumer reads meanwhile
+            with lock:
+                got[name].append(i)
+        return handle
+    transports(r, consumer="c1").subscribe("ev", handler("c1"))
+    transports(r, consumer="c2").subscribe("ev", handler("c2"))
+    assert wait_for(lambda: len(got["c1"]) + len(got["c2"]) == 400)
+    assert got["c1"] and got["c2"]
+    assert sorted(got["c1"] + got["c2"]) == list(range(400))
+    assert wait_for(lambda: pending(r, "ev") == 0)
+
+def test_entries_of_a_crashed_consumer_are_claimed(r, transports):
+    pub = transports(r)
+    pub.r.xgroup_create("ev", "workers", id="0", mkstream=True)
+    for i in range(250):
+        pub.publish("ev", i)
+    pub.flush()
+    # "dead" reads everything and dies before acking
+    r.xreadgroup("workers", "dead", {"ev": ">"}, count=1000)
+    assert pending(r, "ev") == 250
+    time.sleep(0.06)
+    got = []
+    sub = transports(r, consumer="alive", claim_idle_ms=50)
+    sub.subscribe("ev", got.append)
+    assert wait_for(lambda: len(got) == 250)
+    assert sorted(got) == list(range(250))
+    assert wait_for(lambda: pending(r, "ev") == 0)
+    assert sub.get_stats()["claimed"] == 250
+
+def test_poison_entry_moves_to_dead_letter_stream(r, transports):
+    pub = transports(r)
+    pub.publish("ev", {"poison": True})
+    pub.publish("ev", {"poison": False})
+    pub.flush()
+    calls = []
+    def handler(event):
+        calls.append(event)
+        if event["poison"]:
+            raise ValueError("cannot handle")
+    sub = transports(r, consumer="c1", claim_idle_ms=20, max_deliveries=2)
+    sub.subscribe("ev", handler)
+    assert wait_for(lambda: r.xlen("ev:dead") == 1)
+    assert wait_for(lambda: pending(r, "ev") == 0)
+    (dead_id, fields), = r.xrange("ev:dead")
+    (first_id, _), _ = r.xrange("ev")
+    assert fields[b"id"] == first_id
+    assert int(fields[b"deliveries"]) == 3
+    assert sub.replay("ev:dead")[0][1] == {"poison": True}
+    assert calls.count({"poison": False}) == 1
+    assert sub.get_stats()["dead_lettered"] == 1
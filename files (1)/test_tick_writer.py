@@ -0,0 +1,124 @@
+import json
+import sqlite3
+import pytest
+from db_timescale import TickWriter
+
+@pytest.fixture
+def db(tmp_path):
+    # Same schema TickWriter.sqlite() creates, plus a CHECK so bad rows exist
+    path = str(tmp_path / "ticks.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE ticks (symbol TEXT, ts TEXT, price REAL, volume REAL CHECK (volume >= 0))")
+    conn.commit()
+    conn.close()
+    return path
+
+def make_writer(db, tmp_path, **kwargs):
+    return TickWriter.sqlite(db, spill_path=str(tmp_path / "ticks.spill"), **kwargs)
+
+def rows_in(db):
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT symbol, ts, price, volume FROM ticks ORDER BY rowid").fetchall()
+    conn.close()
+    return rows
+
+def lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def db_down(w, monkeypatch, after=0):
+    # The DB fails (connection-level, not a row error) once `after` inserts succeeded
+    insert = w._insert
+    calls = {"n": 0}
+    def failing(cur, rows):
+        calls["n"] += 1
+        if calls["n"] > after:
+            raise sqlite3.OperationalError("database is down")
+        return insert(cur, rows)
+    monkeypatch.setattr(w, "_insert", failing)
+
+def db_up(w, monkeypatch):
+    monkeypatch.undo()
+    w._retry_at = 0.0  # skip the reconnect backoff
+
+def test_flush_writes_batches(db, tmp_path):
+    w = make_writer(db, tmp_path, batch_size=2)
+    for i in range(5):
+        w.write("AAPL", f"t{i}", 100.0 + i, 1.0)
+    assert w.flush() == 5
+    assert rows_in(db) == [("AAPL", f"t{i}", 100.0 + i, 1.0) for i in range(5)]
+    assert w.get_stats()["flushes"] == 3
+
+def test_spill_while_db_down_then_replay_before_new_rows(db, tmp_path, monkeypatch):
+    w = make_writer(db, tmp_path, batch_size=2)
+    db_down(w, monkeypatch)
+    for i in range(3):
+        w.write("AAPL", f"t{i}", 100.0 + i, 1.0)
+    # The failed batch is spilled; the rest stays buffered behind it
+    assert w.flush() == 0
+    assert lines(w.spill_path) == [["AAPL", f"t{i}", 100.0 + i, 1.0] for i in range(2)]
+    assert w.get_stats()["rows_spilled"] == 2
+    assert w.get_stats()["buffered"] == 1
+
+    db_up(w, monkeypatch)
+    w.write("AAPL", "t3", 103.0, 1.0)
+    assert w.flush() == 2
+    assert rows_in(db) == [("AAPL", f"t{i}", 100.0 + i, 1.0) for i in range(4)]
+    assert not (tmp_path / "ticks.spill").exists()
+    assert w.get_stats()["rows_replayed"] == 2
+
+def test_spill_survives_restart(db, tmp_path, monkeypatch):
+    w = make_writer(db, tmp_path)
+    db_down(w, monkeypatch)
+    w.write("AAPL", "t0", 100.0, 1.0)
+    w.close()
+    monkeypatch.undo()
+    w = make_writer(db, tmp_path)
+    assert w.flush() == 0
+    assert rows_in(db) == [("AAPL", "t0", 100.0, 1.0)]
+    assert w.get_stats()["rows_replayed"] == 1
+
+def test_rejected_rows_are_bisected_out(db, tmp_path):
+    w = make_writer(db, tmp_path, batch_size=8)
+    for i in range(8):
+        w.write("AAPL", f"t{i}", 100.0 + i, -1.0 if i in (2, 5) else 1.0)
+    assert w.flush() == 6
+    assert [r[1] for r in rows_in(db)] == ["t0", "t1", "t3", "t4", "t6", "t7"]
+    dead = lines(w.dead_letter_path)
+    assert [d["row"][1] for d in dead] == ["t2", "t5"]
+    assert all("IntegrityError" in d["error"] for d in dead)
+    assert w.get_stats()["rows_rejected"] == 2
+    assert not (tmp_path / "ticks.spill").exists()
+
+def test_replay_rejects_bad_and_torn_lines(db, tmp_path):
+    w = make_writer(db, tmp_path)
+    with open(w.spill_path, "w") as f:
+        f.write(json.dumps(["AAPL", "t0", 100.0, 1.0]) + "\n")
+        f.write(json.dumps(["AAPL", "t1", 101.0, -1.0]) + "\n")
+        f.write('["AAPL", "t2", 10')  # torn by a crash mid-write
+    assert w.flush() == 0
+    assert rows_in(db) == [("AAPL", "t0", 100.0, 1.0)]
+    assert len(lines(w.dead_letter_path)) == 2
+    stats = w.get_stats()
+    assert stats["rows_replayed"] == 1
+    assert stats["rows_rejected"] == 2
+    assert not (tmp_path / "ticks.spill").exists()
+
+def test_replay_failure_keeps_only_unwritten_rows(db, tmp_path, monkeypatch):
+    w = make_writer(db, tmp_path, batch_size=2)
+    with open(w.spill_path, "w") as f:
+        for i in range(5):
+            f.write(json.dumps(["AAPL", f"t{i}", 100.0 + i, 1.0]) + "\n")
+    # First batch commits, the second hits a dead DB: the spill file is rewritten
+    # to the rows not yet written, and nothing is replayed twice
+    db_down(w, monkeypatch, after=1)
+    w.write("AAPL", "t5", 105.0, 1.0)
+    assert w.flush() == 0
+    assert [r[1] for r in rows_in(db)] == ["t0", "t1"]
+    assert [row[1] for row in lines(w.spill_path)] == ["t2", "t3", "t4"]
+    assert not (tmp_path / "ticks.spill.tmp").exists()
+
+    db_up(w, monkeypatch)
+    assert w.flush() == 1
+    assert [r[1] for r in rows_in(db)] == [f"t{i}" for i in range(6)]
+    assert w.get_stats()["rows_replayed"] == 5
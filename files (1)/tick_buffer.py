@@ -0,0 +1,172 @@
+import threading
+import numpy as np
+import pandas as pd
+
+class ColumnarTickBuffer:
+    # Ticks stored column-wise (ts ms, price, volume, symbol id) in preallocated
+    # arrays that grow by `chunk` rows. Live rows are [start, end); eviction only
+    # moves `start`, and compaction/growth allocate new arrays, so slices handed
+    # out by window() are never written to afterwards and can be zero-copy views.
+    # An out-of-order tick clears `sorted` (windows then use masks) until eviction
+    # has dropped the tick before it: _break is the index of the last row older
+    # than its predecessor.
+    def __init__(self, chunk=65_536, max_ticks=None, max_age_s=None):
+        self.chunk = chunk
+        self.max_ticks = max_ticks
+        self.max_age_ms = None if max_age_s is None else int(max_age_s * 1000)
+        self.ts = np.empty(chunk, dtype=np.int64)
+        self.price = np.empty(chunk, dtype=np.float64)
+        self.volume = np.empty(chunk, dtype=np.float64)
+        self.sym = np.empty(chunk, dtype=np.int32)
+        self.start = 0
+        self.end = 0
+        self.sorted = True
+        self._break = 0
+        self.symbols = []
+        self._sym_ids = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.end - self.start
+
+    def symbol_id(self, symbol):
+        sid = self._sym_ids.get(symbol)
+        if sid is None:
+            sid = self._sym_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return sid
+
+    def _reserve(self, n):
+        if self.end + n <= len(self.ts):
+            return
+        live = self.end - self.start
+        cap = ((live + n) // self.chunk + 1) * self.chunk
+        for name in ("ts", "price", "volume", "sym"):
+            old = getattr(self, name)
+            new = np.empty(cap, dtype=old.dtype)
+            new[:live] = old[self.start:self.end]
+            setattr(self, name, new)
+        self._break = max(0, self._break - self.start)
+        self.start, self.end = 0, live
+
+    def append(self, symbol, ts, price, volume):
+        with self._lock:
+            self._reserve(1)
+            i = self.end
+            ts = int(ts)
+            if i > self.start and ts < self.ts[i - 1]:
+                self.sorted = False
+                self._break = i
+            self.ts[i] = ts
+            self.price[i] = price
+            self.volume[i] = volume
+            self.sym[i] = self.symbol_id(symbol)
+            self.end = i + 1
+            self._evict()
+
+    def append_tick(self, tick):
+        # TickPipeline shape: {'s','p','v','t'(ms)}
+        self.append(tick['s'], tick['t'], float(tick['p']), float(tick.get('v', 0) or 0))
+
+    def extend(self, symbols, ts, price, volume):
+        ts = np.asarray(ts, dtype=np.int64)
+        n = len(ts)
+        if n == 0:
+            return
+        with self._lock:
+            ids = np.array([self.symbol_id(s) for s in symbols], dtype=np.int32) if not np.isscalar(symbols) \
+                else np.full(n, self.symbol_id(symbols), dtype=np.int32)
+            self._reserve(n)
+            i = self.end
+            down = np.flatnonzero(np.diff(ts) < 0)
+            if len(down):
+                self.sorted = False
+                self._break = i + int(down[-1]) + 1
+            elif i > self.start and ts[0] < self.ts[i - 1]:
+                self.sorted = False
+                self._break = i
+            self.ts[i:i + n] = ts
+            self.price[i:i + n] = price
+            self.volume[i:i + n] = volume
+            self.sym[i:i + n] = ids
+            self.end = i + n
+            self._evict()
+
+    def _evict(self):
+        if self.max_ticks is not None and self.end - self.start > self.max_ticks:
+            self.start = self.end - self.max_ticks
+        if self.max_age_ms is not None and self.end > self.start:
+            cutoff = self.ts[self.end - 1] - self.max_age_ms
+            if self.ts[self.start] < cutoff:
+                if self.sorted:
+                    self.start += int(np.searchsorted(self.ts[self.start:self.end], cutoff))
+                else:
+                    keep = np.flatnonzero(self.ts[self.start:self.end] >= cutoff)
+                    self.start += int(keep[0]) if len(keep) else self.end - self.start
+        if not self.sorted and self.start >= self._break:
+            self.sorted = True
+        # Drop dead space once it is more than half of the arrays
+        if self.start > len(self.ts) // 2:
+            self._reserve(len(self.ts))
+
+    def _bounds(self, start_ts, end_ts):
+        ts = self.ts[self.start:self.end]
+        lo = 0 if start_ts is None else int(np.searchsorted(ts, start_ts, 'left'))
+        hi = len(ts) if end_ts is None else int(np.searchsorted(ts, end_ts, 'left'))
+        return self.start + lo, self.start + hi
+
+    def arrays(self, start_ts=None, end_ts=None, symbol=None):
+        # Column arrays for [start_ts, end_ts) in ms; views unless filtering needs a mask
+        with self._lock:
+            if self.sorted:
+                lo, hi = self._bounds(start_ts, end_ts)
+                cols = {"ts": self.ts[lo:hi], "price": self.price[lo:hi],
+                        "volume": self.volume[lo:hi], "sym": self.sym[lo:hi]}
+                mask = None
+            else:
+                sl = slice(self.start, self.end)
+                cols = {"ts": self.ts[sl], "price": self.price[sl], "volume": self.volume[sl], "sym": self.sym[sl]}
+                mask = np.ones(len(cols["ts"]), dtype=bool)
+                if start_ts is not None:
+                    mask &= cols["ts"] >= start_ts
+                if end_ts is not None:
+                    mask &= cols["ts"] < end_ts
+            if symbol is not None:
+                sid = self._sym_ids.get(symbol, -1)
+                sym_mask = cols["sym"] == sid
+                mask = sym_mask if mask is None else mask & sym_mask
+            if mask is not None:
+                cols = {k: v[mask] for k, v in cols.items()}
+            return cols, list(self.symbols)
+
+    def window(self, start_ts=None, end_ts=None, symbol=None):
+        cols, symbols = self.arrays(start_ts, end_ts, symbol)
+        return pd.DataFrame({
+            "ts": cols["ts"],
+            "price": cols["price"],
+            "volume": cols["volume"],
+            "symbol": pd.Categorical.from_codes(cols["sym"], categories=symbols) if symbols else cols["sym"],
+        }, copy=False)
+
+    def ohlcv(self, freq_s, symbol, start_ts=None, end_ts=None):
+        # Downsample one symbol's ticks into bars of freq_s seconds
+        cols, _ = self.arrays(start_ts, end_ts, symbol)
+        ts, price, volume = cols["ts"], cols["price"], cols["volume"]
+        if len(ts) == 0:
+            return pd.DataFrame(columns=["Open", "High", "Low", "Close", "Volume"])
+        if not self.sorted:
+            order = np.argsort(ts, kind="stable")
+            ts, price, volume = ts[order], price[order], volume[order]
+        bucket = ts // (int(freq_s * 1000))
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        ends = np.r_[starts[1:], len(ts)] - 1
+        return pd.DataFrame({
+            "Open": price[starts],
+            "High": np.maximum.reduceat(price, starts),
+            "Low": np.minimum.reduceat(price, starts),
+            "Close": price[ends],
+            "Volume": np.add.reduceat(volume, starts),
+        }, index=pd.to_datetime(bucket[starts] * int(freq_s * 1000), unit="ms"))
+
+    def nbytes(self):
+        return self.ts.nbytes + self.price.nbytes + self.volume.nbytes + self.sym.nbytes
@@ -0,0 +1,179 @@
+import json
+import asyncio
+import logging
+import redis
+from async_data_streamer import BoundedTickQueue
+from async_utils import Backoff
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ALL = "*"
+
+def encode(tick, fmt):
+    if fmt == "msgpack":
+        return msgpack.packb(tick, use_bin_type=True)
+    return json.dumps(tick)
+
+class HubClient:
+    def __init__(self, websocket, fmt, maxsize):
+        self.websocket = websocket
+        self.fmt = fmt
+        self.symbols = set()
+        self.queue = BoundedTickQueue(maxsize, 'latest')
+        self.sent = 0
+
+class TickHub:
+    # One upstream subscription per process fanned out to every websocket client.
+    # Clients subscribe to symbols (or ALL); each has its own bounded queue holding
+    # at most one pending tick per symbol, so a client that falls behind skips
+    # straight to the latest price instead of replaying stale ones. A tick
+    # is encoded once per wire format, however many clients receive it.
+    def __init__(self, client_queue_size=256):
+        self.client_queue_size = client_queue_size
+        self.clients = set()
+        self._by_symbol = {}
+        self._tasks = []
+        self.stats = {"published": 0, "delivered": 0, "disconnects": 0, "coalesced": 0, "dropped": 0, "bad_frames": 0, "bad_ticks": 0}
+
+    def publish(self, tick):
+        # Event-loop thread only
+        self.stats["published"] += 1
+        sym = tick.get('s')
+        targets = self._by_symbol.get(sym)
+        wildcard = self._by_symbol.get(ALL)
+        if wildcard:
+            targets = targets | wildcard if targets else wildcard
+        if not targets:
+            return
+        frames = {}
+        for client in targets:
+            frame = frames.get(client.fmt)
+            if frame is None:
+                frame = frames[client.fmt] = {'s': sym, 'd': encode(tick, client.fmt)}
+            client.queue.put(frame)
+
+    def subscribe(self, client, symbols):
+        for sym in symbols:
+            client.symbols.add(sym)
+            self._by_symbol.setdefault(sym, set()).add(client)
+
+    def unsubscribe(self, client, symbols=None):
+        for sym in list(client.symbols if symbols is None else symbols):
+            client.symbols.discard(sym)
+            subs = self._by_symbol.get(sym)
+            if subs is not None:
+                subs.discard(client)
+                if not subs:
+                    del self._by_symbol[sym]
+
+    async def _sender(self, client):
+        ws = client.websocket
+        while True:
+            frame = await client.queue.get()
+            if client.fmt == "msgpack":
+                await ws.send_bytes(frame['d'])
+            else:
+                await ws.send_text(frame['d'])
+            client.sent += 1
+            self.stats["delivered"] += 1
+
+    async def serve(self, websocket, symbols=None, fmt="json"):
+        # Websocket endpoint body. Control messages (JSON text):
+        #   {"op": "subscribe" | "unsubscribe", "symbols": ["AAPL", ...]}
+        if fmt == "msgpack" and msgpack is None:
+            fmt = "json"
+        await websocket.accept()
+        client = HubClient(websocket, fmt, self.client_queue_size)
+        self.clients.add(client)
+        self.subscribe(client, symbols or [])
+        sender = asyncio.ensure_future(self._sender(client))
+        receiver = asyncio.ensure_future(self._receive(client))
+        try:
+            await asyncio.wait([sender, receiver], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sender.cancel()
+            receiver.cancel()
+            await asyncio.gather(sender, receiver, return_exceptions=True)
+            self.unsubscribe(client)
+            self.clients.discard(client)
+            self.stats["disconnects"] += 1
+            self.stats["coalesced"] += client.queue.coalesced
+            self.stats["dropped"] += client.queue.dropped
+
+    async def _receive(self, client):
+        while True:
+            msg = await client.websocket.receive()
+            if msg.get("type") == "websocket.disconnect":
+                return
+            try:
+                ctl = json.loads(msg.get("text") or msg.get("bytes") or "{}")
+            except ValueError:
+                ctl = None
+            # Valid JSON is not necessarily a control object ([...], "AAPL", 1);
+            # malformed frames are counted and ignored, the connection stays up
+            if isinstance(ctl, dict):
+                symbols = ctl.get("symbols")
+                if isinstance(symbols, str):
+                    symbols = [symbols]
+                if symbols is not None and not (isinstance(symbols, list) and all(isinstance(x, str) for x in symbols)):
+                    ctl = None
+            if not isinstance(ctl, dict):
+                self.stats["bad_frames"] += 1
+                continue
+            if ctl.get("op") == "subscribe":
+                self.subscribe(client, symbols or [])
+            elif ctl.get("op") == "unsubscribe":
+                self.unsubscribe(client, symbols)
+
+    # --- upstream feeds ---
+    async def run_redis(self, redis_client, channel="ticks", backoff=(0.5, 30.0)):
+        # redis.asyncio client; producers PUBLISH JSON ticks on `channel`
+        backoff = Backoff(*backoff)
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(channel)
+                backoff.reset()
+                async for m in pubsub.listen():
+                    if m.get("type") != "message":
+                        continue
+                    # A bad payload is skipped: resubscribing would lose every tick
+                    # published meanwhile (pub/sub does not buffer)
+                    try:
+                        self.publish(json.loads(m["data"]))
+                    except (ValueError, AttributeError, TypeError) as e:
+                        self.stats["bad_ticks"] += 1
+                        logging.warning(f"Tick hub skipped bad tick on {channel}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except (redis.RedisError, ConnectionError) as e:
+                logging.warning(f"Tick hub Redis feed error: {e}")
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await backoff.sleep()
+
+    def start_redis(self, redis_client, channel="ticks"):
+        self._tasks.append(asyncio.ensure_future(self.run_redis(redis_client, channel)))
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def get_stats(self):
+        out = dict(self.stats)
+        out["clients"] = len(self.clients)
+        out["symbols"] = len(self._by_symbol)
+        out["coalesced"] += sum(c.queue.coalesced for c in self.clients)
+        out["dropped"] += sum(c.queue.dropped for c in self.clients)
+        return out
+
+def parse_symbols(symbols):
+    # "AAPL,MSFT" or "*" from the query string
+    return [s.strip() for s in (symbols or "").split(",") if s.strip()]